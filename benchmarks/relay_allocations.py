@@ -0,0 +1,104 @@
+"""
+Compares the memory the tunnel allocates while relaying, with and without
+a buffer pool. Both variants are measured the same way: the throughput
+in an untraced run, then in a run traced by tracemalloc the peak of the
+traced memory, the memory blocks still allocated at the end
+(sys.getallocatedblocks()) and the gen0 garbage collections.
+
+python benchmarks/relay_allocations.py [--size-mb 256] [--backend asyncio]
+"""
+import argparse
+import gc
+import struct
+import sys
+import time
+import tracemalloc
+
+import anyio
+import anyio.abc
+
+from tiny_proxy import Socks5ProxyHandler, BufferPool
+
+CHUNK = b'x' * 65536
+
+
+async def relay(handler: Socks5ProxyHandler, size: int) -> float:
+    done = anyio.Event()
+
+    async def sink(stream: anyio.abc.SocketStream):
+        async with stream:
+            try:
+                while True:
+                    await stream.receive()
+            except (anyio.EndOfStream, anyio.BrokenResourceError):
+                done.set()
+
+    async with anyio.create_task_group() as tg:
+        sink_listener = await anyio.create_tcp_listener(local_host='127.0.0.1', local_port=0)
+        sink_port = sink_listener.extra(anyio.abc.SocketAttribute.local_port)
+        tg.start_soon(sink_listener.serve, sink)
+
+        proxy_listener = await anyio.create_tcp_listener(local_host='127.0.0.1', local_port=0)
+        proxy_port = proxy_listener.extra(anyio.abc.SocketAttribute.local_port)
+        tg.start_soon(proxy_listener.serve, handler.handle)
+
+        client = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        await client.send(b'\x05\x01\x00')
+        await client.receive()
+        await client.send(b'\x05\x01\x00\x01\x7f\x00\x00\x01' + struct.pack('>H', sink_port))
+        await client.receive()
+
+        started = time.perf_counter()
+        for _ in range(size // len(CHUNK)):
+            await client.send(CHUNK)
+        await client.aclose()
+        await done.wait()
+        elapsed = time.perf_counter() - started
+
+        tg.cancel_scope.cancel()
+
+    return elapsed
+
+
+async def measure(name: str, create_handler, size_mb: int):
+    size = size_mb * 1024 * 1024
+    elapsed = await relay(create_handler(), size)
+
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    gc_before = gc.get_stats()[0]['collections']
+    tracemalloc.start()
+    try:
+        await relay(create_handler(), size)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    gc_runs = gc.get_stats()[0]['collections'] - gc_before
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks_before
+
+    print(
+        f'{name:15} {size_mb / elapsed:8.1f} MB/s, {peak / 1024:8.1f} KiB peak traced, '
+        f'{blocks:6} blocks left, {gc_runs:4} gen0 collections'
+    )
+
+
+async def run(size_mb: int):
+    await measure('receive():', Socks5ProxyHandler, size_mb)
+    await measure(
+        'receive_into():',
+        lambda: Socks5ProxyHandler(buffer_pool=BufferPool()),
+        size_mb,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--backend', default='asyncio')
+    args = parser.parse_args()
+    anyio.run(run, args.size_mb, backend=args.backend)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,34 @@
-import functools
 import logging
 import ssl
 import sys
 import time
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 
 import anyio
 import yaml
-from anyio import create_tcp_listener, get_cancelled_exc_class, create_task_group
-from anyio.streams.tls import TLSListener
 
-from tiny_proxy import HttpProxyHandler, Socks4ProxyHandler, Socks5ProxyHandler
+from tiny_proxy import (
+    AccessList,
+    AutoProxyHandler,
+    ChainConnector,
+    Connector,
+    Endpoint,
+    FileAuthenticator,
+    HttpProxyHandler,
+    MultiProcessServer,
+    Router,
+    Socks4ProxyHandler,
+    Socks5ProxyHandler,
+    Timeouts,
+    TimerWheel,
+    serve_endpoints,
+)
 
 CLS_MAP = {
     'http': HttpProxyHandler,
     'socks4': Socks4ProxyHandler,
     'socks5': Socks5ProxyHandler,
+    'auto': AutoProxyHandler,
 }
 
 logger = logging.getLogger(__name__)
@@ -39,13 +52,28 @@ def load_settings(file_name='./settings.yml') -> dict:
         return yaml.safe_load(f)
 
 
-async def serve(
+def create_router(rules: List[str], routes: dict, default: str = 'direct') -> Router:
+    # a route goes through upstream proxies or from a source address
+    connectors = {
+        name: ChainConnector(route['upstream'])
+        if 'upstream' in route
+        else Connector(local_host=route['source'])
+        for name, route in routes.items()
+    }
+    return Router(rules, connectors, default)
+
+
+def create_endpoint(
     proxy_type: str,
     host: str,
     port: int,
     ssl_cert: Optional[Tuple[str, str]] = None,
+    users_file: Optional[str] = None,
+    upstream: Optional[List[str]] = None,
+    acl: Optional[dict] = None,
+    routing: Optional[dict] = None,
     **kwargs,
-):
+) -> Endpoint:
     handler_cls = CLS_MAP.get(proxy_type)
     if not handler_cls:
         raise RuntimeError(f'Unsupported proxy type: {proxy_type}')
@@ -56,34 +84,39 @@ async def serve(
     else:
         ssl_context = None
 
-    logger.info(f'Starting {proxy_type} proxy on {host}:{port}...')
+    if users_file is not None:
+        kwargs['authenticator'] = FileAuthenticator(users_file)
 
-    handler = handler_cls(**kwargs)
+    if upstream:
+        kwargs['connector'] = ChainConnector(upstream)
 
-    try:
-        listener = await create_tcp_listener(local_host=host, local_port=port)
-        if ssl_context is not None:
-            listener = TLSListener(listener=listener, ssl_context=ssl_context)
+    if routing is not None:
+        kwargs['connector'] = create_router(**routing)
 
-        async with listener:
-            await listener.serve(handler.handle)
-    except get_cancelled_exc_class():  # noqa
-        pass
+    if acl is not None:
+        kwargs['acl'] = AccessList(**acl)
 
+    logger.info(f'Starting {proxy_type} proxy on {host}:{port}...')
 
-async def start_server(configs: list[dict]):
-    async with create_task_group() as tg:
-        for cfg in configs:
-            tg.start_soon(functools.partial(serve, **cfg))
+    return Endpoint(handler_cls(**kwargs), host, port, ssl_context)
 
 
 def main():
     configure_logging()
     settings = load_settings()
-    try:
-        anyio.run(start_server, settings['proxies'])
-    except (KeyboardInterrupt, SystemExit):
-        pass
+    # all the handlers of a process share one timer wheel
+    timeouts = Timeouts(**(settings.get('timeouts') or {}))
+    timer_wheel = TimerWheel()
+    endpoints = [
+        create_endpoint(timeouts=timeouts, timer_wheel=timer_wheel, **cfg)
+        for cfg in settings['proxies']
+    ]
+    workers = settings.get('workers', 1)
+
+    if workers > 1:
+        MultiProcessServer(endpoints, workers=workers).run()
+    else:
+        anyio.run(serve_endpoints, endpoints)
 
 
 if __name__ == '__main__':
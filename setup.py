@@ -37,6 +37,10 @@ setup(
         'tiny_proxy',
         'tiny_proxy._proxy',
         'tiny_proxy._handlers',
+        'tiny_proxy._parsers',
+        'tiny_proxy._dns',
+        'tiny_proxy._metrics',
+        'tiny_proxy._auth',
     ],
     keywords='socks socks5 socks4 http proxy server asyncio trio anyio',
     install_requires=[
@@ -1,6 +1,7 @@
 TEST_HTTP_HOST_IPV4 = '127.0.0.1'
 TEST_HTTP_PORT_IPV4 = 8881
 TEST_HTTP_URL_IPV4 = f'http://{TEST_HTTP_HOST_IPV4}:{TEST_HTTP_PORT_IPV4}/'
+TEST_HTTP_URL_LOCALHOST = f'http://localhost:{TEST_HTTP_PORT_IPV4}/'
 
 TEST_HTTPS_HOST_IPV4 = '127.0.0.1'
 TEST_HTTPS_PORT_IPV4 = 8882
@@ -24,6 +25,17 @@ SOCKS4_PROXY_PORT_NO_AUTH = 7783
 HTTP_PROXY_PORT = 7784
 HTTP_PROXY_PORT_NO_AUTH = 7785
 
+SOCKS5_PROXY_PORT_SPLICE = 7786
+HTTP_PROXY_PORT_SPLICE = 7787
+
+SOCKS5_PROXY_PORT_POOLED = 7788
+SOCKS5_PROXY_PORT_ASYNCIO_RELAY = 7789
+SOCKS5_PROXY_PORT_DNS_CACHE = 7790
+SOCKS5_PROXY_PORT_METRICS = 7791
+METRICS_PORT = 7792
+
+AUTO_PROXY_PORT = 7793
+
 SOCKS5_PROXY_URL = 'socks5://{username}:{password}@{host}:{port}'.format(
     host=PROXY_HOST,
     port=SOCKS5_PROXY_PORT,
@@ -59,3 +71,41 @@ HTTP_PROXY_URL_NO_AUTH = 'http://{host}:{port}'.format(
     host=PROXY_HOST,
     port=HTTP_PROXY_PORT_NO_AUTH,
 )
+
+SOCKS5_PROXY_URL_SPLICE = 'socks5://{host}:{port}'.format(
+    host=PROXY_HOST,
+    port=SOCKS5_PROXY_PORT_SPLICE,
+)
+
+HTTP_PROXY_URL_SPLICE = 'http://{host}:{port}'.format(
+    host=PROXY_HOST,
+    port=HTTP_PROXY_PORT_SPLICE,
+)
+
+SOCKS5_PROXY_URL_POOLED = 'socks5://{host}:{port}'.format(
+    host=PROXY_HOST,
+    port=SOCKS5_PROXY_PORT_POOLED,
+)
+
+SOCKS5_PROXY_URL_ASYNCIO_RELAY = 'socks5://{host}:{port}'.format(
+    host=PROXY_HOST,
+    port=SOCKS5_PROXY_PORT_ASYNCIO_RELAY,
+)
+
+SOCKS5_PROXY_URL_DNS_CACHE = 'socks5://{host}:{port}'.format(
+    host=PROXY_HOST,
+    port=SOCKS5_PROXY_PORT_DNS_CACHE,
+)
+
+SOCKS5_PROXY_URL_METRICS = 'socks5://{username}:{password}@{host}:{port}'.format(
+    host=PROXY_HOST,
+    port=SOCKS5_PROXY_PORT_METRICS,
+    username=PROXY_USERNAME,
+    password=PROXY_PASSWORD,
+)
+
+METRICS_URL = f'http://{PROXY_HOST}:{METRICS_PORT}/metrics'
+
+AUTO_PROXY_URLS = tuple(
+    f'{scheme}://{PROXY_HOST}:{AUTO_PROXY_PORT}' for scheme in ('socks5', 'socks4', 'http')
+)
@@ -15,6 +15,14 @@ from tests.config import (
     SOCKS4_PROXY_PORT_NO_AUTH,
     HTTP_PROXY_PORT,
     HTTP_PROXY_PORT_NO_AUTH,
+    SOCKS5_PROXY_PORT_SPLICE,
+    HTTP_PROXY_PORT_SPLICE,
+    SOCKS5_PROXY_PORT_POOLED,
+    SOCKS5_PROXY_PORT_ASYNCIO_RELAY,
+    SOCKS5_PROXY_PORT_DNS_CACHE,
+    SOCKS5_PROXY_PORT_METRICS,
+    METRICS_PORT,
+    AUTO_PROXY_PORT,
     TEST_HTTPS_HOST_IPV4,
     TEST_HTTPS_PORT_IPV4,
     TEST_HTTPS_HOST_IPV6,
@@ -153,12 +161,57 @@ def proxy_server():
             host=PROXY_HOST,
             port=HTTP_PROXY_PORT_NO_AUTH,
         ),
+        ProxyConfig(
+            proxy_type='socks5',
+            host=PROXY_HOST,
+            port=SOCKS5_PROXY_PORT_SPLICE,
+            splice=True,
+        ),
+        ProxyConfig(
+            proxy_type='http',
+            host=PROXY_HOST,
+            port=HTTP_PROXY_PORT_SPLICE,
+            splice=True,
+        ),
+        ProxyConfig(
+            proxy_type='socks5',
+            host=PROXY_HOST,
+            port=SOCKS5_PROXY_PORT_POOLED,
+            pooled_buffers=True,
+        ),
+        ProxyConfig(
+            proxy_type='socks5',
+            host=PROXY_HOST,
+            port=SOCKS5_PROXY_PORT_ASYNCIO_RELAY,
+            asyncio_relay=True,
+        ),
+        ProxyConfig(
+            proxy_type='socks5',
+            host=PROXY_HOST,
+            port=SOCKS5_PROXY_PORT_DNS_CACHE,
+            dns_cache=True,
+        ),
+        ProxyConfig(
+            proxy_type='socks5',
+            host=PROXY_HOST,
+            port=SOCKS5_PROXY_PORT_METRICS,
+            username=PROXY_USERNAME,
+            password=PROXY_PASSWORD,
+            metrics_port=METRICS_PORT,
+        ),
+        ProxyConfig(
+            proxy_type='auto',
+            host=PROXY_HOST,
+            port=AUTO_PROXY_PORT,
+        ),
     ]
 
     server = ProxyServerRunner(config=config)
     server.run()
     for cfg in config:
         wait_until_connectable(host=cfg.host, port=cfg.port)
+        if cfg.metrics_port:
+            wait_until_connectable(host=cfg.host, port=cfg.metrics_port)
 
     yield None
 
@@ -9,7 +9,17 @@ from anyio import create_tcp_listener
 from anyio.streams.tls import TLSListener
 
 from tests.utils import cancel_all_tasks, cancel_tasks, wait_until_connectable
-from tiny_proxy import HttpProxyHandler, Socks5ProxyHandler, Socks4ProxyHandler
+from tiny_proxy import (
+    AutoProxyHandler,
+    HttpProxyHandler,
+    Socks5ProxyHandler,
+    Socks4ProxyHandler,
+    BufferPool,
+    CachingResolver,
+    Connector,
+    ProxyMetrics,
+    serve_metrics,
+)
 
 
 class ProxyConfig(typing.NamedTuple):
@@ -20,6 +30,11 @@ class ProxyConfig(typing.NamedTuple):
     password: typing.Optional[str] = None
     ssl_certfile: typing.Optional[str] = None
     ssl_keyfile: typing.Optional[str] = None
+    splice: typing.Optional[bool] = None
+    pooled_buffers: typing.Optional[bool] = None
+    asyncio_relay: typing.Optional[bool] = None
+    dns_cache: typing.Optional[bool] = None
+    metrics_port: typing.Optional[int] = None
 
     def to_dict(self):
         d = {}
@@ -34,6 +49,7 @@ class ProxyServer:
         'http': HttpProxyHandler,
         'socks4': Socks4ProxyHandler,
         'socks5': Socks5ProxyHandler,
+        'auto': AutoProxyHandler,
     }
 
     def __init__(self, config: typing.Iterable[ProxyConfig], loop: asyncio.AbstractEventLoop):
@@ -79,6 +95,9 @@ class ProxyServer:
         port,
         ssl_certfile=None,
         ssl_keyfile=None,
+        pooled_buffers=False,
+        dns_cache=False,
+        metrics_port=None,
         **kwargs,
     ):
         handler_cls = self.cls_map.get(proxy_type)
@@ -93,6 +112,18 @@ class ProxyServer:
 
         print(f'Starting {proxy_type} proxy on {host}:{port}...')
 
+        if pooled_buffers:
+            kwargs['buffer_pool'] = BufferPool()
+
+        if dns_cache:
+            kwargs['connector'] = Connector(resolver=CachingResolver())
+
+        if metrics_port:
+            metrics = kwargs['metrics'] = ProxyMetrics()
+            self.server_tasks.append(
+                self.loop.create_task(serve_metrics(metrics.registry, host, metrics_port))
+            )
+
         handler = handler_cls(**kwargs)
 
         listener = await create_tcp_listener(local_host=host, local_port=port)
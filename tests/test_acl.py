@@ -0,0 +1,192 @@
+import time
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import (
+    AccessList,
+    AccessRule,
+    HttpProxyHandler,
+    Socks4ProxyHandler,
+    Socks5ProxyHandler,
+)
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+def test_rule_parse():
+    assert AccessRule.parse('allow *.example.com 80,8000-8999') == AccessRule(
+        'allow', '*.example.com', ((80, 80), (8000, 8999))
+    )
+    assert AccessRule.parse('deny 10.0.0.0/8') == AccessRule('deny', '10.0.0.0/8')
+    for rule in ('reject example.com', 'deny', 'deny example.com 70000', 'deny a b c d'):
+        with pytest.raises(ValueError):
+            AccessRule.parse(rule)
+    with pytest.raises(ValueError):
+        AccessList(['deny api.*.example.com'])
+
+
+def test_networks():
+    acl = AccessList(['allow 10.1.0.0/16', 'deny 10.0.0.0/8', 'deny fc00::/7', 'deny 192.0.2.1'])
+    assert acl.allows('10.1.2.3', 80)
+    assert not acl.allows('10.2.3.4', 80)
+    assert not acl.allows('fd00::1', 80)
+    assert not acl.allows('::ffff:10.2.3.4', 80)
+    assert not acl.allows('192.0.2.1', 80)
+    assert acl.allows('192.0.2.2', 80)
+    assert acl.allows('8.8.8.8', 53)
+
+
+def test_domains():
+    acl = AccessList(
+        [
+            'allow ok.example.com',
+            'deny *.example.com',
+            'deny .example.org',
+            'deny example.net',
+        ]
+    )
+    assert acl.allows('ok.example.com', 443)
+    assert not acl.allows('www.Example.com.', 443)
+    assert not acl.allows('a.b.example.com', 443)
+    assert acl.allows('example.com', 443)
+    assert not acl.allows('example.org', 443)
+    assert not acl.allows('www.example.org', 443)
+    assert not acl.allows('example.net', 443)
+    assert acl.allows('www.example.net', 443)
+    assert acl.allows('com', 443)
+
+
+def test_ports_users_and_default():
+    acl = AccessList(
+        ['allow * 80,443', 'allow .example.com 8000-8999'],
+        users={'admin': ['allow *'], 'guest': ['deny * 443']},
+        default='deny',
+    )
+    assert acl.allows('example.org', 443)
+    assert not acl.allows('example.org', 22)
+    assert acl.allows('www.example.com', 8080)
+    assert not acl.allows('www.example.com', 9000)
+    assert acl.allows('example.org', 22, 'admin')
+    assert not acl.allows('example.org', 443, 'guest')
+    # no matching rule of the user - the common ones apply
+    assert acl.allows('example.org', 80, 'guest')
+
+
+def test_many_rules():
+    rules = [f'deny 10.{i >> 8}.{i & 255}.0/24' for i in range(50000)]
+    rules += [f'deny .host{i}.example.com' for i in range(50000)]
+    acl = AccessList(rules)
+
+    started = time.monotonic()
+    for _ in range(1000):
+        assert not acl.allows('10.100.200.1', 443)
+        assert not acl.allows('www.host49999.example.com', 443)
+        assert acl.allows('www.example.com', 443)
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_denials():
+    acl = AccessList(['deny 127.0.0.0/8'])
+    handlers = (
+        Socks5ProxyHandler(acl=acl),
+        Socks4ProxyHandler(acl=acl),
+        HttpProxyHandler(acl=acl, forward=True),
+    )
+
+    with anyio.fail_after(5):
+        async with serve(handlers[0].handle) as socks5_port, serve(
+            handlers[1].handle
+        ) as socks4_port, serve(handlers[2].handle) as http_port:
+            async with await anyio.connect_tcp('127.0.0.1', socks5_port) as stream:
+                await stream.send(b'\x05\x01\x00')
+                assert await stream.receive() == b'\x05\x00'
+                await stream.send(b'\x05\x01\x00\x01\x7f\x00\x00\x01\x00\x50')
+                assert (await stream.receive())[:2] == b'\x05\x02'
+
+            async with await anyio.connect_tcp('127.0.0.1', socks4_port) as stream:
+                await stream.send(b'\x04\x01\x00\x50\x7f\x00\x00\x01\x00')
+                assert (await stream.receive())[:2] == b'\x00\x5b'
+
+            for request in (
+                b'CONNECT 127.0.0.1:80 HTTP/1.1\r\n\r\n',
+                b'GET http://127.0.0.1/ HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n',
+            ):
+                async with await anyio.connect_tcp('127.0.0.1', http_port) as stream:
+                    await stream.send(request)
+                    assert (await stream.receive()).startswith(b'HTTP/1.1 403')
+
+
+def test_resolved_addresses():
+    acl = AccessList(
+        ['deny 10.0.0.0/8', 'allow example.com', 'deny *'],
+        users={'admin': ['allow *']},
+    )
+    assert not acl.allows('example.com', 80, address='10.0.0.1')
+    assert acl.allows('example.com', 80, address='93.184.216.34')
+    # the first matching rule applies, as the name or the address
+    assert not AccessList(['allow example.com', 'deny 10.0.0.0/8']).allows(
+        'example.org', 80, address='10.0.0.1'
+    )
+    assert AccessList(['allow example.com', 'deny 10.0.0.0/8']).allows(
+        'example.com', 80, address='10.0.0.1'
+    )
+    assert acl.allows('example.org', 80, 'admin', address='10.0.0.1')
+
+
+@pytest.mark.asyncio
+async def test_denied_resolved_addresses():
+    # a name doesn't get around the network rules
+    acl = AccessList(['deny 127.0.0.0/8', 'deny ::1'])
+    handlers = (Socks5ProxyHandler(acl=acl), HttpProxyHandler(acl=acl, forward=True))
+
+    with anyio.fail_after(5):
+        async with serve(handlers[0].handle) as socks5_port, serve(
+            handlers[1].handle
+        ) as http_port:
+            async with await anyio.connect_tcp('127.0.0.1', socks5_port) as stream:
+                await stream.send(b'\x05\x01\x00')
+                assert await stream.receive() == b'\x05\x00'
+                await stream.send(b'\x05\x01\x00\x03\x09localhost\x00\x50')
+                assert (await stream.receive())[:2] == b'\x05\x02'
+
+            for request in (
+                b'CONNECT localhost:80 HTTP/1.1\r\n\r\n',
+                b'GET http://localhost/ HTTP/1.1\r\nHost: localhost\r\n\r\n',
+            ):
+                async with await anyio.connect_tcp('127.0.0.1', http_port) as stream:
+                    await stream.send(request)
+                    assert (await stream.receive()).startswith(b'HTTP/1.1 403')
+
+
+@pytest.mark.asyncio
+async def test_socks4_user_id_not_trusted():
+    acl = AccessList(['deny 127.0.0.0/8'], users={'admin': ['allow *']})
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+    request = b'\x04\x01' + port.to_bytes(2, 'big') + b'\x7f\x00\x00\x01admin\x00'
+
+    with anyio.fail_after(5):
+        async with listener, serve(Socks4ProxyHandler(acl=acl).handle) as open_port, serve(
+            Socks4ProxyHandler(username='admin', acl=acl).handle
+        ) as auth_port:
+            # without a configured username, a user id is just a claim
+            async with await anyio.connect_tcp('127.0.0.1', open_port) as stream:
+                await stream.send(request)
+                assert (await stream.receive())[:2] == b'\x00\x5b'
+
+            async with await anyio.connect_tcp('127.0.0.1', auth_port) as stream:
+                await stream.send(request)
+                assert (await stream.receive())[:2] == b'\x00\x5a'
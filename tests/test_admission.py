@@ -0,0 +1,148 @@
+import struct
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import (
+    AdmissionController,
+    AdmissionLimits,
+    HttpProxyHandler,
+    MetricsRegistry,
+    Socks5ProxyHandler,
+)
+from tiny_proxy._admission import Limiter
+from tiny_proxy._errors import AdmissionRejected
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+async def echo(stream):
+    async with stream:
+        try:
+            while True:
+                await stream.send(await stream.receive())
+        except (anyio.EndOfStream, anyio.BrokenResourceError):
+            pass
+
+
+async def socks5_request(proxy_port: int, port: int):
+    stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+    await stream.send(b'\x05\x01\x00')
+    assert await stream.receive() == b'\x05\x00'
+    await stream.send(b'\x05\x01\x00\x01\x7f\x00\x00\x01' + struct.pack('>H', port))
+    reply = await stream.receive()
+    return stream, reply[:2]
+
+
+@pytest.mark.asyncio
+async def test_limiter_queue():
+    limiter = Limiter(1, queue_size=1, queue_timeout=5)
+    await limiter.acquire()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(limiter.acquire)
+        await anyio.wait_all_tasks_blocked()
+        assert limiter.queued == 1
+
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()  # the queue is full
+
+        limiter.release()  # the slot goes to the waiter
+    assert (limiter.active, limiter.queued, limiter.rejected) == (1, 0, 1)
+
+    limiter.release()
+    assert limiter.idle
+
+
+@pytest.mark.asyncio
+async def test_limiter_queue_timeout():
+    limiter = Limiter(1, queue_size=1, queue_timeout=0.05)
+    await limiter.acquire()
+    with pytest.raises(AdmissionRejected):
+        await limiter.acquire()
+    assert (limiter.active, limiter.queued, limiter.rejected) == (1, 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_socks5_tunnels_limit():
+    registry = MetricsRegistry()
+    admission = AdmissionController(AdmissionLimits(tunnels=1))
+    admission.bind_metrics(registry)
+    handler = Socks5ProxyHandler(admission=admission)
+
+    with anyio.fail_after(10):
+        async with serve(echo) as echo_port, serve(handler.handle) as proxy_port:
+            first, reply = await socks5_request(proxy_port, echo_port)
+            assert reply == b'\x05\x00'
+
+            second, reply = await socks5_request(proxy_port, echo_port)
+            assert reply == b'\x05\x01'  # general failure
+            await second.aclose()
+
+            exposition = registry.expose()
+            assert 'tiny_proxy_admission_active{limit="tunnels"} 1' in exposition
+            assert 'tiny_proxy_admission_rejected_total{limit="tunnels"} 1' in exposition
+
+            await first.aclose()
+            while admission.tunnels.active:
+                await anyio.sleep(0.01)
+            third, reply = await socks5_request(proxy_port, echo_port)
+            assert reply == b'\x05\x00'
+            await third.aclose()
+
+
+@pytest.mark.asyncio
+async def test_socks5_queued_tunnel():
+    admission = AdmissionController(AdmissionLimits(tunnels=1, queue_size=1, queue_timeout=5))
+    handler = Socks5ProxyHandler(admission=admission)
+
+    with anyio.fail_after(10):
+        async with serve(echo) as echo_port, serve(handler.handle) as proxy_port:
+            first, reply = await socks5_request(proxy_port, echo_port)
+            assert reply == b'\x05\x00'
+
+            async def close_first():
+                while not admission.tunnels.queued:
+                    await anyio.sleep(0.01)
+                await first.aclose()
+
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(close_first)
+                second, reply = await socks5_request(proxy_port, echo_port)
+            assert reply == b'\x05\x00'
+            await second.aclose()
+
+
+@pytest.mark.asyncio
+async def test_http_per_destination_limit():
+    admission = AdmissionController(AdmissionLimits(per_destination=1))
+    handler = HttpProxyHandler(admission=admission)
+
+    async def connect(proxy_port: int, port: int):
+        stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        await stream.send(f'CONNECT 127.0.0.1:{port} HTTP/1.1\r\n\r\n'.encode())
+        return stream, await stream.receive()
+
+    with anyio.fail_after(10):
+        async with serve(echo) as echo_port, serve(handler.handle) as proxy_port:
+            first, response = await connect(proxy_port, echo_port)
+            assert response.startswith(b'HTTP/1.1 200')
+
+            second, response = await connect(proxy_port, echo_port)
+            assert response.startswith(b'HTTP/1.1 503')
+            await second.aclose()
+            await first.aclose()
+
+            while admission.destinations:
+                await anyio.sleep(0.01)
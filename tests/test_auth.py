@@ -0,0 +1,131 @@
+import struct
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import (
+    FileAuthenticator,
+    Socks5ProxyHandler,
+    StaticAuthenticator,
+    hash_password,
+    verify_password,
+)
+from tiny_proxy._auth import file as file_auth
+from tiny_proxy._auth.file import parse_users
+
+
+def _hash(password: str) -> str:
+    return hash_password(password, iterations=1000)
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+@pytest.fixture
+def users_file(tmp_path):
+    path = tmp_path / 'users'
+    path.write_text(f'# comment\n\nalice:{_hash("secret")}\nbob:{_hash("hunter2")}\n')
+    return path
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    calls = []
+
+    def verify(password, encoded):
+        calls.append(password)
+        return verify_password(password, encoded)
+
+    monkeypatch.setattr(file_auth, 'verify_password', verify)
+    return calls
+
+
+@pytest.mark.parametrize('scheme', ('pbkdf2_sha256', 'scrypt'))
+def test_password_hashing(scheme):
+    encoded = hash_password('secret', scheme=scheme, iterations=1000)
+    assert encoded.startswith(scheme + '$')
+    assert verify_password('secret', encoded)
+    assert not verify_password('Secret', encoded)
+
+    with pytest.raises(ValueError):
+        verify_password('secret', 'md5$abc')
+
+
+def test_parse_users_errors():
+    with pytest.raises(ValueError, match='Line 2'):
+        parse_users(f'alice:{_hash("secret")}\nbob\n')
+    with pytest.raises(ValueError, match='Line 1'):
+        parse_users('alice:pbkdf2_sha256$x$salt$hash\n')
+
+
+@pytest.mark.asyncio
+async def test_static_authenticator():
+    authenticator = StaticAuthenticator('user', 'password')
+    assert await authenticator.authenticate('user', 'password')
+    assert not await authenticator.authenticate('user', 'passwore')
+    assert not await authenticator.authenticate('usex', 'password')
+
+
+@pytest.mark.asyncio
+async def test_file_authenticator(users_file, verifications):
+    authenticator = FileAuthenticator(str(users_file), cache_size=1)
+    assert len(authenticator) == 2
+
+    assert await authenticator.authenticate('alice', 'secret')
+    assert await authenticator.authenticate('alice', 'secret')  # cached
+    assert verifications == ['secret']
+
+    assert not await authenticator.authenticate('alice', 'wrong')
+    assert not await authenticator.authenticate('carol', 'secret')  # unknown, still verified
+    assert len(verifications) == 3
+
+    assert await authenticator.authenticate('bob', 'hunter2')  # evicts alice
+    assert await authenticator.authenticate('alice', 'secret')
+    assert len(verifications) == 5
+
+
+@pytest.mark.asyncio
+async def test_file_authenticator_reload(users_file, verifications):
+    authenticator = FileAuthenticator(str(users_file))
+    assert await authenticator.authenticate('alice', 'secret')
+
+    users_file.write_text(f'alice:{_hash("changed")}\n')
+    await authenticator.reload()
+    assert not await authenticator.authenticate('alice', 'secret')  # the cache is stale
+    assert await authenticator.authenticate('alice', 'changed')
+    assert not await authenticator.authenticate('bob', 'hunter2')
+
+    users_file.write_text('broken\n')
+    with pytest.raises(ValueError):
+        await authenticator.reload()
+    assert await authenticator.authenticate('alice', 'changed')
+
+
+@pytest.mark.asyncio
+async def test_socks5_file_authenticator(users_file):
+    handler = Socks5ProxyHandler(authenticator=FileAuthenticator(str(users_file)))
+
+    async def authenticate(proxy_port: int, username: bytes, password: bytes) -> bytes:
+        stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        async with stream:
+            await stream.send(b'\x05\x01\x02')
+            assert await stream.receive() == b'\x05\x02'
+            await stream.send(
+                struct.pack('BB', 1, len(username)) + username + bytes([len(password)]) + password
+            )
+            return await stream.receive()
+
+    with anyio.fail_after(10):
+        async with serve(handler.handle) as proxy_port:
+            assert await authenticate(proxy_port, b'bob', b'hunter2') == b'\x01\x00'
+            assert await authenticate(proxy_port, b'bob', b'secret') == b'\x01\xff'
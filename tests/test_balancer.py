@@ -0,0 +1,151 @@
+import errno
+import time
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import BalancingConnector, ChainConnector, Connector
+
+
+class FakeConnector(Connector):
+    def __init__(self, echo_port: int, delay: float = 0.0, error: OSError = None):
+        super().__init__()
+        self.echo_port = echo_port
+        self.delay = delay
+        self.error = error
+
+    async def connect(self, host, port, address_filter=None):
+        await anyio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return await super().connect('127.0.0.1', self.echo_port, address_filter)
+
+
+@asynccontextmanager
+async def echo_server():
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async def echo(stream):
+        async with stream:
+            try:
+                while True:
+                    await stream.send(await stream.receive())
+            except (anyio.EndOfStream, anyio.BrokenResourceError):
+                pass
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, echo)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+def test_round_robin():
+    balancer = BalancingConnector([Connector(), Connector()], policy='round_robin')
+    assert [balancer.select(0).name for _ in range(3)] == ['path #0', 'path #1', 'path #0']
+
+
+def test_least_active():
+    balancer = BalancingConnector([Connector(), Connector()], policy='least_active')
+    balancer.targets[0].active = 2
+    assert balancer.select(0) is balancer.targets[1]
+
+
+def test_ewma():
+    balancer = BalancingConnector([Connector(), Connector()])
+    fast, slow = balancer.targets
+    balancer.record(fast, 0.01, None, 0)
+    balancer.record(slow, 0.5, None, 0)
+    assert balancer.select(0) is fast
+
+    # a degrading path loses its traffic, the load is taken into account
+    balancer.record(fast, 2.0, None, 0)
+    assert balancer.select(0) is slow
+    slow.active = 10
+    assert balancer.select(0) is fast
+
+
+def test_ejection_and_slow_start():
+    balancer = BalancingConnector(
+        [Connector(), Connector()],
+        policy='round_robin',
+        max_failures=2,
+        ejection_time=10,
+        slow_start=10,
+    )
+    bad, good = balancer.targets
+    timeout = TimeoutError(errno.ETIMEDOUT, 'timed out')
+
+    # destination failures don't count
+    for _ in range(3):
+        balancer.record(bad, 0.1, ConnectionRefusedError(errno.ECONNREFUSED, 'refused'), 0)
+    assert not bad.is_ejected(0)
+
+    balancer.record(bad, 1.0, timeout, 0)
+    balancer.record(bad, 1.0, timeout, 0)
+    assert bad.is_ejected(5)
+    assert {balancer.select(5).name for _ in range(4)} == {'path #1'}
+
+    # re-admitted with a growing share
+    assert not bad.is_ejected(10)
+    assert bad.weight(12.5, 10) == 0.25
+    assert bad.weight(20, 10) == 1.0
+
+    # a failure on probation ejects again, for twice as long
+    balancer.record(bad, 1.0, timeout, 11)
+    assert bad.is_ejected(30) and not bad.is_ejected(31)
+
+    # all ejected - all used
+    balancer.record(good, 1.0, timeout, 11)
+    balancer.record(good, 1.0, timeout, 11)
+    assert balancer.select(15) in balancer.targets
+
+
+@pytest.mark.asyncio
+async def test_balancing_connector():
+    async with echo_server() as port:
+        broken = FakeConnector(port, error=TimeoutError(errno.ETIMEDOUT, 'timed out'))
+        balancer = BalancingConnector(
+            [broken, FakeConnector(port, delay=0.01)], policy='least_active', max_failures=1
+        )
+        with pytest.raises(TimeoutError):
+            await balancer.connect('example.com', 80)
+        assert balancer.targets[0].is_ejected(time.monotonic())
+
+        stream = await balancer.connect('example.com', 80)
+        assert balancer.targets[1].active == 1
+        await stream.send(b'ping')
+        assert await stream.receive() == b'ping'
+        await stream.aclose()
+        assert balancer.targets[1].active == 0
+
+
+@pytest.mark.asyncio
+async def test_dead_upstream_proxy():
+    probe = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    closed_port = probe.extra(anyio.abc.SocketAttribute.local_port)
+    await probe.aclose()
+
+    async with echo_server() as port:
+        dead = ChainConnector([f'socks5://127.0.0.1:{closed_port}'], connect_timeout=1)
+        balancer = BalancingConnector([dead, Connector()], policy='round_robin', max_failures=1)
+        with pytest.raises(ConnectionRefusedError):
+            await balancer.connect('127.0.0.1', port)
+
+        # the refusing upstream proxy is the path's failure, not the destination's
+        dead_target = balancer.targets[0]
+        assert dead_target.is_ejected(time.monotonic())
+        assert dead_target.ewma == 1
+
+        for _ in range(2):
+            stream = await balancer.connect('127.0.0.1', port)
+            await stream.send(b'ping')
+            assert await stream.receive() == b'ping'
+            await stream.aclose()
+
+        # a refusing destination isn't
+        with pytest.raises(ConnectionRefusedError):
+            await balancer.connect('127.0.0.1', closed_port)
+        assert balancer.targets[1].failures == 0
@@ -0,0 +1,161 @@
+import struct
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import (
+    AbstractResolver,
+    BindPool,
+    ResolveResult,
+    Socks4ProxyHandler,
+    Socks5ProxyHandler,
+)
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+async def check_bind(stream, port: int, second_reply_size: int):
+    # the inbound connection is relayed to the client
+    async with await anyio.connect_tcp('127.0.0.1', port) as inbound:
+        reply = await stream.receive()
+        assert len(reply) == second_reply_size
+        await inbound.send(b'hello')
+        assert await stream.receive() == b'hello'
+        await stream.send(b'world')
+        assert await inbound.receive() == b'world'
+    await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_socks5_bind():
+    pool = BindPool(host='127.0.0.1', size=1)
+    await pool.fill()
+    assert pool.idle == 1
+
+    async with serve(Socks5ProxyHandler(bind_pool=pool).handle) as proxy_port:
+        for _ in range(2):
+            stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+            await stream.send(b'\x05\x01\x00')
+            assert await stream.receive() == b'\x05\x00'
+            await stream.send(b'\x05\x02\x00\x01\x7f\x00\x00\x01\x00\x00')
+            reply = await stream.receive()
+            assert reply[:8] == b'\x05\x00\x00\x01\x7f\x00\x00\x01'
+            port = struct.unpack('>H', reply[8:10])[0]
+
+            with anyio.fail_after(5):
+                await check_bind(stream, port, 10)
+
+    # the listener went back to the pool
+    assert pool.idle == 1
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_socks4_bind_port_range():
+    probe = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    free_port = probe.extra(anyio.abc.SocketAttribute.local_port)
+    await probe.aclose()
+
+    pool = BindPool(host='127.0.0.1', ports=[free_port])
+    async with serve(Socks4ProxyHandler(bind_pool=pool).handle) as proxy_port:
+        stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        await stream.send(b'\x04\x02\x00\x00\x7f\x00\x00\x01\x00')
+        reply = await stream.receive()
+        assert reply == b'\x00\x5a' + struct.pack('>H', free_port) + b'\x7f\x00\x00\x01'
+
+        with anyio.fail_after(5):
+            await check_bind(stream, free_port, 8)
+
+
+@pytest.mark.asyncio
+async def test_bind_accept_timeout():
+    pool = BindPool(host='127.0.0.1', accept_timeout=0.1)
+    async with serve(Socks5ProxyHandler(bind_pool=pool).handle) as proxy_port:
+        stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        await stream.send(b'\x05\x01\x00')
+        assert await stream.receive() == b'\x05\x00'
+        await stream.send(b'\x05\x02\x00\x01\x00\x00\x00\x00\x00\x00')
+        assert (await stream.receive())[:2] == b'\x05\x00'
+        with anyio.fail_after(5):
+            assert (await stream.receive())[:2] == b'\x05\x06'  # TTL expired
+        await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bind_disabled():
+    async with serve(Socks5ProxyHandler().handle) as proxy_port:
+        stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        await stream.send(b'\x05\x01\x00')
+        assert await stream.receive() == b'\x05\x00'
+        await stream.send(b'\x05\x02\x00\x01\x7f\x00\x00\x01\x00\x00')
+        assert (await stream.receive())[:2] == b'\x05\x07'
+        await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bind_pool_drops_stale_connections():
+    pool = BindPool(host='127.0.0.1', size=1, accept_timeout=5)
+    listener = await pool.acquire()
+    port = pool.address(listener, '127.0.0.1')[1]
+    await pool.release(listener)
+
+    # connected to the idle listener, before any client asked for it
+    stale = await anyio.connect_tcp('127.0.0.1', port)
+    await stale.send(b'stale')
+
+    listener = await pool.acquire()
+    assert pool.address(listener, '127.0.0.1')[1] == port
+    async with await anyio.connect_tcp('127.0.0.1', port) as fresh:
+        await fresh.send(b'fresh')
+        with anyio.fail_after(5):
+            async with await pool.accept(listener) as inbound:
+                assert await inbound.receive() == b'fresh'
+
+    await stale.aclose()
+    await pool.release(listener)
+    await pool.aclose()
+
+
+class FakeResolver(AbstractResolver):
+    async def resolve(self, host):
+        return ResolveResult(addresses=('127.0.0.2',))
+
+
+@pytest.mark.asyncio
+async def test_bind_peer_name():
+    pool = BindPool(host='127.0.0.1', accept_timeout=5)
+    listener = await pool.acquire()
+    port = pool.address(listener, '127.0.0.1')[1]
+
+    async with anyio.create_task_group() as tg:
+        accepted = []
+
+        async def accept():
+            accepted.append(await pool.accept(listener, 'peer.example.com', FakeResolver()))
+
+        tg.start_soon(accept)
+        with anyio.fail_after(5):
+            # not an address of the name
+            async with await anyio.connect_tcp('127.0.0.1', port) as other:
+                with pytest.raises((anyio.EndOfStream, anyio.BrokenResourceError)):
+                    await other.receive()
+
+            async with await anyio.connect_tcp('127.0.0.1', port, local_host='127.0.0.2'):
+                while not accepted:
+                    await anyio.sleep(0.01)
+
+    assert accepted[0].extra(anyio.abc.SocketAttribute.remote_address)[0] == '127.0.0.2'
+    await accepted[0].aclose()
+    await pool.release(listener)
+    await pool.aclose()
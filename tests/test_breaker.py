@@ -0,0 +1,119 @@
+import errno
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import ChainConnector, CircuitBreaker, Connector, HttpProxyHandler
+
+
+class CountingConnector(Connector):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attempts = 0
+
+    async def open_connection(self, address: str, port: int):
+        self.attempts += 1
+        return await super().open_connection(address, port)
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_circuit_opens_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, open_time=0.05, half_open_probes=1)
+    refused = ConnectionRefusedError(errno.ECONNREFUSED, 'Connection refused')
+
+    for _ in range(2):
+        with pytest.raises(ConnectionRefusedError):
+            with breaker.guard('example.com', 80):
+                raise refused
+    assert breaker.state('example.com', 80) == 'open'
+    assert breaker.states() == {('example.com', 80): 'open'}
+    assert breaker.state('example.com', 443) == 'closed'
+
+    # fails fast with the same kind of error
+    with pytest.raises(ConnectionRefusedError) as exc_info:
+        with breaker.guard('example.com', 80):
+            pytest.fail('The connect must not be attempted')
+    assert exc_info.value.errno == errno.ECONNREFUSED
+
+    # half-open: one probe at a time
+    breaker._circuits['example.com', 80].open_until = 0
+    assert breaker.state('example.com', 80) == 'half_open'
+    with breaker.guard('example.com', 80):
+        with pytest.raises(ConnectionRefusedError):
+            with breaker.guard('example.com', 80):
+                pass
+    assert breaker.state('example.com', 80) == 'closed'
+    assert len(breaker) == 0
+
+
+def test_failed_probe_reopens_for_longer():
+    breaker = CircuitBreaker(failure_threshold=1, open_time=1, max_open_time=3)
+    timeout = TimeoutError(errno.ETIMEDOUT, 'timed out')
+    for duration in (1, 2, 3, 3):
+        with pytest.raises(TimeoutError):
+            with breaker.guard('example.com', 80):
+                raise timeout
+        circuit = breaker._circuits['example.com', 80]
+        assert duration - 0.5 < circuit.open_until - time.monotonic() <= duration
+        circuit.open_until = 0
+
+
+def test_max_destinations():
+    breaker = CircuitBreaker(max_destinations=2)
+    for port in (1, 2, 3):
+        with pytest.raises(OSError):
+            with breaker.guard('example.com', port):
+                raise OSError(errno.EHOSTUNREACH, 'No route to host')
+    assert set(breaker.states()) == {('example.com', 2), ('example.com', 3)}
+
+
+@pytest.mark.asyncio
+async def test_proxy_fails_fast():
+    port = closed_port()
+    connector = CountingConnector(circuit_breaker=CircuitBreaker(failure_threshold=2))
+    handler = HttpProxyHandler(connector=connector)
+
+    with anyio.fail_after(5):
+        async with serve(handler.handle) as proxy_port:
+            for _ in range(4):
+                async with await anyio.connect_tcp('127.0.0.1', proxy_port) as stream:
+                    await stream.send(f'CONNECT 127.0.0.1:{port} HTTP/1.1\r\n\r\n'.encode())
+                    assert (await stream.receive()).startswith(b'HTTP/1.1 502')
+
+    assert connector.attempts == 2
+    assert connector.circuit_breaker.state('127.0.0.1', port) == 'open'
+
+
+@pytest.mark.asyncio
+async def test_upstream_failures_not_recorded():
+    breaker = CircuitBreaker(failure_threshold=1)
+    connector = ChainConnector([f'socks5://127.0.0.1:{closed_port()}'], circuit_breaker=breaker)
+
+    with anyio.fail_after(5):
+        for _ in range(2):
+            # the proxy is down, not the destination
+            with pytest.raises(ConnectionRefusedError):
+                await connector.connect('example.com', 80)
+
+    assert breaker.state('example.com', 80) == 'closed'
+    assert len(breaker) == 0
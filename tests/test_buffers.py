@@ -0,0 +1,73 @@
+import anyio
+import anyio.abc
+import pytest
+from anyio.streams.stapled import StapledByteStream
+
+from tiny_proxy import BufferPool
+from tiny_proxy._stream import SocketStream
+from tiny_proxy._tunnel import create_tunnel
+
+
+def test_buffer_pool_reuses_buffers():
+    pool = BufferPool(buffer_size=16, slab_buffers=4)
+    assert pool.allocated == 0
+
+    buffer = pool.checkout()
+    assert len(buffer) == 16
+    assert pool.allocated == 4
+    assert pool.available == 3
+
+    pool.checkin(buffer)
+    assert pool.available == 4
+    assert pool.checkouts == 1
+
+    with pool.buffer() as reused:
+        assert reused is buffer
+
+    assert pool.allocated == 4
+
+
+def test_buffer_pool_grows_by_slabs():
+    pool = BufferPool(buffer_size=8, slab_buffers=2, preallocate=3)
+    assert pool.allocated == 4
+
+    buffers = [pool.checkout() for _ in range(5)]
+    assert pool.allocated == 6
+    assert len({id(b) for b in buffers}) == 5
+
+    buffers[0][:] = b'x' * 8
+    assert all(bytes(b) == bytes(8) for b in buffers[1:])
+
+
+async def connected_pair():
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+    async with listener:
+        client = await anyio.connect_tcp('127.0.0.1', port)
+        server = await listener.listeners[0].accept()
+    return client, server
+
+
+@pytest.mark.asyncio
+async def test_pooled_tunnel_without_private_state():
+    pool = BufferPool()
+    client1, server1 = await connected_pair()
+    client2, server2 = await connected_pair()
+    # a stream of no known backend has none of the state raw socket I/O takes over
+    endpoint1 = SocketStream(StapledByteStream(server1, server1))
+    endpoint2 = SocketStream(server2)
+    assert not endpoint1.supports_raw_io
+    assert endpoint2.supports_raw_io
+
+    with anyio.fail_after(5):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(create_tunnel, endpoint1, endpoint2, False, pool)
+            await client1.send(b'ping')
+            assert await client2.receive() == b'ping'
+            await client2.send(b'pong')
+            assert await client1.receive() == b'pong'
+            await client1.aclose()
+            await client2.aclose()
+
+    # relayed with receive()
+    assert pool.checkouts == 0
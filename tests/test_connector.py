@@ -0,0 +1,132 @@
+import errno
+import socket
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import AbstractResolver, Connector, ResolveResult
+from tiny_proxy._connector import interleave_addresses
+from tiny_proxy._proxy.socks5 import ReplyCode, reply_code_for_error
+
+
+class StaticResolver(AbstractResolver):
+    def __init__(self, *addresses, delay=0.0):
+        self.addresses = addresses
+        self.delay = delay
+
+    async def resolve(self, host: str) -> ResolveResult:
+        await anyio.sleep(self.delay)
+        return ResolveResult(addresses=self.addresses)
+
+
+class SlowConnector(Connector):
+    """Connection attempts to the blackholed addresses never complete"""
+
+    def __init__(self, *args, blackholed=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.blackholed = blackholed
+        self.attempts = []
+
+    async def open_connection(self, address: str, port: int):
+        self.attempts.append(address)
+        if address in self.blackholed:
+            await anyio.sleep_forever()
+        return await super().open_connection(address, port)
+
+
+@asynccontextmanager
+async def serve_tcp():
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async def handle(stream):
+        await stream.aclose()
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+def test_interleave_addresses():
+    addresses = ['::1', '::2', '::3', '10.0.0.1', '10.0.0.2']
+    assert interleave_addresses(addresses) == ['::1', '10.0.0.1', '::2', '10.0.0.2', '::3']
+    assert interleave_addresses(['10.0.0.1', '::1', '::2']) == ['10.0.0.1', '::1', '::2']
+
+
+@pytest.mark.asyncio
+async def test_connect_falls_back_after_delay():
+    async with serve_tcp() as listener_port:
+        connector = SlowConnector(
+            resolver=StaticResolver('127.0.0.2', '127.0.0.1'),
+            happy_eyeballs_delay=0.05,
+            blackholed=('127.0.0.2',),
+        )
+
+        with anyio.fail_after(1):
+            stream = await connector.connect('example.com', listener_port)
+        assert stream.getpeername()[0] == '127.0.0.1'
+        await stream.aclose()
+        assert connector.attempts == ['127.0.0.2', '127.0.0.1']
+
+
+@pytest.mark.asyncio
+async def test_connect_failure_starts_next_attempt():
+    async with serve_tcp() as listener_port:
+        # nothing listens on 127.0.0.3, the refusal must not wait for the delay
+        connector = Connector(
+            resolver=StaticResolver('127.0.0.3', '127.0.0.1'),
+            happy_eyeballs_delay=10,
+        )
+
+        with anyio.fail_after(1):
+            stream = await connector.connect('example.com', listener_port)
+        await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_connect_all_attempts_fail():
+    async with serve_tcp() as listener_port:
+        connector = Connector(resolver=StaticResolver('127.0.0.3', '127.0.0.4'))
+
+        with pytest.raises(ConnectionRefusedError):
+            await connector.connect('example.com', listener_port)
+
+        with pytest.raises(ConnectionRefusedError):
+            await connector.connect('127.0.0.3', listener_port)
+
+
+@pytest.mark.asyncio
+async def test_connect_timeout():
+    async with serve_tcp() as listener_port:
+        connector = SlowConnector(
+            resolver=StaticResolver('127.0.0.2', '127.0.0.3'),
+            connect_timeout=0.1,
+            happy_eyeballs_delay=0.02,
+            blackholed=('127.0.0.2', '127.0.0.3'),
+        )
+        with pytest.raises(TimeoutError) as exc_info:
+            await connector.connect('example.com', listener_port)
+        assert exc_info.value.errno == errno.ETIMEDOUT
+
+        # name resolution counts against the timeout as well
+        connector = Connector(resolver=StaticResolver('127.0.0.1', delay=1), connect_timeout=0.1)
+        with pytest.raises(TimeoutError):
+            await connector.connect('example.com', listener_port)
+
+
+@pytest.mark.parametrize(
+    'error, code',
+    (
+        (ConnectionRefusedError(errno.ECONNREFUSED, ''), ReplyCode.CONNECTION_REFUSED),
+        (TimeoutError(errno.ETIMEDOUT, ''), ReplyCode.TTL_EXPIRED),
+        (OSError(errno.ENETUNREACH, ''), ReplyCode.NETWORK_UNREACHABLE),
+        (OSError(errno.EHOSTUNREACH, ''), ReplyCode.HOST_UNREACHABLE),
+        (socket.gaierror(socket.EAI_NONAME, ''), ReplyCode.HOST_UNREACHABLE),
+        (OSError('unknown'), ReplyCode.GENERAL_FAILURE),
+    ),
+)
+def test_socks5_reply_code_for_error(error, code):
+    assert reply_code_for_error(error) == code
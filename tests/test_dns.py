@@ -0,0 +1,328 @@
+import ipaddress
+import socket
+import struct
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+from anyio.streams.buffered import BufferedByteReceiveStream
+
+from tiny_proxy import AbstractResolver, CachingResolver, ResolveResult, StubResolver
+from tiny_proxy._dns.stub import RecordType, parse_hosts, parse_resolv_conf
+
+
+class FakeResolver(AbstractResolver):
+    def __init__(self, ttl=None, delay=0.0):
+        self.ttl = ttl
+        self.delay = delay
+        self.calls = 0
+
+    async def resolve(self, host: str) -> ResolveResult:
+        self.calls += 1
+        await anyio.sleep(self.delay)
+        if host.startswith('missing'):
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        if host.startswith('broken'):
+            raise socket.gaierror(socket.EAI_AGAIN, 'Temporary failure in name resolution')
+        return ResolveResult(addresses=('127.0.0.1',), ttl=self.ttl)
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_and_misses():
+    resolver = FakeResolver()
+    cache = CachingResolver(resolver)
+
+    for _ in range(3):
+        result = await cache.resolve('Example.com')
+        assert result.addresses == ('127.0.0.1',)
+    await cache.resolve('example.com')
+
+    assert resolver.calls == 1
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+@pytest.mark.asyncio
+async def test_cache_ttl():
+    resolver = FakeResolver(ttl=0.05)
+    cache = CachingResolver(resolver)
+
+    await cache.resolve('example.com')
+    await cache.resolve('example.com')
+    assert resolver.calls == 1
+
+    await anyio.sleep(0.1)
+    await cache.resolve('example.com')
+    assert resolver.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_lru():
+    resolver = FakeResolver()
+    cache = CachingResolver(resolver, max_size=2)
+
+    await cache.resolve('a.com')
+    await cache.resolve('b.com')
+    await cache.resolve('a.com')
+    await cache.resolve('c.com')  # evicts b.com
+    assert len(cache) == 2
+
+    await cache.resolve('a.com')
+    assert resolver.calls == 3
+    await cache.resolve('b.com')
+    assert resolver.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_cache_lookup_without_resolving():
+    resolver = FakeResolver(ttl=0.05)
+    cache = CachingResolver(resolver)
+
+    assert cache.cached('example.com') is None
+    await cache.resolve('example.com')
+    assert cache.cached('Example.com').addresses == ('127.0.0.1',)
+    assert resolver.calls == 1
+
+    await anyio.sleep(0.1)
+    assert cache.cached('example.com') is None
+
+
+@pytest.mark.asyncio
+async def test_negative_cache():
+    resolver = FakeResolver()
+    cache = CachingResolver(resolver)
+
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            await cache.resolve('missing.com')
+    assert resolver.calls == 1
+    assert cache.negative_hits == 1
+
+    # temporary failures are not cached
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            await cache.resolve('broken.com')
+    assert resolver.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_are_coalesced():
+    resolver = FakeResolver(delay=0.05)
+    cache = CachingResolver(resolver)
+    results = []
+
+    async def resolve():
+        results.append(await cache.resolve('example.com'))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(10):
+            tg.start_soon(resolve)
+
+    assert len(results) == 10
+    assert resolver.calls == 1
+    assert cache.coalesced == 9
+
+
+def _dns_response(query: bytes, records, truncated=False) -> bytes:
+    query_id = int.from_bytes(query[:2], 'big')
+    offset = 12
+    labels = []
+    while query[offset]:
+        length = query[offset]
+        labels.append(query[offset + 1 : offset + 1 + length].decode())
+        offset += 1 + length
+    question = query[12 : offset + 5]
+    qtype = int.from_bytes(query[offset + 1 : offset + 3], 'big')
+
+    name = '.'.join(labels)
+    if name not in records:
+        return struct.pack('!HHHHHH', query_id, 0x8183, 1, 0, 0, 0) + question
+
+    answers = b''
+    count = 0
+    if not truncated:
+        for address, ttl in records[name]:
+            packed = ipaddress.ip_address(address).packed
+            rtype = RecordType.A if len(packed) == 4 else RecordType.AAAA
+            if rtype == qtype:
+                answers += struct.pack('!HHHIH', 0xC00C, rtype, 1, ttl, len(packed)) + packed
+                count += 1
+
+    flags = 0x8380 if truncated else 0x8180
+    return struct.pack('!HHHHHH', query_id, flags, 1, count, 0, 0) + question + answers
+
+
+@asynccontextmanager
+async def fake_dns_server(records, truncate=False):
+    """Answers A/AAAA queries over UDP and TCP on the same localhost port"""
+    tcp_queries = []
+
+    async def serve_udp(udp):
+        async for query, address in udp:
+            await udp.sendto(_dns_response(query, records, truncate), *address)
+
+    async def serve_tcp(stream):
+        async with stream:
+            buffered = BufferedByteReceiveStream(stream)
+            size = int.from_bytes(await buffered.receive_exactly(2), 'big')
+            query = await buffered.receive_exactly(size)
+            tcp_queries.append(query)
+            response = _dns_response(query, records)
+            await stream.send(len(response).to_bytes(2, 'big') + response)
+
+    # the TCP port is taken first, then the same UDP port, which may be in use too
+    for _ in range(10):
+        listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+        port = listener.extra(anyio.abc.SocketAttribute.local_port)
+        try:
+            udp = await anyio.create_udp_socket(local_host='127.0.0.1', local_port=port)
+        except OSError:
+            await listener.aclose()
+        else:
+            break
+    else:
+        raise RuntimeError('No port free for both TCP and UDP')
+
+    async with udp, listener, anyio.create_task_group() as tg:
+        tg.start_soon(serve_udp, udp)
+        tg.start_soon(listener.serve, serve_tcp)
+        yield port, tcp_queries
+        tg.cancel_scope.cancel()
+
+
+RECORDS = {
+    'example.com': [('93.184.216.34', 300), ('2606:2800:220:1::248', 120)],
+    'ipv4.example.com': [('10.0.0.1', 60), ('10.0.0.2', 30)],
+    'internal.corp.local': [('192.168.1.10', 60)],
+}
+
+
+def _stub_resolver(port, **kwargs):
+    kwargs.setdefault('hosts', {})
+    return StubResolver(nameservers=['127.0.0.1'], port=port, search=(), timeout=1, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_a_and_aaaa():
+    async with fake_dns_server(RECORDS) as (port, _):
+        resolver = _stub_resolver(port)
+
+        result = await resolver.resolve('example.com')
+        assert result.addresses == ('2606:2800:220:1::248', '93.184.216.34')
+        assert result.ttl == 120
+
+        result = await resolver.resolve('ipv4.example.com')
+        assert result.addresses == ('10.0.0.1', '10.0.0.2')
+        assert result.ttl == 30
+
+        result = await _stub_resolver(port, ipv6=False).resolve('example.com')
+        assert result.addresses == ('93.184.216.34',)
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_not_found():
+    async with fake_dns_server(RECORDS) as (port, _):
+        with pytest.raises(socket.gaierror) as exc_info:
+            await _stub_resolver(port).resolve('missing.example.com')
+        assert exc_info.value.errno == socket.EAI_NONAME
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_tcp_fallback():
+    async with fake_dns_server(RECORDS, truncate=True) as (port, tcp_queries):
+        result = await _stub_resolver(port).resolve('example.com')
+        assert result.addresses == ('2606:2800:220:1::248', '93.184.216.34')
+        assert len(tcp_queries) == 2
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_avoids_getaddrinfo(monkeypatch):
+    def getaddrinfo(*args, **kwargs):
+        raise AssertionError('getaddrinfo() called')
+
+    for truncate in (False, True):
+        async with fake_dns_server(RECORDS, truncate=truncate) as (port, _):
+            monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+            result = await _stub_resolver(port).resolve('example.com')
+            assert result.addresses == ('2606:2800:220:1::248', '93.184.216.34')
+            monkeypatch.undo()
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_timeout():
+    # nothing answers on this socket
+    async with await anyio.create_udp_socket(local_host='127.0.0.1') as udp:
+        port = udp.extra(anyio.abc.SocketAttribute.local_port)
+        resolver = StubResolver(
+            nameservers=['127.0.0.1'], port=port, search=(), hosts={}, timeout=0.05, attempts=1
+        )
+        with pytest.raises(socket.gaierror) as exc_info:
+            await resolver.resolve('example.com')
+        assert exc_info.value.errno == socket.EAI_AGAIN
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_search_domains():
+    async with fake_dns_server(RECORDS) as (port, _):
+        resolver = StubResolver(
+            nameservers=['127.0.0.1'], port=port, search=['corp.local'], ndots=1, hosts={}
+        )
+        assert resolver.candidates('internal') == ['internal.corp.local', 'internal']
+        assert resolver.candidates('example.com') == ['example.com', 'example.com.corp.local']
+        assert resolver.candidates('example.com.') == ['example.com']
+
+        result = await resolver.resolve('internal')
+        assert result.addresses == ('192.168.1.10',)
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_reads_config_files(tmp_path):
+    resolv_conf = tmp_path / 'resolv.conf'
+    resolv_conf.write_text(
+        '# generated\nnameserver 127.0.0.1\nsearch corp.local example.com\noptions ndots:2\n'
+    )
+    hosts_file = tmp_path / 'hosts'
+    hosts_file.write_text('127.0.0.1 localhost myhost # comment\n::1 localhost\n')
+
+    resolver = StubResolver(resolv_conf=str(resolv_conf), hosts_file=str(hosts_file))
+    assert resolver.nameservers == ('127.0.0.1',)
+    assert resolver.search == ('corp.local', 'example.com')
+    assert resolver.ndots == 2
+
+    # /etc/hosts entries are answered without any query
+    result = await resolver.resolve('LocalHost')
+    assert result.addresses == ('127.0.0.1', '::1')
+    assert (await resolver.resolve('myhost')).addresses == ('127.0.0.1',)
+
+
+@pytest.mark.asyncio
+async def test_stub_resolver_with_cache():
+    async with fake_dns_server(RECORDS) as (port, _):
+        cache = CachingResolver(_stub_resolver(port))
+        await cache.resolve('example.com')
+        await cache.resolve('example.com')
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_parse_resolv_conf():
+    conf = parse_resolv_conf(
+        'domain old.local\n'
+        'nameserver 10.0.0.53 ; primary\n'
+        'nameserver\n'
+        'nameserver fd00::53\n'
+        'search a.local b.local\n'
+        'options rotate ndots:3 timeout:1\n'
+    )
+    assert conf.nameservers == ('10.0.0.53', 'fd00::53')
+    assert conf.search == ('a.local', 'b.local')
+    assert conf.ndots == 3
+
+
+def test_parse_hosts():
+    hosts = parse_hosts('127.0.0.1 localhost\nbogus line\n10.0.0.1 a A b\nfe80::1%lo0 link\n')
+    assert hosts == {
+        'localhost': ('127.0.0.1',),
+        'a': ('10.0.0.1',),
+        'b': ('10.0.0.1',),
+        'link': ('fe80::1',),
+    }
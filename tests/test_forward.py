@@ -0,0 +1,250 @@
+import base64
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+from anyio.streams.buffered import BufferedByteReceiveStream
+
+from tiny_proxy import AbstractAuthenticator, AccessList, HttpProxyHandler, KeepAlivePool
+from tiny_proxy._parsers.http import parse_request
+
+
+class Origin:
+    """Keep-alive HTTP/1.1 server that records the requests it gets"""
+
+    def __init__(self, requests_per_connection: int = 0):
+        self.connections = 0
+        self.requests = []
+        self.requests_per_connection = requests_per_connection
+
+    async def handle(self, stream):
+        self.connections += 1
+        buffered = BufferedByteReceiveStream(stream)
+        async with stream:
+            try:
+                while True:
+                    head = await buffered.receive_until(b'\r\n\r\n', 65536)
+                    request = parse_request(head + b'\r\n\r\n')
+                    length = int(request.get_header('content-length', '0'))
+                    body = await buffered.receive_exactly(length) if length else b''
+                    self.requests.append((request, body))
+                    await stream.send(self.respond(request, body))
+                    if len(self.requests) == self.requests_per_connection:
+                        # closes the connection it has just offered to keep alive
+                        return
+            except (anyio.EndOfStream, anyio.IncompleteRead, anyio.BrokenResourceError):
+                pass
+
+    def respond(self, request, body: bytes) -> bytes:
+        if request.target == '/chunked':
+            return (
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n'
+            )
+        content = body or request.target.encode()
+        return b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\nKeep-Alive: timeout=5\r\n\r\n%s' % (
+            len(content),
+            content,
+        )
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+async def receive_response(buffered: BufferedByteReceiveStream):
+    head = await buffered.receive_until(b'\r\n\r\n', 65536)
+    lines = head.decode().split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    if headers.get('Transfer-Encoding') == 'chunked':
+        body = await buffered.receive_until(b'\r\n0\r\nX-Trailer: 1\r\n\r\n', 65536)
+    else:
+        body = await buffered.receive_exactly(int(headers.get('Content-Length', 0)))
+    return lines[0], headers, body
+
+
+@pytest.mark.asyncio
+async def test_forward_keep_alive():
+    origin = Origin()
+    pool = KeepAlivePool()
+    handler = HttpProxyHandler(forward=True, keep_alive_pool=pool)
+
+    async with serve(origin.handle) as port, serve(handler.handle) as proxy_port:
+        url = f'http://127.0.0.1:{port}'
+        with anyio.fail_after(5):
+            for _ in range(2):
+                stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+                buffered = BufferedByteReceiveStream(stream)
+                async with stream:
+                    await stream.send(f'GET {url}/a?b=1 HTTP/1.1\r\nHost: x\r\n\r\n'.encode())
+                    status, headers, body = await receive_response(buffered)
+                    assert (status, body) == ('HTTP/1.1 200 OK', b'/a?b=1')
+                    assert headers['Connection'] == 'keep-alive'
+                    assert 'Keep-Alive' not in headers
+
+                    await stream.send(
+                        f'POST {url} HTTP/1.1\r\nContent-Length: 4\r\n'
+                        f'Proxy-Connection: keep-alive\r\n\r\nbody'.encode()
+                    )
+                    assert (await receive_response(buffered))[2] == b'body'
+
+                    await stream.send(f'GET {url}/chunked HTTP/1.1\r\n\r\n'.encode())
+                    status, headers, body = await receive_response(buffered)
+                    assert body == b'5;ext=1\r\nhello\r\n6\r\n world'
+
+    # a single upstream connection served all the requests of both clients
+    assert origin.connections == 1
+    request, _ = origin.requests[0]
+    assert (request.target, request.get_header('host')) == ('/a?b=1', f'127.0.0.1:{port}')
+    assert origin.requests[1][0].get_header('proxy-connection') is None
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_forward_retry_on_closed_upstream():
+    origin = Origin(requests_per_connection=1)
+    handler = HttpProxyHandler(forward=True)
+
+    async with serve(origin.handle) as port, serve(handler.handle) as proxy_port:
+        stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        buffered = BufferedByteReceiveStream(stream)
+        with anyio.fail_after(5):
+            for path in ('/1', '/2'):
+                await stream.send(f'GET http://127.0.0.1:{port}{path} HTTP/1.1\r\n\r\n'.encode())
+                assert (await receive_response(buffered))[2] == path.encode()
+        await stream.aclose()
+
+    assert origin.connections == 2
+
+
+@pytest.mark.asyncio
+async def test_forward_connection_close():
+    origin = Origin()
+    handler = HttpProxyHandler(forward=True, username='user', password='password')
+    credentials = base64.b64encode(b'user:password').decode()
+
+    async with serve(origin.handle) as port, serve(handler.handle) as proxy_port:
+        stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+        buffered = BufferedByteReceiveStream(stream)
+        with anyio.fail_after(5):
+            await stream.send(
+                f'GET http://127.0.0.1:{port}/ HTTP/1.0\r\n'
+                f'Proxy-Authorization: Basic {credentials}\r\n\r\n'.encode()
+            )
+            status, headers, body = await receive_response(buffered)
+            assert headers['Connection'] == 'close'
+            with pytest.raises(anyio.EndOfStream):
+                await buffered.receive()
+
+    # credentials aren't forwarded
+    assert origin.requests[0][0].get_header('proxy-authorization') is None
+
+
+@pytest.mark.asyncio
+async def test_forward_ambiguous_framing():
+    origin = Origin()
+    handler = HttpProxyHandler(forward=True, username='user', password='password')
+    credentials = base64.b64encode(b'user:password').decode()
+
+    async with serve(origin.handle) as port, serve(handler.handle) as proxy_port:
+        url = f'http://127.0.0.1:{port}/'
+        with anyio.fail_after(5):
+            for request, expected in (
+                (
+                    f'POST {url} HTTP/1.1\r\nProxy-Authorization: Basic {credentials}\r\n'
+                    f'Transfer-Encoding: chunked\r\nContent-Length: 5\r\n\r\n0\r\n\r\n',
+                    'HTTP/1.1 400 Bad Request',
+                ),
+                # the end of the body isn't known if chunked isn't the final coding
+                (
+                    f'POST {url} HTTP/1.1\r\nProxy-Authorization: Basic {credentials}\r\n'
+                    f'Transfer-Encoding: chunked, gzip\r\n\r\n0\r\n\r\n',
+                    'HTTP/1.1 400 Bad Request',
+                ),
+                # later requests on the connection must repeat the credentials
+                (
+                    f'GET {url} HTTP/1.1\r\nProxy-Authorization: Basic {credentials}x\r\n\r\n',
+                    'HTTP/1.1 401 Unauthorized',
+                ),
+            ):
+                stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+                buffered = BufferedByteReceiveStream(stream)
+                async with stream:
+                    await stream.send(
+                        f'GET {url} HTTP/1.1\r\n'
+                        f'Proxy-Authorization: Basic {credentials}\r\n\r\n'.encode()
+                    )
+                    assert (await receive_response(buffered))[0] == 'HTTP/1.1 200 OK'
+                    await stream.send(request.encode())
+                    assert (await receive_response(buffered))[0] == expected
+
+    # only the valid requests got to the origin
+    assert len(origin.requests) == 3
+
+
+class AnyPassword(AbstractAuthenticator):
+    async def authenticate(self, username: str, password: str) -> bool:
+        return True
+
+
+@pytest.mark.asyncio
+async def test_pooled_connections_per_user():
+    origin = Origin()
+    pool = KeepAlivePool()
+    acl = AccessList(['deny 127.0.0.0/8', 'deny ::1'], users={'admin': ['allow *']})
+    handler = HttpProxyHandler(
+        forward=True, keep_alive_pool=pool, authenticator=AnyPassword(), acl=acl
+    )
+
+    async with serve(origin.handle) as port, serve(handler.handle) as proxy_port:
+        with anyio.fail_after(5):
+            for user, status in ((b'admin', '200 OK'), (b'guest', '403 Forbidden')):
+                credentials = base64.b64encode(user + b':password').decode()
+                stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+                async with stream:
+                    await stream.send(
+                        f'GET http://localhost:{port}/ HTTP/1.1\r\n'
+                        f'Proxy-Authorization: Basic {credentials}\r\n\r\n'.encode()
+                    )
+                    response = await receive_response(BufferedByteReceiveStream(stream))
+                    assert response[0] == f'HTTP/1.1 {status}'
+
+    # the idle connection of the admin wasn't given to the guest
+    assert len(pool) == 1
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_forward_disabled():
+    async with serve(HttpProxyHandler().handle) as proxy_port:
+        async with await anyio.connect_tcp('127.0.0.1', proxy_port) as stream:
+            await stream.send(b'GET http://127.0.0.1/ HTTP/1.1\r\n\r\n')
+            assert (await stream.receive()).startswith(b'HTTP/1.1 400')
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_pool_limits():
+    class Stream:
+        closed = False
+
+        async def aclose(self):
+            self.closed = True
+
+    pool = KeepAlivePool(max_idle=2, max_idle_per_origin=1)
+    streams = [Stream() for _ in range(3)]
+    await pool.release(('a', 80), streams[0])
+    await pool.release(('a', 80), streams[1])  # over the per-origin limit
+    await pool.release(('b', 80), streams[2])
+    assert streams[0].closed and len(pool) == 2
+
+    pool.idle_timeout = 0
+    assert await pool.acquire(('b', 80)) is None  # expired
+    assert streams[1].closed and streams[2].closed and len(pool) == 0
@@ -0,0 +1,173 @@
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import (
+    BufferPool,
+    Connection,
+    MetricsHandler,
+    MetricsRegistry,
+    ProxyMetrics,
+    SocketStream,
+    TrafficCounter,
+    create_tunnel,
+)
+
+
+def test_registry_exposition():
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests', ('method',))
+    gauge = registry.gauge('active', 'Active "things"')
+    histogram = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+
+    counter.labels('GET').inc()
+    counter.labels('GET').inc(2)
+    counter.labels('a"b\\').inc()
+    gauge.labels().inc(5)
+    gauge.labels().dec()
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.labels().observe(value)
+
+    assert registry.expose().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{method="GET"} 3',
+        'requests_total{method="a\\"b\\\\"} 1',
+        '# HELP active Active \\"things\\"',
+        '# TYPE active gauge',
+        'active 4',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 5.65',
+        'latency_seconds_count 4',
+    ]
+
+
+def test_registry_errors():
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests', ('method',))
+
+    with pytest.raises(ValueError):
+        registry.counter('requests_total', 'Requests')
+    with pytest.raises(ValueError):
+        counter.labels()
+
+
+def test_traffic_is_flushed_on_collect():
+    metrics = ProxyMetrics()
+    connection = Connection([metrics], 'socks5', ('127.0.0.1', 10000))
+    connection.accepted()
+    connection.negotiated('example.com', 443, None)
+    connection.upstream_connected(0.1)
+    traffic = connection.traffic
+    bytes_in = metrics.bytes.labels('socks5', 'in')
+    bytes_out = metrics.bytes.labels('socks5', 'out')
+
+    traffic.add(True, 100)
+    traffic.add(False, 1000)
+    assert bytes_in.value == 0
+
+    metrics.expose()
+    assert (bytes_in.value, bytes_out.value) == (100, 1000)
+
+    traffic.add(True, 10)
+    connection.closed(None)
+    metrics.expose()
+    assert (bytes_in.value, bytes_out.value) == (110, 1000)
+    assert metrics.tunnel_duration.labels('socks5').count == 1
+    assert metrics.active.labels('socks5').value == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_handler():
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests').labels().inc()
+    handler = MetricsHandler(registry)
+
+    async def request(data: bytes) -> bytes:
+        client, server = await _stream_pair()
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(handler.handle, server)
+            await client.send(data)
+            response = b''
+            try:
+                while True:
+                    response += await client.receive()
+            except anyio.EndOfStream:
+                pass
+        await client.aclose()
+        return response
+
+    response = await request(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert response.endswith(b'\r\n\r\n' + registry.expose().encode())
+
+    response = await request(b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    assert response.startswith(b'HTTP/1.1 404 Not Found\r\n')
+
+    response = await request(b'POST /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    assert response.startswith(b'HTTP/1.1 405 Method Not Allowed\r\n')
+
+
+async def _stream_pair():
+    async with await anyio.create_tcp_listener(local_host='127.0.0.1') as listener:
+        port = listener.extra(anyio.abc.SocketAttribute.local_port)
+        client = await anyio.connect_tcp('127.0.0.1', port)
+        server = await listener.listeners[0].accept()
+    return client, server
+
+
+@pytest.mark.parametrize(
+    'options',
+    (
+        {},
+        {'splice': True},
+        {'buffer_pool': BufferPool()},
+        {'asyncio_relay': True},
+    ),
+)
+@pytest.mark.asyncio
+async def test_tunnel_traffic(options):
+    traffic = TrafficCounter()
+    upload = b'x' * 1024 * 1024
+    download = b'y' * 1000
+
+    client, client_side = await _stream_pair()
+    remote_side, remote = await _stream_pair()
+
+    async def run_client():
+        await client.send(upload)
+        received = b''
+        while len(received) < len(download):
+            received += await client.receive()
+        assert received == download
+        await client.aclose()
+
+    async def run_remote():
+        received = b''
+        while len(received) < len(upload):
+            received += await remote.receive()
+        await remote.send(download)
+        try:
+            await remote.receive()
+        except (anyio.EndOfStream, anyio.BrokenResourceError):
+            pass
+        await remote.aclose()
+
+    with anyio.fail_after(10):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(
+                lambda: create_tunnel(
+                    SocketStream(client_side),
+                    SocketStream(remote_side),
+                    traffic=traffic,
+                    **options,
+                )
+            )
+            tg.start_soon(run_client)
+            tg.start_soon(run_remote)
+
+    assert (traffic.upstream, traffic.downstream) == (len(upload), len(download))
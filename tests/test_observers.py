@@ -0,0 +1,119 @@
+import socket
+import struct
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import ProxyObserver, Socks5ProxyHandler, TimingObserver
+
+
+class RecordingObserver(ProxyObserver):
+    chunk_sample_rate = 1
+
+    def __init__(self):
+        self.events = []
+        self.closed = anyio.Event()
+
+    def on_accept(self, connection):
+        self.events.append(('accept',))
+
+    def on_negotiated(self, connection, target, protocol, user):
+        self.events.append(('negotiated', target, protocol, user))
+
+    def on_upstream_connected(self, connection, latency):
+        self.events.append(('connected',))
+
+    def on_chunk_relayed(self, connection, upstream, size):
+        self.events.append(('chunk', upstream, size))
+
+    def on_closed(self, connection, traffic, duration, reason):
+        self.events.append(('closed', traffic.upstream, traffic.downstream, reason))
+        self.closed.set()
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+async def echo(stream):
+    async with stream:
+        await stream.send(await stream.receive())
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def socks5_connect(proxy_port: int, port: int) -> bytes:
+    stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+    async with stream:
+        await stream.send(b'\x05\x01\x02')
+        assert await stream.receive() == b'\x05\x02'
+        await stream.send(b'\x01\x04user\x08password')
+        assert await stream.receive() == b'\x01\x00'
+        await stream.send(b'\x05\x01\x00\x01\x7f\x00\x00\x01' + struct.pack('>H', port))
+        reply = await stream.receive()
+        if reply[1] == 0:
+            await stream.send(b'ping')
+            assert await stream.receive() == b'ping'
+        return reply[:2]
+
+
+@pytest.mark.asyncio
+async def test_observer_events():
+    observer = RecordingObserver()
+    timing = TimingObserver()
+    handler = Socks5ProxyHandler(
+        username='user', password='password', observers=[observer, timing]
+    )
+
+    with anyio.fail_after(10):
+        async with serve(echo) as echo_port, serve(handler.handle) as proxy_port:
+            assert await socks5_connect(proxy_port, echo_port) == b'\x05\x00'
+            await observer.closed.wait()
+
+    events = observer.events
+    assert events[:3] == [
+        ('accept',),
+        ('negotiated', ('127.0.0.1', echo_port), 'socks5', 'user'),
+        ('connected',),
+    ]
+    # both directions report their batches when the tunnel closes, in any order
+    assert sorted(events[3:5]) == [('chunk', False, 4), ('chunk', True, 4)]
+    assert events[5:] == [('closed', 4, 4, None)]
+    for histogram in (timing.handshake, timing.connect, timing.tunnel, timing.total):
+        assert histogram.count == 1
+
+
+@pytest.mark.asyncio
+async def test_observer_connect_failure():
+    observer = RecordingObserver()
+    timing = TimingObserver()
+    handler = Socks5ProxyHandler(
+        username='user', password='password', observers=[observer, timing]
+    )
+    port = _free_port()
+
+    with anyio.fail_after(10):
+        async with serve(handler.handle) as proxy_port:
+            assert await socks5_connect(proxy_port, port) == b'\x05\x05'
+            await observer.closed.wait()
+
+    assert observer.events == [
+        ('accept',),
+        ('negotiated', ('127.0.0.1', port), 'socks5', 'user'),
+        ('closed', 0, 0, 'connect_failed'),
+    ]
+    assert (timing.handshake.count, timing.connect.count, timing.tunnel.count) == (1, 0, 0)
+    assert timing.total.count == 1
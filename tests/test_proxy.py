@@ -1,13 +1,20 @@
 """
 python -m pytest tests --cov=./tiny_proxy --cov-report term-missing -s
 """
+import socket
 import ssl
 
+import anyio
+import anyio.abc
 import httpx
 import pytest
 from httpx import Response
 from httpx_socks import AsyncProxyTransport
 
+import tiny_proxy._tunnel
+from tiny_proxy import AutoProxyHandler, BufferPool, Socks5ProxyHandler
+from tiny_proxy._splice import SPLICE_AVAILABLE
+
 from tests.config import (
     SOCKS5_PROXY_URL,
     TEST_HTTPS_URL_IPV4,
@@ -18,6 +25,22 @@ from tests.config import (
     SOCKS4_PROXY_URL_NO_AUTH,
     HTTP_PROXY_URL,
     HTTP_PROXY_URL_NO_AUTH,
+    SOCKS5_PROXY_URL_SPLICE,
+    HTTP_PROXY_URL_SPLICE,
+    SOCKS5_PROXY_URL_POOLED,
+    SOCKS5_PROXY_URL_ASYNCIO_RELAY,
+    SOCKS5_PROXY_URL_DNS_CACHE,
+    TEST_HTTP_URL_LOCALHOST,
+    PROXY_HOST,
+    HTTP_PROXY_PORT_NO_AUTH,
+    SOCKS5_PROXY_PORT_NO_AUTH,
+    TEST_HTTP_HOST_IPV4,
+    TEST_HTTP_PORT_IPV4,
+    SOCKS5_PROXY_URL_METRICS,
+    SOCKS5_PROXY_PORT_METRICS,
+    METRICS_URL,
+    PROXY_USERNAME,
+    AUTO_PROXY_URLS,
 )
 
 
@@ -105,7 +128,7 @@ async def test_socks4_proxy_https_no_auth(client_ssl_context, url, rdns):
     assert res.status_code == 200
 
 
-@pytest.mark.parametrize('url', (TEST_HTTPS_URL_IPV4,))
+@pytest.mark.parametrize('url', (TEST_HTTPS_URL_IPV4, TEST_HTTPS_URL_IPV6))
 @pytest.mark.asyncio
 async def test_http_proxy_https(client_ssl_context, url):
     res = await fetch(
@@ -116,7 +139,7 @@ async def test_http_proxy_https(client_ssl_context, url):
     assert res.status_code == 200
 
 
-@pytest.mark.parametrize('url', (TEST_HTTPS_URL_IPV4,))
+@pytest.mark.parametrize('url', (TEST_HTTPS_URL_IPV4, TEST_HTTPS_URL_IPV6))
 @pytest.mark.asyncio
 async def test_http_proxy_https_no_auth(client_ssl_context, url):
     res = await fetch(
@@ -125,3 +148,235 @@ async def test_http_proxy_https_no_auth(client_ssl_context, url):
         target_ssl=client_ssl_context,
     )
     assert res.status_code == 200
+
+
+@pytest.mark.parametrize('url', (TEST_HTTP_URL_IPV4, TEST_HTTPS_URL_IPV4))
+@pytest.mark.asyncio
+async def test_socks5_proxy_splice(client_ssl_context, url):
+    res = await fetch(
+        proxy_url=SOCKS5_PROXY_URL_SPLICE,
+        target_url=url,
+        target_ssl=client_ssl_context,
+    )
+    assert res.status_code == 200
+
+
+@pytest.mark.parametrize('url', (TEST_HTTPS_URL_IPV4,))
+@pytest.mark.asyncio
+async def test_http_proxy_splice(client_ssl_context, url):
+    res = await fetch(
+        proxy_url=HTTP_PROXY_URL_SPLICE,
+        target_url=url,
+        target_ssl=client_ssl_context,
+    )
+    assert res.status_code == 200
+
+
+@pytest.mark.parametrize('url', (TEST_HTTP_URL_IPV4, TEST_HTTPS_URL_IPV4))
+@pytest.mark.asyncio
+async def test_socks5_proxy_pooled_buffers(client_ssl_context, url):
+    res = await fetch(
+        proxy_url=SOCKS5_PROXY_URL_POOLED,
+        target_url=url,
+        target_ssl=client_ssl_context,
+    )
+    assert res.status_code == 200
+
+
+async def fetch_in_process(handler, target_url: str, target_ssl: ssl.SSLContext) -> Response:
+    listener = await anyio.create_tcp_listener(local_host=PROXY_HOST)
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handler.handle)
+        res = await fetch(
+            proxy_url=f'socks5://{PROXY_HOST}:{port}',
+            target_url=target_url,
+            target_ssl=target_ssl,
+        )
+        tg.cancel_scope.cancel()
+    return res
+
+
+@pytest.mark.asyncio
+async def test_pooled_buffers_used(client_ssl_context):
+    pool = BufferPool()
+    handler = Socks5ProxyHandler(buffer_pool=pool)
+    res = await fetch_in_process(handler, TEST_HTTPS_URL_IPV4, client_ssl_context)
+    assert res.status_code == 200
+    # a buffer per direction, all of them back in the pool
+    assert pool.checkouts == 2
+    assert pool.available == pool.allocated
+
+
+@pytest.mark.skipif(not SPLICE_AVAILABLE, reason='splice() is Linux only')
+@pytest.mark.asyncio
+async def test_splice_used(client_ssl_context, monkeypatch):
+    calls = []
+    splice_tunnel = tiny_proxy._tunnel.splice_tunnel
+
+    async def counting_splice_tunnel(*args):
+        calls.append(args)
+        await splice_tunnel(*args)
+
+    monkeypatch.setattr(tiny_proxy._tunnel, 'splice_tunnel', counting_splice_tunnel)
+    handler = Socks5ProxyHandler(splice=True)
+    res = await fetch_in_process(handler, TEST_HTTPS_URL_IPV4, client_ssl_context)
+    assert res.status_code == 200
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('url', (TEST_HTTP_URL_IPV4, TEST_HTTPS_URL_IPV4))
+@pytest.mark.asyncio
+async def test_socks5_proxy_asyncio_relay(client_ssl_context, url):
+    res = await fetch(
+        proxy_url=SOCKS5_PROXY_URL_ASYNCIO_RELAY,
+        target_url=url,
+        target_ssl=client_ssl_context,
+    )
+    assert res.status_code == 200
+
+
+@pytest.mark.parametrize('url', (TEST_HTTP_URL_LOCALHOST, TEST_HTTP_URL_IPV4))
+@pytest.mark.asyncio
+async def test_socks5_proxy_dns_cache(url):
+    for _ in range(2):
+        res = await fetch(
+            proxy_url=SOCKS5_PROXY_URL_DNS_CACHE,
+            target_url=url,
+            rdns=True,
+        )
+        assert res.status_code == 200
+
+
+async def send_and_read_all(port: int, data: bytes) -> bytes:
+    stream = await anyio.connect_tcp(PROXY_HOST, port)
+    async with stream:
+        await stream.send(data)
+        response = b''
+        try:
+            while True:
+                response += await stream.receive()
+        except anyio.EndOfStream:
+            pass
+    return response
+
+
+@pytest.mark.asyncio
+async def test_http_proxy_pipelined_request():
+    target = f'{TEST_HTTP_HOST_IPV4}:{TEST_HTTP_PORT_IPV4}'
+    request = (
+        f'CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n\r\n'
+        f'GET / HTTP/1.1\r\nHost: {target}\r\nConnection: close\r\n\r\n'
+    )
+
+    response = await send_and_read_all(HTTP_PROXY_PORT_NO_AUTH, request.encode('ascii'))
+    assert response.startswith(b'HTTP/1.1 200 Connection established\r\n\r\nHTTP/1.1 200 OK')
+    assert response.endswith(b'Index')
+
+
+@pytest.mark.asyncio
+async def test_socks5_proxy_pipelined_request():
+    target = f'{TEST_HTTP_HOST_IPV4}:{TEST_HTTP_PORT_IPV4}'
+    request = (
+        b'\x05\x01\x00'
+        + b'\x05\x01\x00\x01\x7f\x00\x00\x01'
+        + TEST_HTTP_PORT_IPV4.to_bytes(2, 'big')
+        + f'GET / HTTP/1.1\r\nHost: {target}\r\nConnection: close\r\n\r\n'.encode('ascii')
+    )
+
+    response = await send_and_read_all(SOCKS5_PROXY_PORT_NO_AUTH, request)
+    assert response[:4] == b'\x05\x00\x05\x00'
+    assert response[12:].startswith(b'HTTP/1.1 200 OK')
+    assert response.endswith(b'Index')
+
+
+@pytest.mark.asyncio
+async def test_socks5_proxy_connection_refused():
+    with socket.socket() as sock:
+        sock.bind((PROXY_HOST, 0))
+        closed_port = sock.getsockname()[1]
+
+    request = (
+        b'\x05\x01\x00'
+        + b'\x05\x01\x00\x01\x7f\x00\x00\x01'
+        + closed_port.to_bytes(2, 'big')
+    )
+
+    response = await send_and_read_all(SOCKS5_PROXY_PORT_NO_AUTH, request)
+    assert response[:4] == b'\x05\x00\x05\x05'
+
+
+async def fetch_metrics() -> dict:
+    async with httpx.AsyncClient() as client:
+        res = await client.get(METRICS_URL)
+        assert res.headers['content-type'].startswith('text/plain; version=0.0.4')
+
+    samples = {}
+    for line in res.text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+@pytest.mark.asyncio
+async def test_socks5_proxy_metrics():
+    before = await fetch_metrics()
+
+    res = await fetch(proxy_url=SOCKS5_PROXY_URL_METRICS, target_url=TEST_HTTP_URL_IPV4)
+    assert res.status_code == 200
+
+    username = PROXY_USERNAME.encode()
+    request = b'\x05\x01\x02' + bytes([1, len(username)]) + username + b'\x05wrong'
+    response = await send_and_read_all(SOCKS5_PROXY_PORT_METRICS, request)
+    assert response == b'\x05\x02\x01\xff'
+
+    def delta(name: str) -> float:
+        return samples.get(name, 0) - before.get(name, 0)
+
+    with anyio.fail_after(5):
+        while True:
+            samples = await fetch_metrics()
+            if delta('tiny_proxy_tunnel_duration_seconds_count{protocol="socks5"}'):
+                break
+            await anyio.sleep(0.05)
+
+    assert delta('tiny_proxy_connections_accepted_total{protocol="socks5"}') == 2
+    assert samples['tiny_proxy_connections_active{protocol="socks5"}'] == 0
+    failures = 'tiny_proxy_handshake_failures_total{protocol="socks5",reason="auth_failed"}'
+    assert delta(failures) == 1
+    assert delta('tiny_proxy_handshake_duration_seconds_count{protocol="socks5"}') == 1
+    assert delta('tiny_proxy_connect_duration_seconds_count{protocol="socks5"}') == 1
+    assert delta('tiny_proxy_bytes_total{protocol="socks5",direction="in"}') > 0
+    assert delta('tiny_proxy_bytes_total{protocol="socks5",direction="out"}') > len(res.content)
+
+
+@pytest.mark.parametrize('proxy_url', AUTO_PROXY_URLS)
+@pytest.mark.parametrize('url', (TEST_HTTP_URL_IPV4, TEST_HTTPS_URL_IPV4))
+@pytest.mark.asyncio
+async def test_auto_proxy(client_ssl_context, proxy_url, url):
+    res = await fetch(
+        proxy_url=proxy_url,
+        target_url=url,
+        target_ssl=client_ssl_context,
+    )
+    assert res.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_auto_proxy_without_socks4():
+    handler = AutoProxyHandler(username=PROXY_USERNAME, password='password')
+    assert handler.protocols == ('socks5', 'http')
+
+    listener = await anyio.create_tcp_listener(local_host=PROXY_HOST)
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handler.handle)
+        stream = await anyio.connect_tcp(PROXY_HOST, port)
+        request = b'\x04\x01' + TEST_HTTP_PORT_IPV4.to_bytes(2, 'big')
+        request += socket.inet_aton(TEST_HTTP_HOST_IPV4) + PROXY_USERNAME.encode() + b'\x00'
+        await stream.send(request)
+        with pytest.raises(anyio.EndOfStream):
+            await stream.receive()
+        await stream.aclose()
+        tg.cancel_scope.cancel()
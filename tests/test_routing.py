@@ -0,0 +1,114 @@
+import errno
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import Connector, Router, RouteRule
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+async def send_peer_host(stream):
+    async with stream:
+        host = stream.extra(anyio.abc.SocketAttribute.remote_address)[0]
+        await stream.send(host.encode())
+
+
+ROUTES = {'office': Connector(), 'isp2': Connector()}
+
+
+def test_rule_parse():
+    assert RouteRule.parse('office .corp.example.com 443') == RouteRule(
+        'office', '.corp.example.com', ((443, 443),)
+    )
+    with pytest.raises(ValueError):
+        Router(['nowhere 10.0.0.0/8'], ROUTES)
+    with pytest.raises(ValueError):
+        Router(default='nowhere')
+    with pytest.raises(ValueError):
+        Router(routes={'direct': Connector()})
+
+
+def test_first_and_longest_match():
+    rules = [
+        'office 10.0.0.0/8',
+        'blackhole 10.1.0.0/16',
+        'isp2 * 25',
+        'office .example.com',
+        'direct www.example.com',
+    ]
+    router = Router(rules, ROUTES, default='isp2')
+    assert router.route('10.1.2.3', 80) == 'office'
+    assert router.route('10.1.2.3', 25) == 'office'
+    assert router.route('192.0.2.1', 25) == 'isp2'
+    assert router.route('www.example.com', 443) == 'office'
+    assert router.route('example.org', 443) == 'isp2'
+
+    router = Router(rules, ROUTES, default='isp2', longest=True)
+    assert router.route('10.1.2.3', 80) == 'blackhole'
+    assert router.route('10.2.3.4', 25) == 'office'
+    assert router.route('www.example.com', 443) == 'direct'
+    assert router.route('mail.example.com', 25) == 'office'
+
+
+def test_cache_and_reload():
+    router = Router(['office .example.com'], ROUTES, cache_size=2)
+    table = router.table
+    # the decisions stay right as they are evicted
+    for _ in range(2):
+        for host, route in (
+            ('a.example.com', 'office'),
+            ('b.example.com', 'office'),
+            ('example.org', 'direct'),
+        ):
+            assert router.route(host, 443) == route
+
+    router.reload(['isp2 .example.com'])
+    assert router.route('b.example.com', 443) == 'isp2'
+    # a lookup in progress keeps the table it started with
+    assert table.lookup('b.example.com', 443) == 'office'
+
+    with pytest.raises(ValueError):
+        router.reload(['nowhere *'])
+    assert router.route('b.example.com', 443) == 'isp2'
+
+
+def test_reload_keeps_default_and_mode():
+    rules = ['office 10.0.0.0/8', 'blackhole 10.1.0.0/16']
+    router = Router(rules, ROUTES, default='isp2', longest=True)
+    router.reload(rules + ['direct 192.0.2.0/24'])
+    assert router.route('10.1.2.3', 80) == 'blackhole'
+    assert router.route('198.51.100.1', 80) == 'isp2'
+
+    router.reload(rules, default='direct', longest=False)
+    assert router.route('10.1.2.3', 80) == 'office'
+    assert router.route('198.51.100.1', 80) == 'direct'
+
+
+@pytest.mark.asyncio
+async def test_router_connect():
+    router = Router(
+        ['source2 localhost', 'blackhole 192.0.2.0/24'],
+        {'source2': Connector(local_host='127.0.0.2')},
+    )
+    with anyio.fail_after(5):
+        async with serve(send_peer_host) as port:
+            for host, source in (('127.0.0.1', b'127.0.0.1'), ('localhost', b'127.0.0.2')):
+                stream = await router.connect(host, port)
+                assert await stream.receive() == source
+                await stream.aclose()
+
+        with pytest.raises(OSError) as exc_info:
+            await router.connect('192.0.2.1', 80)
+        assert exc_info.value.errno == errno.ENETUNREACH
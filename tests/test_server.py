@@ -0,0 +1,110 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from tests.config import PROXY_HOST
+
+SERVER_SCRIPT = '''
+import sys
+from tiny_proxy import Endpoint, MultiProcessServer, Socks5ProxyHandler
+
+endpoint = Endpoint(Socks5ProxyHandler(), sys.argv[1], int(sys.argv[2]))
+MultiProcessServer([endpoint], workers=2, reuse_port=sys.argv[3] == '1', restart_delay=0.1).run()
+'''
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith('linux'), reason='relies on /proc to find the workers'
+)
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((PROXY_HOST, 0))
+        return sock.getsockname()[1]
+
+
+def get_children(pid: int):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError('Timed out')
+
+
+def socks5_greeting(port: int) -> bytes:
+    try:
+        with socket.create_connection((PROXY_HOST, port), timeout=5) as sock:
+            sock.sendall(b'\x05\x01\x00')
+            return sock.recv(2)
+    except ConnectionRefusedError:
+        return b''
+
+
+def is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize('reuse_port', (True, False))
+def test_multi_process_server(reuse_port):
+    port = get_free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen(
+        [sys.executable, '-c', SERVER_SCRIPT, PROXY_HOST, str(port), str(int(reuse_port))],
+        env=dict(os.environ, PYTHONPATH=root),
+    )
+
+    try:
+        workers = wait_for(lambda: len(get_children(proc.pid)) == 2 and get_children(proc.pid))
+        wait_for(lambda: socks5_greeting(port) == b'\x05\x00')
+
+        # a crashed worker gets replaced
+        os.kill(workers[0], signal.SIGKILL)
+        wait_for(lambda: workers[0] not in get_children(proc.pid))
+        wait_for(lambda: len(get_children(proc.pid)) == 2)
+        for _ in range(4):
+            assert socks5_greeting(port) == b'\x05\x00'
+
+        # coordinated shutdown
+        children = get_children(proc.pid)
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=15) == 0
+        assert not any(is_running(child) for child in children)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def test_worker_startup_failure_is_not_restarted():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with socket.socket() as taken:
+        taken.bind((PROXY_HOST, 0))
+        taken.listen()
+        port = taken.getsockname()[1]
+        proc = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SCRIPT, PROXY_HOST, str(port), '1'],
+            env=dict(os.environ, PYTHONPATH=root),
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            assert proc.wait(timeout=15) != 0
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
@@ -0,0 +1,89 @@
+import struct
+import time
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import Shaper, Socks5ProxyHandler, TokenBucket
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+async def echo(stream):
+    async with stream:
+        try:
+            while True:
+                await stream.send(await stream.receive())
+        except (anyio.EndOfStream, anyio.BrokenResourceError):
+            pass
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1000, burst=500, now=0)
+    assert bucket.reserve(400, now=0) == 0
+    assert bucket.reserve(600, now=0) == pytest.approx(0.5)  # 500 tokens in debt
+    assert bucket.reserve(100, now=1) == 0  # paid off and refilled up to 400
+    assert bucket.tokens == pytest.approx(400)
+
+    bucket.reserve(10000, now=100)
+    assert bucket.tokens == pytest.approx(-9500)
+
+
+@pytest.mark.asyncio
+async def test_fair_shares():
+    shaper = Shaper(rate=1200, connection_rate=1000)
+    bulk1, bulk2 = shaper.open('alice'), shaper.open('alice')
+    interactive = shaper.open('bob')
+    idle = shaper.open('carol')
+
+    now = anyio.current_time()
+    for throttle in (bulk1, bulk2, interactive):
+        shaper.reserve(throttle, 1, now)
+    shaper.rebalance(now + 0.1)
+
+    # the global rate is shared by the active users, a user's one by its connections
+    assert bulk1.group.bucket.rate == bulk2.group.bucket.rate == 600
+    assert bulk1.bucket.rate == bulk2.bucket.rate == 300
+    assert interactive.bucket.rate == 600
+    assert idle.group.bucket.rate == 600
+
+    for throttle in (bulk1, bulk2, interactive, idle):
+        throttle.close()
+    assert not shaper._groups
+
+
+@pytest.mark.parametrize('options', ({}, {'splice': True}))
+@pytest.mark.asyncio
+async def test_throttled_tunnel(options):
+    handler = Socks5ProxyHandler(shaper=Shaper(connection_rate=400_000, burst=0.25), **options)
+    data = b'x' * 100_000
+
+    with anyio.fail_after(10):
+        async with serve(echo) as echo_port, serve(handler.handle) as proxy_port:
+            stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+            await stream.send(b'\x05\x01\x00')
+            assert await stream.receive() == b'\x05\x00'
+            await stream.send(b'\x05\x01\x00\x01\x7f\x00\x00\x01' + struct.pack('>H', echo_port))
+            assert (await stream.receive())[:2] == b'\x05\x00'
+
+            started = time.monotonic()
+            await stream.send(data)
+            received = 0
+            while received < len(data):
+                received += len(await stream.receive())
+            elapsed = time.monotonic() - started
+            await stream.aclose()
+
+    # 200 KB in both directions minus the 100 KB burst at 400 KB/s
+    assert elapsed >= 0.2
@@ -0,0 +1,169 @@
+import struct
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import BufferPool, ProxyObserver, Socks5ProxyHandler, Timeouts, TimerWheel
+
+
+class ClosedObserver(ProxyObserver):
+    def __init__(self):
+        self.reason = None
+        self.closed = anyio.Event()
+
+    def on_closed(self, connection, traffic, duration, reason):
+        self.reason = reason
+        self.closed.set()
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+async def echo(stream):
+    async with stream:
+        try:
+            while True:
+                await stream.send(await stream.receive())
+        except (anyio.EndOfStream, anyio.BrokenResourceError):
+            pass
+
+
+async def open_tunnel(proxy_port: int, port: int) -> anyio.abc.SocketStream:
+    stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+    await stream.send(b'\x05\x01\x00')
+    assert await stream.receive() == b'\x05\x00'
+    await stream.send(b'\x05\x01\x00\x01\x7f\x00\x00\x01' + struct.pack('>H', port))
+    assert (await stream.receive())[:2] == b'\x05\x00'
+    return stream
+
+
+async def wait_closed(stream: anyio.abc.SocketStream):
+    with pytest.raises((anyio.EndOfStream, anyio.BrokenResourceError)):
+        while True:
+            await stream.receive()
+    await stream.aclose()
+
+
+def create_handler(options=None, **timeouts):
+    observer = ClosedObserver()
+    handler = Socks5ProxyHandler(
+        observers=[observer],
+        timeouts=Timeouts(**timeouts),
+        timer_wheel=TimerWheel(resolution=0.02),
+        **(options or {}),
+    )
+    return handler, observer
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(resolution=1, slots=4)
+    fired = []
+    wheel.call_later(1, lambda: fired.append(1))
+    wheel.call_later(6, lambda: fired.append(6))
+    cancelled = wheel.call_later(2, lambda: fired.append(2))
+    cancelled.cancel()
+
+    for _ in range(5):
+        wheel.tick()
+    assert fired == [1]
+    wheel.tick()
+    assert fired == [1, 6]
+
+
+@pytest.mark.asyncio
+async def test_timer_wheel_outlives_first_user():
+    wheel = TimerWheel(resolution=0.01)
+    fired = anyio.Event()
+
+    async def first(task_status):
+        async with wheel.driven():
+            task_status.started()
+            await anyio.sleep_forever()
+
+    with anyio.fail_after(5):
+        async with anyio.create_task_group() as tg:
+            first_scope = anyio.CancelScope()
+
+            async def run_first(task_status=anyio.TASK_STATUS_IGNORED):
+                with first_scope:
+                    await first(task_status)
+
+            await tg.start(run_first)
+            async with wheel.driven():
+                first_scope.cancel()
+                await anyio.sleep(0.05)
+                wheel.call_later(0.05, fired.set)
+                await fired.wait()
+
+        # the last user gone, a new one starts the ticker again
+        fired = anyio.Event()
+        async with wheel.driven():
+            wheel.call_later(0.05, fired.set)
+            await fired.wait()
+
+
+@pytest.mark.asyncio
+async def test_handshake_timeout():
+    handler, observer = create_handler(handshake=0.1)
+
+    with anyio.fail_after(5):
+        async with serve(handler.handle) as proxy_port:
+            stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+            await stream.send(b'\x05\x01')  # incomplete greeting
+            await wait_closed(stream)
+            await observer.closed.wait()
+
+    assert observer.reason == 'handshake_timeout'
+
+
+@pytest.mark.parametrize(
+    'options',
+    (
+        {},
+        {'splice': True},
+        {'buffer_pool': BufferPool()},
+        {'asyncio_relay': True},
+    ),
+)
+@pytest.mark.asyncio
+async def test_idle_timeout(options):
+    handler, observer = create_handler(options, handshake=0.1, idle=0.3)
+
+    with anyio.fail_after(5):
+        async with serve(echo) as echo_port, serve(handler.handle) as proxy_port:
+            stream = await open_tunnel(proxy_port, echo_port)
+            # activity keeps the tunnel open past the handshake and idle timeouts
+            for _ in range(5):
+                await stream.send(b'ping')
+                assert await stream.receive() == b'ping'
+                await anyio.sleep(0.1)
+
+            started = anyio.current_time()
+            await wait_closed(stream)
+            await observer.closed.wait()
+
+    assert observer.reason == 'idle_timeout'
+    assert anyio.current_time() - started >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_lifetime_exceeded():
+    handler, observer = create_handler(lifetime=0.3)
+
+    with anyio.fail_after(5):
+        async with serve(echo) as echo_port, serve(handler.handle) as proxy_port:
+            stream = await open_tunnel(proxy_port, echo_port)
+            await wait_closed(stream)
+            await observer.closed.wait()
+
+    assert observer.reason == 'lifetime_exceeded'
@@ -0,0 +1,135 @@
+import struct
+from contextlib import asynccontextmanager
+
+import anyio
+import anyio.abc
+import pytest
+
+from tiny_proxy import (
+    AbstractResolver,
+    Connector,
+    ProxyObserver,
+    ResolveResult,
+    Socks5ProxyHandler,
+)
+
+
+class ClosedObserver(ProxyObserver):
+    def __init__(self):
+        self.traffic = None
+        self.closed = anyio.Event()
+
+    def on_closed(self, connection, traffic, duration, reason):
+        self.traffic = (traffic.upstream, traffic.downstream, reason)
+        self.closed.set()
+
+
+@asynccontextmanager
+async def serve(handle):
+    listener = await anyio.create_tcp_listener(local_host='127.0.0.1')
+    port = listener.extra(anyio.abc.SocketAttribute.local_port)
+
+    async with listener, anyio.create_task_group() as tg:
+        tg.start_soon(listener.serve, handle)
+        yield port
+        tg.cancel_scope.cancel()
+
+
+@asynccontextmanager
+async def udp_echo():
+    async with await anyio.create_udp_socket(local_host='127.0.0.1') as sock:
+        async with anyio.create_task_group() as tg:
+
+            async def echo():
+                async for data, address in sock:
+                    await sock.sendto(data, *address)
+
+            tg.start_soon(echo)
+            yield sock.extra(anyio.abc.SocketAttribute.local_port)
+            tg.cancel_scope.cancel()
+
+
+async def udp_associate(proxy_port: int, client_port: int):
+    stream = await anyio.connect_tcp('127.0.0.1', proxy_port)
+    await stream.send(b'\x05\x01\x00')
+    assert await stream.receive() == b'\x05\x00'
+    await stream.send(b'\x05\x03\x00\x01\x7f\x00\x00\x01' + struct.pack('>H', client_port))
+    return stream, await stream.receive()
+
+
+def header(port: int) -> bytes:
+    return b'\x00\x00\x00\x01\x7f\x00\x00\x01' + struct.pack('>H', port)
+
+
+@pytest.mark.asyncio
+async def test_udp_associate():
+    observer = ClosedObserver()
+    handler = Socks5ProxyHandler(udp=True, observers=[observer])
+
+    async with udp_echo() as echo_port, serve(handler.handle) as proxy_port:
+        async with await anyio.create_udp_socket(local_host='127.0.0.1') as client:
+            client_port = client.extra(anyio.abc.SocketAttribute.local_port)
+            stream, reply = await udp_associate(proxy_port, client_port)
+            assert reply[:4] == b'\x05\x00\x00\x01'
+            relay_port = struct.unpack('>H', reply[8:10])[0]
+
+            with anyio.fail_after(5):
+                for payload in (b'ping', b'pong' * 1000):
+                    await client.sendto(header(echo_port) + payload, '127.0.0.1', relay_port)
+                    data, _ = await client.receive()
+                    assert data == header(echo_port) + payload
+
+                # fragments and datagrams for unknown address types are dropped
+                for datagram in (b'\x00\x00\x01' + header(echo_port)[3:], b'\x00\x00\x00\x07'):
+                    await client.sendto(datagram, '127.0.0.1', relay_port)
+
+                # the association ends with the controlling connection
+                await stream.aclose()
+                await observer.closed.wait()
+
+    assert observer.traffic == (4004, 4004, None)
+
+
+@pytest.mark.asyncio
+async def test_udp_associate_disabled():
+    async with serve(Socks5ProxyHandler().handle) as proxy_port:
+        stream, reply = await udp_associate(proxy_port, 0)
+        await stream.aclose()
+    assert reply[:2] == b'\x05\x07'
+
+
+class SlowResolver(AbstractResolver):
+    async def resolve(self, host):
+        if host == 'slow.example.com':
+            await anyio.sleep_forever()
+        return ResolveResult(addresses=('127.0.0.1',))
+
+
+def name_header(host: bytes, port: int) -> bytes:
+    return b'\x00\x00\x00\x03' + bytes([len(host)]) + host + struct.pack('>H', port)
+
+
+@pytest.mark.asyncio
+async def test_udp_names_resolved_in_background():
+    handler = Socks5ProxyHandler(udp=True, connector=Connector(resolver=SlowResolver()))
+
+    async with udp_echo() as echo_port, serve(handler.handle) as proxy_port:
+        async with await anyio.create_udp_socket(local_host='127.0.0.1') as client:
+            client_port = client.extra(anyio.abc.SocketAttribute.local_port)
+            stream, reply = await udp_associate(proxy_port, client_port)
+            relay_port = struct.unpack('>H', reply[8:10])[0]
+
+            with anyio.fail_after(5):
+                # a name that never resolves doesn't hold up the others
+                datagram = name_header(b'slow.example.com', echo_port) + b'lost'
+                await client.sendto(datagram, '127.0.0.1', relay_port)
+
+                # dropped until the name is resolved
+                datagram = name_header(b'fast.example.com', echo_port) + b'ping'
+                while True:
+                    await client.sendto(datagram, '127.0.0.1', relay_port)
+                    with anyio.move_on_after(0.1):
+                        data, _ = await client.receive()
+                        break
+                assert data == header(echo_port) + b'ping'
+            await stream.aclose()
@@ -1,27 +1,98 @@
 from ._errors import ProxyError
+from ._buffers import BufferPool
 from ._stream import SocketStream
 from ._tunnel import create_tunnel
+from ._traffic import TrafficCounter
+from ._connector import Connector
+from ._breaker import CircuitBreaker
+from ._dns.abc import AbstractResolver, ResolveResult
+from ._dns.system import SystemResolver
+from ._dns.cache import CachingResolver
+from ._dns.stub import StubResolver
+from ._metrics.registry import MetricsRegistry
+from ._metrics.proxy import ProxyMetrics
+from ._metrics.http import MetricsHandler, serve_metrics
+from ._observers import Connection, ProxyObserver, TimingObserver
+from ._timers import Timeouts, TimerWheel
+from ._admission import AdmissionController, AdmissionLimits
+from ._acl import AccessList, AccessRule
+from ._shaping import Shaper, Throttle, TokenBucket
+from ._auth.abc import AbstractAuthenticator
+from ._auth.static import StaticAuthenticator
+from ._auth.file import FileAuthenticator
+from ._auth.hashing import hash_password, verify_password
+from ._bind import BindPool
+from ._forward import KeepAlivePool
+from ._chain import ChainConnector, UpstreamProxy
+from ._balancer import BalancingConnector
+from ._routing import Router, RouteRule
 
 from ._proxy.abc import AbstractProxy
 from ._proxy.socks5 import Socks5Proxy
 from ._proxy.socks4 import Socks4Proxy
 from ._proxy.http import HttpProxy
+from ._proxy.auto import AutoProxy
 
 from ._handlers.http import HttpProxyHandler
 from ._handlers.socks4 import Socks4ProxyHandler
 from ._handlers.socks5 import Socks5ProxyHandler
+from ._handlers.auto import AutoProxyHandler
+
+from ._server import Endpoint, MultiProcessServer, serve_endpoints
 
 __version__ = '0.2.1'
 
 __all__ = (
     'ProxyError',
+    'BufferPool',
     'SocketStream',
     'create_tunnel',
+    'TrafficCounter',
+    'Connector',
+    'CircuitBreaker',
+    'AbstractResolver',
+    'ResolveResult',
+    'SystemResolver',
+    'CachingResolver',
+    'StubResolver',
+    'MetricsRegistry',
+    'ProxyMetrics',
+    'MetricsHandler',
+    'serve_metrics',
+    'Connection',
+    'ProxyObserver',
+    'TimingObserver',
+    'Timeouts',
+    'TimerWheel',
+    'AdmissionController',
+    'AdmissionLimits',
+    'AccessList',
+    'AccessRule',
+    'Shaper',
+    'Throttle',
+    'TokenBucket',
+    'AbstractAuthenticator',
+    'StaticAuthenticator',
+    'FileAuthenticator',
+    'hash_password',
+    'verify_password',
+    'BindPool',
+    'KeepAlivePool',
+    'ChainConnector',
+    'UpstreamProxy',
+    'BalancingConnector',
+    'Router',
+    'RouteRule',
     'AbstractProxy',
     'Socks5Proxy',
     'Socks4Proxy',
     'HttpProxy',
+    'AutoProxy',
     'HttpProxyHandler',
     'Socks4ProxyHandler',
     'Socks5ProxyHandler',
+    'AutoProxyHandler',
+    'Endpoint',
+    'MultiProcessServer',
+    'serve_endpoints',
 )
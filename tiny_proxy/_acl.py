@@ -0,0 +1,79 @@
+from typing import Mapping, NamedTuple, Optional, Sequence, Union
+
+from ._matcher import DestinationMatcher, PortRanges, parse_rule
+
+ALLOW = 'allow'
+DENY = 'deny'
+
+
+class AccessRule(NamedTuple):
+    """
+    destination is '*', an address or a network (10.0.0.0/8, 2001:db8::/32),
+    a domain name (example.com), its subdomains (*.example.com)
+    or both (.example.com). ports is None for all of them
+    """
+
+    action: str
+    destination: str = '*'
+    ports: Optional[PortRanges] = None
+
+    @classmethod
+    def parse(cls, rule: str) -> 'AccessRule':
+        """Parses '<allow|deny> <destination> [<ports>]', e.g. 'allow *.example.com 80,443'"""
+        action, destination, ports = parse_rule(rule)
+        if action not in (ALLOW, DENY):
+            raise ValueError(f'Invalid rule: {rule!r}')
+        return cls(action, destination, ports)
+
+
+def _compile(rules: Sequence[Union[AccessRule, str]]) -> DestinationMatcher[bool]:
+    compiled = []
+    for rule in rules:
+        if isinstance(rule, str):
+            rule = AccessRule.parse(rule)
+        if rule.action not in (ALLOW, DENY):
+            raise ValueError(f'Invalid action: {rule.action!r}')
+        compiled.append((rule.destination, rule.ports, rule.action == ALLOW))
+    return DestinationMatcher(compiled)
+
+
+class AccessList:
+    """
+    Decides which destinations clients may reach. The first matching rule
+    (see AccessRule) applies: the rules of the authenticated user first,
+    then the common ones, default if none matches.
+
+    Names are matched as they are requested, network rules apply
+    to destinations requested by address and, once it's resolved,
+    to the address of a requested name: whichever rule matches first applies
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[Union[AccessRule, str]] = (),
+        users: Optional[Mapping[str, Sequence[Union[AccessRule, str]]]] = None,
+        default: str = ALLOW,
+    ):
+        if default not in (ALLOW, DENY):
+            raise ValueError(f'Invalid default action: {default!r}')
+        self.rules = _compile(rules)
+        self.users = {user: _compile(user_rules) for user, user_rules in (users or {}).items()}
+        self.default = default == ALLOW
+
+    def allows(
+        self,
+        host: str,
+        port: int,
+        user: Optional[str] = None,
+        address: Optional[str] = None,
+    ) -> bool:
+        """address is one the name host resolved to, if it's known"""
+        if user is not None:
+            rules = self.users.get(user)
+            if rules is not None:
+                allowed = rules.match(host, port, address)
+                if allowed is not None:
+                    return allowed
+
+        allowed = self.rules.match(host, port, address)
+        return self.default if allowed is None else allowed
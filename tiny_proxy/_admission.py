@@ -0,0 +1,201 @@
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional
+
+import anyio
+
+from ._errors import AdmissionRejected
+from ._metrics.registry import MetricsRegistry
+
+
+class AdmissionLimits(NamedTuple):
+    """
+    Concurrency limits, None disables a limit: tunnels (including the ones
+    being connected), handshakes in progress and tunnels per destination host.
+    Requests over a limit wait in a queue of up to queue_size requests
+    for at most queue_timeout seconds, queue_size=0 rejects them right away
+    """
+
+    tunnels: Optional[int] = None
+    handshakes: Optional[int] = None
+    per_destination: Optional[int] = None
+    queue_size: int = 0
+    queue_timeout: float = 5.0
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = anyio.Event()
+        self.granted = False
+
+
+class Limiter:
+    """Counting semaphore with a bounded FIFO queue, a released slot goes to the first waiter"""
+
+    def __init__(self, limit: int, queue_size: int = 0, queue_timeout: float = 5.0):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self._waiters: Deque[_Waiter] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and not self._waiters
+
+    async def acquire(self):
+        if self.active < self.limit:
+            self.active += 1
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected('Too many concurrent requests')
+
+        waiter = _Waiter()
+        self._waiters.append(waiter)
+        try:
+            with anyio.move_on_after(self.queue_timeout):
+                await waiter.event.wait()
+        except BaseException:
+            if waiter.granted:
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+        if not waiter.granted:
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            raise AdmissionRejected('Timed out waiting in the admission queue')
+
+    def release(self):
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            waiter.event.set()
+        else:
+            self.active -= 1
+
+
+class AdmissionController:
+    """
+    Enforces AdmissionLimits for one or several handlers (of the same event loop).
+    Every client connection gets its own Admission
+    """
+
+    def __init__(self, limits: AdmissionLimits):
+        self.limits = limits
+        self.handshakes = self._limiter(limits.handshakes)
+        self.tunnels = self._limiter(limits.tunnels)
+        self.destinations: Dict[str, Limiter] = {}
+        self.destinations_rejected = 0
+
+    def _limiter(self, limit: Optional[int]) -> Optional[Limiter]:
+        if limit is None:
+            return None
+        return Limiter(limit, self.limits.queue_size, self.limits.queue_timeout)
+
+    def admission(self) -> 'Admission':
+        return Admission(self)
+
+    def destination(self, host: str) -> Limiter:
+        limiter = self.destinations.get(host)
+        if limiter is None:
+            limiter = self.destinations[host] = self._limiter(self.limits.per_destination)
+        return limiter
+
+    def discard_destination(self, host: str, limiter: Limiter):
+        """Forgets the limiter of a host nobody is connected to"""
+        if limiter.idle and self.destinations.get(host) is limiter:
+            self.destinations_rejected += limiter.rejected
+            del self.destinations[host]
+
+    def bind_metrics(self, registry: MetricsRegistry, prefix: str = 'tiny_proxy'):
+        """Exposes the slots in use, queue depths and rejections, labelled by limit"""
+        active = registry.gauge(
+            f'{prefix}_admission_active',
+            'Requests holding an admission slot',
+            ('limit',),
+        )
+        queued = registry.gauge(
+            f'{prefix}_admission_queue_depth',
+            'Requests waiting for an admission slot',
+            ('limit',),
+        )
+        rejected = registry.counter(
+            f'{prefix}_admission_rejected_total',
+            'Requests rejected by admission control',
+            ('limit',),
+        )
+
+        def collect():
+            limiters = {'handshakes': self.handshakes, 'tunnels': self.tunnels}
+            for name, limiter in limiters.items():
+                if limiter is not None:
+                    active.labels(name).set(limiter.active)
+                    queued.labels(name).set(limiter.queued)
+                    rejected.labels(name).value = limiter.rejected
+            if self.limits.per_destination is not None:
+                destinations = self.destinations.values()
+                active.labels('per_destination').set(sum(d.active for d in destinations))
+                queued.labels('per_destination').set(sum(d.queued for d in destinations))
+                rejected.labels('per_destination').value = self.destinations_rejected + sum(
+                    d.rejected for d in destinations
+                )
+
+        registry.add_collect_hook(collect)
+
+
+class Admission:
+    """Admission slots held by a client connection, release() gives them all back"""
+
+    __slots__ = ('controller', '_handshake', '_tunnel', '_host', '_destination')
+
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+        self._handshake = self._tunnel = False
+        self._host: Optional[str] = None
+        self._destination: Optional[Limiter] = None
+
+    async def start_handshake(self):
+        limiter = self.controller.handshakes
+        if limiter is not None:
+            await limiter.acquire()
+            self._handshake = True
+
+    def end_handshake(self):
+        if self._handshake:
+            self._handshake = False
+            self.controller.handshakes.release()
+
+    async def open_tunnel(self, host: str):
+        controller = self.controller
+        if controller.limits.per_destination is not None:
+            destination = controller.destination(host)
+            try:
+                await destination.acquire()
+            except BaseException:
+                controller.discard_destination(host, destination)
+                raise
+            self._host, self._destination = host, destination
+
+        if controller.tunnels is not None:
+            await controller.tunnels.acquire()
+            self._tunnel = True
+
+    def release(self):
+        self.end_handshake()
+        if self._tunnel:
+            self._tunnel = False
+            self.controller.tunnels.release()
+        if self._destination is not None:
+            self._destination.release()
+            self.controller.discard_destination(self._host, self._destination)
+            self._destination = None
@@ -0,0 +1,129 @@
+import asyncio
+from typing import List, Optional
+
+from ._stream import SocketStream
+from ._traffic import FLUSH_CHUNKS, TrafficCounter
+
+
+def can_relay_with_protocols(*endpoints: SocketStream) -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:  # not running on asyncio (e.g. trio)
+        return False
+
+    return all(endpoint.supports_raw_io for endpoint in endpoints)
+
+
+class RelayProtocol(asyncio.Protocol):
+    """
+    Forwards everything it receives to the peer transport.
+    Reading is paused while the peer can't keep up with writing.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        traffic: Optional[TrafficCounter] = None,
+        upstream: bool = True,
+    ):
+        self.transport: Optional[asyncio.Transport] = None
+        self.peer: Optional[RelayProtocol] = None
+        self.closed = loop.create_future()
+        self.traffic = traffic
+        self.upstream = upstream
+        self._backlog: List[bytes] = []
+        self._relayed = 0
+        self._chunks = 0
+        self._flush_chunks = FLUSH_CHUNKS if traffic is None else traffic.flush_chunks
+
+    def flush_traffic(self):
+        if self.traffic is not None:
+            self.traffic.add(self.upstream, self._relayed)
+        self._relayed = self._chunks = 0
+
+    def write(self, data: bytes):
+        if self.transport is None:
+            self._backlog.append(data)
+        else:
+            self.transport.write(data)
+
+    def close(self):
+        if self.transport is None:
+            if not self.closed.done():
+                self.closed.set_result(None)
+        elif not self.transport.is_closing():
+            # pending data is flushed before the socket gets closed
+            self.transport.close()
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        for data in self._backlog:
+            transport.write(data)
+        self._backlog.clear()
+
+    def data_received(self, data: bytes):
+        self.peer.write(data)
+        self._relayed += len(data)
+        self._chunks += 1
+        if self._chunks == self._flush_chunks:
+            self.flush_traffic()
+
+    def eof_received(self):
+        # like the regular relay, the tunnel ends when either side is done
+        self.peer.close()
+        return False
+
+    def pause_writing(self):
+        if self.peer.transport is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        if self.peer.transport is not None:
+            self.peer.transport.resume_reading()
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.flush_traffic()
+        self.peer.close()
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+async def relay_with_protocols(
+    endpoint1: SocketStream,
+    endpoint2: SocketStream,
+    traffic: Optional[TrafficCounter] = None,
+):
+    """
+    Relays data between two plain TCP endpoints with callback driven asyncio protocols,
+    instead of two tasks awaiting receive() and send()
+    """
+    loop = asyncio.get_running_loop()
+
+    protocol1 = RelayProtocol(loop, traffic, upstream=True)
+    protocol2 = RelayProtocol(loop, traffic, upstream=False)
+    protocol1.peer = protocol2
+    protocol2.peer = protocol1
+
+    pending = endpoint1.take_buffered()
+    if pending:
+        protocol2.write(pending)
+        protocol1._relayed += len(pending)
+
+    pending = endpoint2.take_buffered()
+    if pending:
+        protocol1.write(pending)
+        protocol2._relayed += len(pending)
+
+    try:
+        # the anyio transports stay paused, new transports take over
+        # duplicates of their sockets until the tunnel is done
+        for endpoint, protocol in ((endpoint1, protocol1), (endpoint2, protocol2)):
+            await loop.connect_accepted_socket(lambda p=protocol: p, endpoint.dup_socket())
+        await asyncio.gather(protocol1.closed, protocol2.closed)
+    finally:
+        for protocol in (protocol1, protocol2):
+            if protocol.transport is not None:
+                protocol.transport.abort()
+            protocol.flush_traffic()
+        await endpoint1.aclose()
+        await endpoint2.aclose()
@@ -0,0 +1,4 @@
+class AbstractAuthenticator:
+    async def authenticate(self, username: str, password: str) -> bool:
+        """Returns whether the credentials are valid, must not block the event loop"""
+        raise NotImplementedError()
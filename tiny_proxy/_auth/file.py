@@ -0,0 +1,110 @@
+import hashlib
+import hmac
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import anyio
+import anyio.to_thread
+
+from .abc import AbstractAuthenticator
+from .hashing import check_hash, verify_password
+
+logger = logging.getLogger(__name__)
+
+
+def parse_users(text: str) -> Dict[str, str]:
+    """
+    Parses "username:hash" lines (see hash_password()),
+    empty lines and lines starting with # are ignored
+    """
+    users = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        username, sep, encoded = line.partition(':')
+        if not sep or not username:
+            raise ValueError(f'Line {number}: expected "username:hash"')
+        try:
+            check_hash(encoded)
+        except ValueError as e:
+            raise ValueError(f'Line {number}: {e}') from e
+        users[username] = encoded
+    return users
+
+
+class FileAuthenticator(AbstractAuthenticator):
+    """
+    Users with hashed passwords loaded from a file (see parse_users()).
+
+    Hashes are verified in worker threads. Successful verifications are cached
+    (up to cache_size users, least recently used go first), so repeated
+    connections of a user don't pay for the key derivation again.
+    Unknown users are checked against the hash of another user (and rejected),
+    so response times don't tell whether a user exists.
+
+    The file is loaded on creation, reload() (or watch()) picks up changes
+    without blocking the event loop, the users are swapped at once
+    """
+
+    def __init__(self, path: str, cache_size: int = 1024):
+        self.path = path
+        self.cache_size = cache_size
+        # the cache doesn't keep passwords, only their keyed digests
+        self._cache_key = os.urandom(32)
+        self._cache: 'OrderedDict[str, Tuple[str, bytes]]' = OrderedDict()
+        self._users, self._mtime = self._load()
+
+    def __len__(self):
+        return len(self._users)
+
+    def _load(self) -> Tuple[Dict[str, str], Optional[float]]:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            return parse_users(f.read()), mtime
+
+    async def reload(self):
+        """Reloads the users, keeps the current ones if the file is broken"""
+        users, mtime = await anyio.to_thread.run_sync(self._load)
+        self._users, self._mtime = users, mtime
+        logger.info(f'Loaded {len(users)} users from {self.path}')
+
+    async def watch(self, interval: float = 5.0):
+        """Reloads the users whenever the file changes, runs until cancelled"""
+        while True:
+            await anyio.sleep(interval)
+            try:
+                mtime = (await anyio.to_thread.run_sync(os.stat, self.path)).st_mtime
+                if mtime != self._mtime:
+                    await self.reload()
+            except (OSError, ValueError) as e:
+                logger.error(f"Couldn't reload users from {self.path}: {e}")
+
+    async def authenticate(self, username: str, password: str) -> bool:
+        encoded = self._users.get(username)
+        digest = hmac.new(self._cache_key, password.encode(), hashlib.sha256).digest()
+
+        cached = self._cache.get(username)
+        if cached is not None and encoded is not None:
+            cached_hash, cached_digest = cached
+            # a changed hash (e.g. after reload) invalidates the cached verification
+            if cached_hash == encoded and hmac.compare_digest(cached_digest, digest):
+                self._cache.move_to_end(username)
+                return True
+
+        if encoded is None:
+            if self._users:
+                other = next(iter(self._users.values()))
+                await anyio.to_thread.run_sync(verify_password, password, other)
+            return False
+
+        if not await anyio.to_thread.run_sync(verify_password, password, encoded):
+            return False
+
+        self._cache[username] = (encoded, digest)
+        self._cache.move_to_end(username)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return True
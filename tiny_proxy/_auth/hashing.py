@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import hmac
+import os
+from typing import Callable, Tuple
+
+PBKDF2_ITERATIONS = 600000
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+SALT_SIZE = 16
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def hash_password(
+    password: str,
+    scheme: str = 'pbkdf2_sha256',
+    iterations: int = PBKDF2_ITERATIONS,
+) -> str:
+    """
+    Returns an encoded password hash:
+    pbkdf2_sha256$<iterations>$<salt>$<hash> or scrypt$<n>$<r>$<p>$<salt>$<hash>
+    """
+    salt = os.urandom(SALT_SIZE)
+    if scheme == 'pbkdf2_sha256':
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+        return f'pbkdf2_sha256${iterations}${_b64encode(salt)}${_b64encode(digest)}'
+    if scheme == 'scrypt':
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        params = f'{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}'
+        return f'scrypt${params}${_b64encode(salt)}${_b64encode(digest)}'
+    raise ValueError(f'Unsupported password hash scheme: {scheme}')
+
+
+def _parse(encoded: str) -> Tuple[Callable[[bytes, bytes], bytes], bytes, bytes]:
+    """Returns the key derivation function, salt and digest of an encoded hash"""
+    scheme, *params = encoded.split('$')
+    if scheme == 'pbkdf2_sha256' and len(params) == 3:
+        iterations = int(params[0])
+
+        def derive(password: bytes, salt: bytes) -> bytes:
+            return hashlib.pbkdf2_hmac('sha256', password, salt, iterations)
+
+    elif scheme == 'scrypt' and len(params) == 5:
+        n, r, p = map(int, params[:3])
+
+        def derive(password: bytes, salt: bytes) -> bytes:
+            return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p)
+
+    else:
+        raise ValueError(f'Unsupported password hash: {scheme}')
+
+    return derive, _b64decode(params[-2]), _b64decode(params[-1])
+
+
+def check_hash(encoded: str):
+    """Raises ValueError if the encoded hash is malformed or of an unknown scheme"""
+    _parse(encoded)
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """Checks the password against a hash from hash_password(), it's slow on purpose"""
+    derive, salt, expected = _parse(encoded)
+    return hmac.compare_digest(derive(password.encode(), salt), expected)
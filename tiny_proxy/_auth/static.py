@@ -0,0 +1,17 @@
+import hmac
+
+from .abc import AbstractAuthenticator
+
+
+class StaticAuthenticator(AbstractAuthenticator):
+    """A single username/password pair, compared in constant time"""
+
+    def __init__(self, username: str, password: str):
+        self._username = username.encode()
+        self._password = password.encode()
+
+    async def authenticate(self, username: str, password: str) -> bool:
+        # both comparisons are made regardless of the first one's result
+        username_ok = hmac.compare_digest(username.encode(), self._username)
+        password_ok = hmac.compare_digest(password.encode(), self._password)
+        return username_ok & password_ok
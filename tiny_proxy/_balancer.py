@@ -0,0 +1,204 @@
+import errno
+import itertools
+import logging
+import random
+import time
+from typing import List, Optional, Sequence
+
+from ._connector import DEFAULT_CONNECT_TIMEOUT, AddressFilter, Connector
+from ._dns.abc import AbstractResolver
+from ._errors import UpstreamUnavailable
+from ._stream import SocketStream
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('round_robin', 'least_active', 'ewma')
+
+# weight of the newest connect latency in the moving average
+EWMA_ALPHA = 0.3
+
+# failures of the egress path itself (resets and protocol errors come from
+# its own hops), as opposed to the destination refusing or not existing,
+# which would fail through any path
+PATH_FAILURE_ERRNOS = frozenset(
+    (
+        errno.ETIMEDOUT,
+        errno.ECONNRESET,
+        errno.ECONNABORTED,
+        errno.ENETUNREACH,
+        errno.ENETDOWN,
+        errno.EPROTO,
+    )
+)
+
+
+def is_path_failure(error: OSError) -> bool:
+    if isinstance(error, (TimeoutError, UpstreamUnavailable)):
+        return True
+    return error.errno in PATH_FAILURE_ERRNOS
+
+
+class Target:
+    """An egress path of the balancer with its passive health state"""
+
+    def __init__(self, connector: Connector, name: str):
+        self.connector = connector
+        self.name = name
+        self.active = 0
+        # moving average of the connect latency, None until the first connection
+        self.ewma: Optional[float] = None
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.readmitted_at: Optional[float] = None
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def weight(self, now: float, slow_start: float) -> float:
+        """Share of the traffic a re-admitted target gets, grows to 1 over slow_start seconds"""
+        if self.readmitted_at is None or slow_start <= 0:
+            return 1.0
+        return min(1.0, (now - self.readmitted_at) / slow_start)
+
+    def release(self):
+        """Called when a connection through the target is closed"""
+        self.active -= 1
+
+    def cost(self) -> float:
+        # unmeasured targets go first, then the faster and less loaded ones
+        return (self.ewma or 0.0) * (self.active + 1)
+
+    def __repr__(self):
+        return f'<Target {self.name} active={self.active} ewma={self.ewma}>'
+
+
+class BalancingConnector(Connector):
+    """
+    Spreads outbound connections over several egress paths (connectors, e.g.
+    chains of different upstream proxies) by one of the policies:
+
+    round_robin - in turn;
+    least_active - the path with the fewest connections being established or open;
+    ewma - the lowest moving average of the connect latency times
+    (active connections + 1), so a degrading path quickly loses its traffic.
+    A path failure counts as the path's connect timeout, other failed
+    attempts aren't measured.
+
+    Passive health checking: after max_failures path failures in a row
+    (timeouts, resets, unreachable network, an unavailable first upstream proxy,
+    see is_path_failure())
+    a path is ejected for ejection_time seconds, doubled with every
+    further ejection up to max_ejection_time. A re-admitted path gets
+    a share of the traffic that grows from 0 to full over slow_start seconds,
+    its first failure ejects it again. If all the paths are ejected,
+    they are all used anyway
+    """
+
+    def __init__(
+        self,
+        connectors: Sequence[Connector],
+        policy: str = 'ewma',
+        max_failures: int = 3,
+        ejection_time: float = 10.0,
+        max_ejection_time: float = 300.0,
+        slow_start: float = 30.0,
+        resolver: Optional[AbstractResolver] = None,
+    ):
+        super().__init__(resolver)
+        if not connectors:
+            raise ValueError('At least one connector is required')
+        if policy not in POLICIES:
+            raise ValueError(f'Unsupported policy: {policy}')
+        self.targets = [
+            Target(connector, f'path #{number}') for number, connector in enumerate(connectors)
+        ]
+        self.policy = policy
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.slow_start = slow_start
+        self._counter = itertools.count()
+
+    async def connect(
+        self,
+        host: str,
+        port: int,
+        address_filter: Optional[AddressFilter] = None,
+    ) -> SocketStream:
+        target = self.select(time.monotonic())
+        target.active += 1
+        started = time.monotonic()
+        try:
+            stream = await target.connector.connect(host, port, address_filter)
+        except OSError as e:
+            target.release()
+            self.record(target, time.monotonic() - started, e, time.monotonic())
+            raise
+        except BaseException:
+            target.release()
+            raise
+
+        self.record(target, time.monotonic() - started, None, time.monotonic())
+        stream.on_close(target.release)
+        return stream
+
+    def select(self, now: float) -> Target:
+        candidates = self._available(now)
+        if self.policy == 'round_robin':
+            return candidates[next(self._counter) % len(candidates)]
+
+        if self.policy == 'least_active':
+            key = lambda target: target.active  # noqa: E731
+        else:
+            key = Target.cost
+        best = min(key(target) for target in candidates)
+        ties = [target for target in candidates if key(target) == best]
+        return ties[next(self._counter) % len(ties)]
+
+    def record(self, target: Target, latency: float, error: Optional[OSError], now: float):
+        if error is not None:
+            if not is_path_failure(error):
+                # the destination failed, the path worked (at an unknown latency)
+                self._reset_failures(target, now)
+                return
+            # how fast a path fails says nothing about how fast it would connect
+            latency = max(latency, target.connector.connect_timeout or DEFAULT_CONNECT_TIMEOUT)
+
+        if target.ewma is None:
+            target.ewma = latency
+        else:
+            target.ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * target.ewma
+
+        if error is None:
+            self._reset_failures(target, now)
+            return
+
+        target.failures += 1
+        on_probation = target.readmitted_at is not None
+        if target.failures >= self.max_failures or on_probation:
+            duration = min(self.ejection_time * 2**target.ejections, self.max_ejection_time)
+            target.ejections += 1
+            target.failures = 0
+            target.ejected_until = now + duration
+            target.readmitted_at = target.ejected_until
+            logger.warning(f'Ejected {target.name} for {duration:.0f}s: {error}')
+
+    def _reset_failures(self, target: Target, now: float):
+        target.failures = 0
+        if target.weight(now, self.slow_start) >= 1.0:
+            target.readmitted_at = None
+            target.ejections = 0
+
+    def _available(self, now: float) -> List[Target]:
+        healthy = [target for target in self.targets if not target.is_ejected(now)]
+        if not healthy:
+            return self.targets
+
+        # re-admitted targets get a growing share of the selections
+        admitted = [
+            target
+            for target in healthy
+            if random.random() < target.weight(now, self.slow_start)
+        ]
+        return admitted or healthy
@@ -0,0 +1,172 @@
+import collections
+import errno
+import ipaddress
+import logging
+from typing import Deque, FrozenSet, Optional, Sequence, Tuple
+
+import anyio
+import anyio.abc
+
+from ._connector import is_ip_address
+from ._dns.abc import AbstractResolver
+from ._dns.system import SystemResolver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCEPT_TIMEOUT = 60.0
+BACKLOG = 8
+
+
+class BindPool:
+    """
+    Listening sockets for the BIND requests of SOCKS4 and SOCKS5.
+
+    Listeners are bound to host, on a free port of ports (any free port if None).
+    Every listener accepts a single inbound connection per request,
+    within accept_timeout seconds. Up to size idle listeners are kept open
+    for the next requests (fill() opens them in advance), so busy BIND
+    workloads (e.g. active mode FTP) don't pay for socket(), bind() and listen()
+    on every request
+    """
+
+    def __init__(
+        self,
+        host: str = '0.0.0.0',
+        ports: Optional[Sequence[int]] = None,
+        size: int = 0,
+        accept_timeout: float = DEFAULT_ACCEPT_TIMEOUT,
+    ):
+        self.host = host
+        self.ports = ports
+        self.size = size
+        self.accept_timeout = accept_timeout
+        self._idle: Deque[anyio.abc.SocketListener] = collections.deque()
+        self._next_port = 0
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    async def fill(self):
+        """Opens listeners until there are size idle ones"""
+        while len(self._idle) < self.size:
+            self._idle.append(await self._open())
+
+    async def acquire(self) -> anyio.abc.SocketListener:
+        while self._idle:
+            # connections that came while the listener was idle aren't for this client
+            listener = self._idle.popleft()
+            if await self._drain(listener):
+                return listener
+        return await self._open()
+
+    async def release(self, listener: anyio.abc.SocketListener):
+        # connections that came after the accepted one must not go to the next client
+        if not await self._drain(listener):
+            return
+
+        if len(self._idle) < self.size:
+            self._idle.append(listener)
+        else:
+            await listener.aclose()
+
+    def address(self, listener: anyio.abc.SocketListener, local_host: str) -> Tuple[str, int]:
+        """
+        The address to report to the client: a listener bound to all interfaces
+        is reported with local_host (the proxy's address the client connected to)
+        """
+        host, port = listener.extra(anyio.abc.SocketAttribute.local_address)[:2]
+        if ipaddress.ip_address(host).is_unspecified:
+            host = local_host
+        return host, port
+
+    async def accept(
+        self,
+        listener: anyio.abc.SocketListener,
+        peer_host: Optional[str] = None,
+        resolver: Optional[AbstractResolver] = None,
+    ) -> anyio.abc.SocketStream:
+        """
+        Waits for the inbound connection. If peer_host is an address other than
+        0.0.0.0 or ::, or a name (resolved with resolver), connections from other
+        addresses are closed and the wait goes on.
+        Raises TimeoutError after accept_timeout seconds
+        """
+        with anyio.move_on_after(self.accept_timeout):
+            peers = await _peer_addresses(peer_host, resolver)
+            while True:
+                stream = await listener.accept()
+                host = stream.extra(anyio.abc.SocketAttribute.remote_address)[0]
+                if peers is None or _normalize(host) in peers:
+                    return stream
+                logger.info(f'BIND: unexpected connection from {host}, waiting for {peer_host}')
+                await stream.aclose()
+
+        raise TimeoutError(errno.ETIMEDOUT, 'No inbound connection for BIND')
+
+    async def aclose(self):
+        while self._idle:
+            await self._idle.popleft().aclose()
+
+    async def _open(self) -> anyio.abc.SocketListener:
+        if not self.ports:
+            return await self._listen(0)
+
+        error: Optional[OSError] = None
+        for _ in range(len(self.ports)):
+            port = self.ports[self._next_port % len(self.ports)]
+            self._next_port += 1
+            try:
+                return await self._listen(port)
+            except OSError as e:
+                if e.errno != errno.EADDRINUSE:
+                    raise
+                error = e
+
+        raise OSError(errno.EADDRINUSE, 'No free port for BIND') from error
+
+    async def _drain(self, listener: anyio.abc.SocketListener) -> bool:
+        """Closes the pending connections, and the listener if it's broken"""
+        sock = listener.extra(anyio.abc.SocketAttribute.raw_socket)
+        try:
+            while True:
+                sock.accept()[0].close()
+        except BlockingIOError:
+            return True
+        except OSError as e:
+            logger.debug(e)
+            await listener.aclose()
+            return False
+
+    async def _listen(self, port: int) -> anyio.abc.SocketListener:
+        multi = await anyio.create_tcp_listener(
+            local_host=self.host, local_port=port, backlog=BACKLOG
+        )
+        # a name may resolve to several addresses, a single one is reported to the client
+        for extra in multi.listeners[1:]:
+            await extra.aclose()
+        return multi.listeners[0]
+
+
+async def _peer_addresses(
+    peer_host: Optional[str],
+    resolver: Optional[AbstractResolver],
+) -> Optional[FrozenSet[str]]:
+    """The addresses the inbound connection may come from, None for any"""
+    if not peer_host:
+        return None
+    if is_ip_address(peer_host):
+        if ipaddress.ip_address(peer_host).is_unspecified:
+            return None
+        return frozenset((_normalize(peer_host),))
+
+    result = await (resolver or SystemResolver()).resolve(peer_host)
+    return frozenset(_normalize(address) for address in result.addresses)
+
+
+def _normalize(host: str) -> str:
+    # IPv4 peers of a dual-stack listener come as IPv4-mapped IPv6 addresses
+    address = ipaddress.ip_address(host)
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return str(address)
@@ -0,0 +1,142 @@
+import collections
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from ._errors import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+Destination = Tuple[str, int]
+
+
+class Circuit:
+    """Recent connect failures to a destination"""
+
+    def __init__(self):
+        self.failures = 0
+        self.first_failure = 0.0
+        self.trips = 0
+        self.open_until: Optional[float] = None
+        self.probes = 0
+        self.error: Optional[OSError] = None
+
+    def state(self, now: float) -> str:
+        if self.open_until is None:
+            return CLOSED
+        return OPEN if now < self.open_until else HALF_OPEN
+
+    def __repr__(self):
+        return f'<Circuit failures={self.failures} trips={self.trips} error={self.error}>'
+
+
+class CircuitBreaker:
+    """
+    Fails connects to a destination (host:port) fast while it is down.
+
+    After failure_threshold failed connects within window seconds the circuit
+    opens: connects fail immediately with the last error, so the proxies send
+    the same reply they sent for it, without resolving or connecting. After
+    open_time seconds the circuit is half-open, half_open_probes connects
+    at a time are let through: a successful one closes the circuit, a failed
+    one opens it again for twice as long, up to max_open_time.
+
+    Only the destinations are tracked: the failures of the first proxy
+    of a chain (UpstreamUnavailable) aren't recorded, they say nothing about
+    the destination. At most max_destinations failing destinations are tracked,
+    the least recently failed ones are forgotten first
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        window: float = 10.0,
+        open_time: float = 5.0,
+        max_open_time: float = 60.0,
+        half_open_probes: int = 1,
+        max_destinations: int = 10000,
+    ):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.half_open_probes = half_open_probes
+        self.max_destinations = max_destinations
+        self._circuits: 'collections.OrderedDict[Destination, Circuit]'
+        self._circuits = collections.OrderedDict()
+
+    def state(self, host: str, port: int) -> str:
+        circuit = self._circuits.get((host, port))
+        return CLOSED if circuit is None else circuit.state(time.monotonic())
+
+    def states(self) -> Dict[Destination, str]:
+        """States of the tracked destinations, the others are closed"""
+        now = time.monotonic()
+        return {destination: circuit.state(now) for destination, circuit in self._circuits.items()}
+
+    def __len__(self):
+        return len(self._circuits)
+
+    @contextmanager
+    def guard(self, host: str, port: int) -> Iterator[None]:
+        """Wraps a connect to host:port, raises the last error instead while the circuit is open"""
+        destination = (host, port)
+        circuit = self._circuits.get(destination)
+        probe = False
+        if circuit is not None:
+            state = circuit.state(time.monotonic())
+            if state == OPEN or (state == HALF_OPEN and circuit.probes >= self.half_open_probes):
+                error = circuit.error
+                message = f'{host}:{port} is unavailable: {error.strerror or error}'
+                raise type(error)(error.errno, message)
+            if state == HALF_OPEN:
+                probe = True
+                circuit.probes += 1
+
+        try:
+            yield
+        except UpstreamUnavailable:
+            raise
+        except OSError as e:
+            self._failed(destination, e, time.monotonic())
+            raise
+        else:
+            # the destination is up again
+            self._circuits.pop(destination, None)
+        finally:
+            if probe:
+                circuit.probes -= 1
+
+    def _failed(self, destination: Destination, error: OSError, now: float):
+        circuit = self._circuits.pop(destination, None)
+        if circuit is None:
+            circuit = Circuit()
+            while len(self._circuits) >= self.max_destinations:
+                self._circuits.popitem(last=False)
+        # the most recently failed destination goes last
+        self._circuits[destination] = circuit
+
+        circuit.error = error
+        state = circuit.state(now)
+        if state == OPEN:
+            # a connect started before the circuit opened
+            return
+
+        if state == CLOSED:
+            if now - circuit.first_failure > self.window:
+                circuit.failures = 0
+                circuit.first_failure = now
+            circuit.failures += 1
+            if circuit.failures < self.failure_threshold:
+                return
+
+        duration = min(self.open_time * 2**circuit.trips, self.max_open_time)
+        circuit.trips += 1
+        circuit.failures = 0
+        circuit.open_until = now + duration
+        logger.warning(f'Circuit to {destination[0]}:{destination[1]} open for {duration:.0f}s')
@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+from typing import List
+
+DEFAULT_BUFFER_SIZE = 65536
+DEFAULT_SLAB_BUFFERS = 16
+
+
+class BufferPool:
+    """
+    Pool of reusable fixed-size receive buffers.
+
+    Buffers are carved out of larger preallocated slabs (one bytearray each)
+    and handed out as memoryviews, so relaying data doesn't allocate
+    a new bytes object per chunk. Slabs are allocated lazily
+    and are kept for the lifetime of the pool.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        slab_buffers: int = DEFAULT_SLAB_BUFFERS,
+        preallocate: int = 0,
+    ):
+        if buffer_size < 1 or slab_buffers < 1:
+            raise ValueError('buffer_size and slab_buffers must be positive integers')
+
+        self.buffer_size = buffer_size
+        self.slab_buffers = slab_buffers
+        self._slabs: List[bytearray] = []
+        self._free: List[memoryview] = []
+        self._lock = threading.Lock()
+        # buffers handed out so far
+        self.checkouts = 0
+
+        while self.allocated < preallocate:
+            self._allocate_slab()
+
+    @property
+    def allocated(self) -> int:
+        return len(self._slabs) * self.slab_buffers
+
+    @property
+    def available(self) -> int:
+        return len(self._free)
+
+    def _allocate_slab(self):
+        slab = bytearray(self.buffer_size * self.slab_buffers)
+        view = memoryview(slab)
+        self._slabs.append(slab)
+        self._free.extend(
+            view[i : i + self.buffer_size]
+            for i in range(0, len(slab), self.buffer_size)
+        )
+
+    def checkout(self) -> memoryview:
+        with self._lock:
+            if not self._free:
+                self._allocate_slab()
+            self.checkouts += 1
+            return self._free.pop()
+
+    def checkin(self, buffer: memoryview) -> None:
+        with self._lock:
+            self._free.append(buffer)
+
+    @contextmanager
+    def buffer(self):
+        buffer = self.checkout()
+        try:
+            yield buffer
+        finally:
+            self.checkin(buffer)
@@ -0,0 +1,324 @@
+import collections
+import errno
+import ipaddress
+import logging
+from typing import Deque, NamedTuple, Optional, Sequence, Tuple, Union
+from urllib.parse import unquote, urlsplit
+
+import anyio
+
+from ._breaker import CircuitBreaker
+from ._connector import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_HAPPY_EYEBALLS_DELAY,
+    AddressFilter,
+    Connector,
+)
+from ._dns.abc import AbstractResolver
+from ._errors import UpstreamDenied, UpstreamRefused, UpstreamUnavailable
+from ._parsers.http import HEADERS_END, parse_response
+from ._parsers.socks4 import ReplyCode as Socks4ReplyCode
+from ._parsers.socks5 import AddressType, AuthMethod, ReplyCode, ReplyMessages
+from ._proxy.http import BasicAuth
+from ._stream import SocketStream
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait before retrying after the first proxy couldn't be reached
+WARM_RETRY_DELAY = 1.0
+
+SOCKS5_ERRNOS = {
+    ReplyCode.CONNECTION_NOT_ALLOWED: errno.EACCES,
+    ReplyCode.NETWORK_UNREACHABLE: errno.ENETUNREACH,
+    ReplyCode.HOST_UNREACHABLE: errno.EHOSTUNREACH,
+    ReplyCode.CONNECTION_REFUSED: errno.ECONNREFUSED,
+    ReplyCode.TTL_EXPIRED: errno.ETIMEDOUT,
+}
+
+# failures to reach the first proxy, with the types of the original errors kept
+UPSTREAM_ERRORS = {errno.ECONNREFUSED: UpstreamRefused, errno.EACCES: UpstreamDenied}
+
+
+class UpstreamProxy(NamedTuple):
+    protocol: str
+    host: str
+    port: int
+    username: Optional[str] = None
+    password: Optional[str] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> 'UpstreamProxy':
+        """Parses socks5://[user:password@]host:port (or socks4://, http://)"""
+        parsed = urlsplit(url)
+        protocol = parsed.scheme.lower()
+        if protocol not in ('socks5', 'socks4', 'http') or not parsed.hostname:
+            raise ValueError(f'Unsupported proxy URL: {url!r}')
+        port = parsed.port or (1080 if protocol.startswith('socks') else 8080)
+        username = unquote(parsed.username) if parsed.username else None
+        password = unquote(parsed.password) if parsed.password else None
+        return cls(protocol, parsed.hostname, port, username, password)
+
+    async def authenticate(self, stream: SocketStream):
+        """The part of the handshake that doesn't depend on the destination (SOCKS5 only)"""
+        if self.protocol == 'socks5':
+            await _socks5_authenticate(stream, self.username, self.password)
+
+    async def request(self, stream: SocketStream, host: str, port: int):
+        """Asks the proxy to connect to host:port, after authenticate()"""
+        if self.protocol == 'socks5':
+            await _socks5_request(stream, host, port)
+        elif self.protocol == 'socks4':
+            await _socks4_request(stream, host, port, self.username or '')
+        else:
+            await _http_request(stream, host, port, self.username, self.password)
+
+
+class ChainConnector(Connector):
+    """
+    Opens outbound connections through a chain of upstream proxies:
+    the first one is connected to directly, every next one (and finally
+    the destination) through the previous ones. Destination names are
+    resolved by the last proxy.
+
+    pool_size connections to the first proxy can be kept open in advance
+    (see keep_warm()), SOCKS5 ones already authenticated, so a tunnel
+    doesn't wait for the TCP handshake and the authentication round trips.
+    Idle connections are replaced after pool_max_idle seconds,
+    before the proxy's handshake timeout closes them.
+
+    Failures to connect to or authenticate with the first proxy are raised
+    as UpstreamUnavailable, so they aren't taken for failures of the destination
+    """
+
+    def __init__(
+        self,
+        proxies: Sequence[Union[UpstreamProxy, str]],
+        pool_size: int = 0,
+        pool_max_idle: float = 5.0,
+        resolver: Optional[AbstractResolver] = None,
+        connect_timeout: Optional[float] = DEFAULT_CONNECT_TIMEOUT,
+        happy_eyeballs_delay: float = DEFAULT_HAPPY_EYEBALLS_DELAY,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__(resolver, connect_timeout, happy_eyeballs_delay, circuit_breaker)
+        if not proxies:
+            raise ValueError('At least one proxy is required')
+        self.proxies = tuple(
+            UpstreamProxy.from_url(proxy) if isinstance(proxy, str) else proxy
+            for proxy in proxies
+        )
+        self.pool_size = pool_size
+        self.pool_max_idle = pool_max_idle
+        self._idle: Deque[Tuple[float, SocketStream]] = collections.deque()
+        self._taken: Optional[anyio.Event] = None
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    async def keep_warm(self):
+        """Keeps pool_size idle connections to the first proxy, runs until cancelled"""
+        try:
+            while True:
+                self._taken = anyio.Event()
+                await self._evict(anyio.current_time() - self.pool_max_idle)
+                while len(self._idle) < self.pool_size:
+                    try:
+                        stream = await self._open_first()
+                    except OSError as e:
+                        logger.warning(f"Couldn't connect to {self.proxies[0].host}: {e}")
+                        await anyio.sleep(WARM_RETRY_DELAY)
+                        break
+                    self._idle.append((anyio.current_time(), stream))
+
+                # the oldest connection expires first
+                timeout = self.pool_max_idle
+                if self._idle:
+                    timeout = self._idle[0][0] + self.pool_max_idle - anyio.current_time()
+                with anyio.move_on_after(max(timeout, 0)):
+                    await self._taken.wait()
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self._evict(float('inf'))
+
+    async def _connect(
+        self,
+        host: str,
+        port: int,
+        address_filter: Optional[AddressFilter] = None,
+    ) -> SocketStream:
+        # the destination is resolved by the last proxy, its addresses aren't known here
+        stream = self._take()
+        if stream is not None:
+            try:
+                return await self._through_chain(stream, host, port)
+            except ConnectionResetError as e:
+                # the first proxy has closed the idle connection
+                logger.debug(f'Warm connection failed: {e}')
+
+        return await self._through_chain(await self._open_first(), host, port)
+
+    async def _open_first(self) -> SocketStream:
+        first = self.proxies[0]
+        try:
+            stream = await super()._connect(first.host, first.port)
+            try:
+                await first.authenticate(stream)
+            except BaseException:
+                await _aclose(stream)
+                raise
+        except OSError as e:
+            # told apart from the failures of the destination (see CircuitBreaker)
+            error = UPSTREAM_ERRORS.get(e.errno, UpstreamUnavailable)
+            message = f'Upstream proxy {first.host}:{first.port}: {e.strerror or e}'
+            raise error(e.errno, message) from e
+        return stream
+
+    async def _through_chain(self, stream: SocketStream, host: str, port: int) -> SocketStream:
+        """Continues the handshakes on an authenticated connection to the first proxy"""
+        try:
+            for proxy, next_proxy in zip(self.proxies, self.proxies[1:] + (None,)):
+                if next_proxy is None:
+                    await proxy.request(stream, host, port)
+                else:
+                    await proxy.request(stream, next_proxy.host, next_proxy.port)
+                    await next_proxy.authenticate(stream)
+        except BaseException:
+            await _aclose(stream)
+            raise
+        return stream
+
+    def _take(self) -> Optional[SocketStream]:
+        if self._taken is not None:
+            self._taken.set()
+        # the newest connection is the last one, keep_warm() closes the expired ones
+        if self._idle and self._idle[-1][0] >= anyio.current_time() - self.pool_max_idle:
+            return self._idle.pop()[1]
+        return None
+
+    async def _evict(self, before: float):
+        while self._idle and self._idle[0][0] < before:
+            _, stream = self._idle.popleft()
+            await stream.aclose()
+
+
+async def _aclose(stream: SocketStream):
+    with anyio.CancelScope(shield=True):
+        await stream.aclose()
+
+
+async def _exchange(stream: SocketStream, data: bytes, size: int) -> bytes:
+    """Sends data and receives exactly size bytes, a broken connection is a reset"""
+    try:
+        if data:
+            await stream.send(data)
+        return await stream.receive_exactly(size)
+    except (
+        anyio.EndOfStream,
+        anyio.IncompleteRead,
+        anyio.ClosedResourceError,
+        anyio.BrokenResourceError,
+    ) as e:
+        raise ConnectionResetError(errno.ECONNRESET, 'Connection reset by upstream proxy') from e
+
+
+def _protocol_error(message: str) -> OSError:
+    return OSError(errno.EPROTO, f'Upstream proxy: {message}')
+
+
+async def _socks5_authenticate(
+    stream: SocketStream,
+    username: Optional[str],
+    password: Optional[str],
+):
+    method = AuthMethod.USERNAME_PASSWORD if username else AuthMethod.ANONYMOUS
+    version, chosen = await _exchange(stream, bytes([5, 1, method]), 2)
+    if version != 5:
+        raise _protocol_error('not a SOCKS5 proxy')
+    if chosen != method:
+        raise OSError(errno.EACCES, 'Upstream proxy: no acceptable authentication method')
+
+    if method == AuthMethod.USERNAME_PASSWORD:
+        user, secret = username.encode(), (password or '').encode()
+        request = bytes([1, len(user)]) + user + bytes([len(secret)]) + secret
+        _, status = await _exchange(stream, request, 2)
+        if status != 0:
+            raise OSError(errno.EACCES, 'Upstream proxy: authentication failed')
+
+
+async def _socks5_request(stream: SocketStream, host: str, port: int):
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        name = host.encode('idna')
+        address = bytes([AddressType.DOMAIN, len(name)]) + name
+    else:
+        address = bytes([AddressType.from_ip_ver(ip.version)]) + ip.packed
+
+    request = bytes([5, 1, 0]) + address + port.to_bytes(2, 'big')
+    version, code, _, address_type = await _exchange(stream, request, 4)
+    if version != 5:
+        raise _protocol_error('invalid SOCKS5 reply')
+    if code != ReplyCode.SUCCEEDED:
+        message = ReplyMessages.get(code, 'Unknown error')
+        raise OSError(SOCKS5_ERRNOS.get(code, errno.ECONNREFUSED), f'Upstream proxy: {message}')
+
+    # the bound address isn't needed
+    if address_type == AddressType.IPV4:
+        await _exchange(stream, b'', 4 + 2)
+    elif address_type == AddressType.IPV6:
+        await _exchange(stream, b'', 16 + 2)
+    elif address_type == AddressType.DOMAIN:
+        size = (await _exchange(stream, b'', 1))[0]
+        await _exchange(stream, b'', size + 2)
+    else:
+        raise _protocol_error('invalid SOCKS5 reply')
+
+
+async def _socks4_request(stream: SocketStream, host: str, port: int, user_id: str):
+    try:
+        ip = ipaddress.IPv4Address(host)
+    except ValueError:
+        if ':' in host:
+            raise OSError(errno.EAFNOSUPPORT, 'SOCKS4 supports IPv4 addresses only') from None
+        # SOCKS4a, the proxy resolves the name
+        address, name = bytes([0, 0, 0, 1]), host.encode('idna') + b'\x00'
+    else:
+        address, name = ip.packed, b''
+
+    request = bytes([4, 1]) + port.to_bytes(2, 'big') + address
+    request += user_id.encode() + b'\x00' + name
+    _, code = (await _exchange(stream, request, 8))[:2]
+    if code != Socks4ReplyCode.REQUEST_GRANTED:
+        raise OSError(errno.ECONNREFUSED, f'Upstream proxy: SOCKS4 request rejected ({code:#x})')
+
+
+async def _http_request(
+    stream: SocketStream,
+    host: str,
+    port: int,
+    username: Optional[str],
+    password: Optional[str],
+):
+    authority = f'[{host}]:{port}' if ':' in host else f'{host}:{port}'
+    request = f'CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n'
+    if username:
+        request += f'Proxy-Authorization: {BasicAuth(username, password or "").encode()}\r\n'
+
+    try:
+        await stream.send((request + '\r\n').encode('latin1'))
+        head = await stream.receive_until(HEADERS_END, 65536)
+        response = parse_response(head + HEADERS_END)
+    except (
+        anyio.EndOfStream,
+        anyio.IncompleteRead,
+        anyio.ClosedResourceError,
+        anyio.BrokenResourceError,
+    ) as e:
+        raise ConnectionResetError(errno.ECONNRESET, 'Connection reset by upstream proxy') from e
+    except (anyio.DelimiterNotFound, ValueError) as e:
+        raise _protocol_error('invalid HTTP response') from e
+
+    if not 200 <= response.status < 300:
+        code = errno.ETIMEDOUT if response.status == 504 else errno.ECONNREFUSED
+        raise OSError(code, f'Upstream proxy: {response.status} {response.reason}')
@@ -0,0 +1,33 @@
+import socket
+
+import anyio
+import anyio.abc
+
+try:
+    from anyio import wait_readable, wait_writable
+except ImportError:  # pragma: no cover
+    # anyio < 4.7
+    from anyio import (  # type: ignore
+        wait_socket_readable as wait_readable,
+        wait_socket_writable as wait_writable,
+    )
+
+
+async def listener_from_socket(sock: socket.socket) -> anyio.abc.SocketListener:
+    """Wraps a bound, listening, non-blocking socket"""
+    from_socket = getattr(anyio.abc.SocketListener, 'from_socket', None)
+    if from_socket is not None:
+        return await from_socket(sock)
+
+    # anyio < 4.1 builds its own listeners the same way
+    try:
+        from anyio._core._eventloop import get_async_backend
+    except ImportError:  # pragma: no cover
+        # anyio < 4.0
+        from anyio._core._eventloop import get_asynclib
+
+        return get_asynclib().TCPSocketListener(sock)
+    return get_async_backend().create_tcp_listener(sock)  # pragma: no cover
+
+
+__all__ = ('wait_readable', 'wait_writable', 'listener_from_socket')
@@ -0,0 +1,178 @@
+import errno
+import ipaddress
+import itertools
+from typing import Callable, List, Optional, Sequence
+
+import anyio
+import anyio.abc
+
+from ._breaker import CircuitBreaker
+from ._dns.abc import AbstractResolver
+from ._dns.system import SystemResolver
+from ._errors import AccessDenied
+from ._stream import SocketStream
+
+DEFAULT_CONNECT_TIMEOUT = 30.0
+DEFAULT_HAPPY_EYEBALLS_DELAY = 0.25
+
+# tells whether a resolved address may be connected to
+AddressFilter = Callable[[str], bool]
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def interleave_addresses(addresses: Sequence[str]) -> List[str]:
+    """
+    Reorders addresses so that the address families alternate (RFC 8305, section 4),
+    starting with the family of the first (preferred) address
+    """
+    preferred = ipaddress.ip_address(addresses[0]).version
+    first, second = [], []
+    for address in addresses:
+        if ipaddress.ip_address(address).version == preferred:
+            first.append(address)
+        else:
+            second.append(address)
+
+    return [
+        address
+        for pair in itertools.zip_longest(first, second)
+        for address in pair
+        if address is not None
+    ]
+
+
+class Connector:
+    """
+    Opens outbound connections on behalf of the proxies.
+
+    Host names are resolved with the resolver (getaddrinfo() by default),
+    then connection attempts to the resolved addresses are raced
+    Happy Eyeballs style (RFC 8305): a new attempt starts every
+    happy_eyeballs_delay seconds, or as soon as the previous one fails,
+    and the first established connection wins.
+
+    The whole operation, name resolution included, is limited by connect_timeout.
+    With a circuit_breaker, connects to a destination that keeps failing fail fast.
+    With local_host, connections are made from that source address,
+    to the destinations of its address family only. With an address_filter,
+    only the addresses of a name it accepts are connected to
+    (AccessDenied if there are none), e.g. the network rules of an access list
+    """
+
+    def __init__(
+        self,
+        resolver: Optional[AbstractResolver] = None,
+        connect_timeout: Optional[float] = DEFAULT_CONNECT_TIMEOUT,
+        happy_eyeballs_delay: float = DEFAULT_HAPPY_EYEBALLS_DELAY,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        local_host: Optional[str] = None,
+    ):
+        self.resolver = resolver or SystemResolver()
+        self.connect_timeout = connect_timeout
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.circuit_breaker = circuit_breaker
+        self.local_host = local_host
+
+    async def connect(
+        self,
+        host: str,
+        port: int,
+        address_filter: Optional[AddressFilter] = None,
+    ) -> SocketStream:
+        if self.circuit_breaker is None:
+            return await self._connect_in_time(host, port, address_filter)
+
+        with self.circuit_breaker.guard(host, port):
+            return await self._connect_in_time(host, port, address_filter)
+
+    async def _connect_in_time(
+        self,
+        host: str,
+        port: int,
+        address_filter: Optional[AddressFilter],
+    ) -> SocketStream:
+        with anyio.move_on_after(self.connect_timeout):
+            return await self._connect(host, port, address_filter)
+
+        raise TimeoutError(errno.ETIMEDOUT, f'Connection to {host}:{port} timed out')
+
+    async def _connect(
+        self,
+        host: str,
+        port: int,
+        address_filter: Optional[AddressFilter] = None,
+    ) -> SocketStream:
+        if is_ip_address(host):
+            addresses = [host]
+        else:
+            result = await self.resolver.resolve(host)
+            if not result.addresses:
+                raise OSError(errno.EHOSTUNREACH, f'No addresses found for {host}')
+            addresses = interleave_addresses(result.addresses)
+            if address_filter is not None:
+                addresses = [a for a in addresses if address_filter(a)]
+                if not addresses:
+                    raise AccessDenied(f'Access to the addresses of {host}:{port} denied')
+
+        if self.local_host is not None:
+            version = ipaddress.ip_address(self.local_host).version
+            addresses = [a for a in addresses if ipaddress.ip_address(a).version == version]
+            if not addresses:
+                raise OSError(errno.ENETUNREACH, f'No IPv{version} addresses for {host}')
+
+        if len(addresses) == 1:
+            stream = await self.open_connection(addresses[0], port)
+            return SocketStream(stream)
+
+        return SocketStream(await self._race(addresses, port))
+
+    async def _race(self, addresses: Sequence[str], port: int) -> anyio.abc.SocketStream:
+        winner: Optional[anyio.abc.SocketStream] = None
+        errors: List[OSError] = []
+
+        async def attempt(address: str, failed: anyio.Event):
+            nonlocal winner
+            try:
+                stream = await self.open_connection(address, port)
+            except OSError as e:
+                errors.append(e)
+                failed.set()
+                return
+
+            if winner is None:
+                winner = stream
+                tg.cancel_scope.cancel()
+            else:
+                with anyio.CancelScope(shield=True):
+                    await stream.aclose()
+
+        async with anyio.create_task_group() as tg:
+            for address in addresses:
+                failed = anyio.Event()
+                tg.start_soon(attempt, address, failed)
+                with anyio.move_on_after(self.happy_eyeballs_delay):
+                    await failed.wait()
+
+        if winner is None:
+            # the last failure is reported, earlier ones are usually the same
+            raise errors[-1]
+
+        return winner
+
+    async def open_connection(self, address: str, port: int) -> anyio.abc.SocketStream:
+        try:
+            return await anyio.connect_tcp(
+                remote_host=address, remote_port=port, local_host=self.local_host
+            )
+        except OSError as e:
+            # newer anyio versions hide the actual error (and its errno) behind a generic one
+            if e.errno is None and isinstance(e.__cause__, OSError):
+                raise e.__cause__ from None
+            raise
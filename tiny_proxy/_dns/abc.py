@@ -0,0 +1,16 @@
+from typing import NamedTuple, Optional, Tuple
+
+
+class ResolveResult(NamedTuple):
+    addresses: Tuple[str, ...]
+    # seconds, None if the resolver doesn't know it
+    ttl: Optional[float] = None
+
+
+class AbstractResolver:
+    async def resolve(self, host: str) -> ResolveResult:
+        """
+        Returns the IP addresses of the host.
+        Raises socket.gaierror if the name can't be resolved
+        """
+        raise NotImplementedError()
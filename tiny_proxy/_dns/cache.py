@@ -0,0 +1,140 @@
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+import anyio
+
+from .abc import AbstractResolver, ResolveResult
+from .system import SystemResolver
+
+# errors that mean the name doesn't exist (as opposed to temporary failures)
+NEGATIVE_ERRORS = frozenset(
+    getattr(socket, name) for name in ('EAI_NONAME', 'EAI_NODATA') if hasattr(socket, name)
+)
+
+
+class _Entry:
+    __slots__ = ('value', 'expires')
+
+    def __init__(self, value: Union[ResolveResult, socket.gaierror], expires: float):
+        self.value = value
+        self.expires = expires
+
+
+class _Lookup:
+    __slots__ = ('event', 'value')
+
+    def __init__(self):
+        self.event = anyio.Event()
+        self.value: Union[ResolveResult, socket.gaierror, None] = None
+
+
+def _raise(error: socket.gaierror):
+    # every waiter gets its own exception instance
+    raise socket.gaierror(error.errno, error.strerror)
+
+
+class CachingResolver(AbstractResolver):
+    """
+    Caches the results of another resolver (getaddrinfo() by default).
+
+    The cache is a bounded LRU, entries expire after the TTL reported by
+    the resolver (or the default one), names that don't exist are cached
+    for negative_ttl seconds, and concurrent lookups of the same name
+    are coalesced into a single one.
+    """
+
+    def __init__(
+        self,
+        resolver: Optional[AbstractResolver] = None,
+        max_size: int = 1024,
+        ttl: float = 300.0,
+        negative_ttl: float = 30.0,
+        min_ttl: float = 0.0,
+        max_ttl: float = 3600.0,
+    ):
+        self.resolver = resolver or SystemResolver()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._lookups: Dict[str, _Lookup] = {}
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def cached(self, host: str) -> Optional[ResolveResult]:
+        """The unexpired result for host without a lookup, None if there's none"""
+        key = host.lower()
+        entry = self._entries.get(key)
+        if entry is None or entry.expires <= time.monotonic():
+            return None
+        if isinstance(entry.value, socket.gaierror):
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    async def resolve(self, host: str) -> ResolveResult:
+        key = host.lower()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                if isinstance(entry.value, socket.gaierror):
+                    self.negative_hits += 1
+                    _raise(entry.value)
+                self.hits += 1
+                return entry.value
+            del self._entries[key]
+
+        lookup = self._lookups.get(key)
+        if lookup is not None:
+            self.coalesced += 1
+            await lookup.event.wait()
+            if isinstance(lookup.value, socket.gaierror):
+                _raise(lookup.value)
+            if lookup.value is not None:
+                return lookup.value
+            # the lookup was cancelled, try on our own
+            return await self.resolve(host)
+
+        self.misses += 1
+        lookup = self._lookups[key] = _Lookup()
+        try:
+            result = await self.resolver.resolve(host)
+        except socket.gaierror as e:
+            lookup.value = e
+            if e.errno in NEGATIVE_ERRORS:
+                self._store(key, e, self.negative_ttl)
+            raise
+        else:
+            lookup.value = result
+            ttl = self.ttl if result.ttl is None else result.ttl
+            self._store(key, result, min(max(ttl, self.min_ttl), self.max_ttl))
+            return result
+        finally:
+            del self._lookups[key]
+            lookup.event.set()
+
+    def _store(self, key: str, value: Union[ResolveResult, socket.gaierror], ttl: float):
+        if ttl <= 0 or self.max_size <= 0:
+            return
+
+        self._entries[key] = _Entry(value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,345 @@
+import enum
+import ipaddress
+import secrets
+import socket
+import struct
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import anyio
+from anyio.streams.buffered import BufferedByteReceiveStream
+
+from .._compat import wait_readable
+from .abc import AbstractResolver, ResolveResult
+
+DNS_PORT = 53
+
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+CLASS_IN = 1
+
+
+class RecordType(enum.IntEnum):
+    A = 1
+    CNAME = 5
+    AAAA = 28
+
+
+class ResponseCode(enum.IntEnum):
+    NOERROR = 0
+    FORMERR = 1
+    SERVFAIL = 2
+    NXDOMAIN = 3
+    NOTIMP = 4
+    REFUSED = 5
+
+
+class ResolvConf(NamedTuple):
+    nameservers: Tuple[str, ...]
+    search: Tuple[str, ...] = ()
+    ndots: int = 1
+
+
+class Answer(NamedTuple):
+    rcode: int
+    truncated: bool
+    addresses: Tuple[str, ...]
+    ttl: Optional[float]
+
+
+class DNSError(Exception):
+    pass
+
+
+def parse_resolv_conf(text: str) -> ResolvConf:
+    nameservers = []
+    search: Sequence[str] = ()
+    ndots = 1
+
+    for line in text.splitlines():
+        fields = line.split('#', 1)[0].split(';', 1)[0].split()
+        if not fields:
+            continue
+
+        key, values = fields[0], fields[1:]
+        if key == 'nameserver' and values:
+            nameservers.append(values[0])
+        elif key in ('search', 'domain'):
+            # the last search/domain line wins
+            search = values
+        elif key == 'options':
+            for option in values:
+                name, _, value = option.partition(':')
+                if name == 'ndots' and value.isdigit():
+                    ndots = min(int(value), 15)
+
+    return ResolvConf(tuple(nameservers), tuple(search), ndots)
+
+
+def parse_hosts(text: str) -> Dict[str, Tuple[str, ...]]:
+    hosts: Dict[str, List[str]] = {}
+
+    for line in text.splitlines():
+        fields = line.split('#', 1)[0].split()
+        if len(fields) < 2:
+            continue
+
+        try:
+            address = str(ipaddress.ip_address(fields[0].split('%', 1)[0]))
+        except ValueError:
+            continue
+
+        for name in fields[1:]:
+            addresses = hosts.setdefault(name.lower(), [])
+            if address not in addresses:
+                addresses.append(address)
+
+    return {name: tuple(addresses) for name, addresses in hosts.items()}
+
+
+def encode_name(name: str) -> bytes:
+    data = bytearray()
+    for label in name.rstrip('.').split('.'):
+        encoded = label.encode('idna')
+        if not 0 < len(encoded) < 64:
+            raise DNSError(f'Invalid domain name: {name}')
+        data.append(len(encoded))
+        data += encoded
+    data.append(0)
+    return bytes(data)
+
+
+def build_query(query_id: int, name: str, record_type: RecordType) -> bytes:
+    header = struct.pack('!HHHHHH', query_id, FLAG_RD, 1, 0, 0, 0)
+    return header + encode_name(name) + struct.pack('!HH', record_type, CLASS_IN)
+
+
+def _skip_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:  # compression pointer
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def parse_response(data: bytes, query_id: int, record_type: RecordType) -> Answer:
+    try:
+        response_id, flags, qdcount, ancount, _, _ = struct.unpack_from('!HHHHHH', data)
+        if response_id != query_id:
+            raise DNSError('Transaction ID mismatch')
+
+        rcode = flags & 0x000F
+        truncated = bool(flags & FLAG_TC)
+
+        offset = 12
+        for _ in range(qdcount):
+            offset = _skip_name(data, offset) + 4
+
+        addresses = []
+        ttl = None
+        for _ in range(ancount):
+            offset = _skip_name(data, offset)
+            rtype, rclass, rttl, rdlength = struct.unpack_from('!HHIH', data, offset)
+            offset += 10
+            rdata = data[offset : offset + rdlength]
+            offset += rdlength
+
+            if rclass != CLASS_IN or rtype != record_type:
+                continue
+
+            if rtype == RecordType.A and rdlength == 4:
+                addresses.append(str(ipaddress.IPv4Address(rdata)))
+            elif rtype == RecordType.AAAA and rdlength == 16:
+                addresses.append(str(ipaddress.IPv6Address(rdata)))
+            else:
+                continue
+
+            ttl = rttl if ttl is None else min(ttl, rttl)
+    except (struct.error, IndexError) as e:
+        raise DNSError('Malformed DNS response') from e
+
+    return Answer(rcode, truncated, tuple(addresses), ttl)
+
+
+def _gaierror(code: str, host: str) -> socket.gaierror:
+    errno = getattr(socket, code, socket.EAI_NONAME)
+    return socket.gaierror(errno, f'{host}: {code}')
+
+
+class StubResolver(AbstractResolver):
+    """
+    Asynchronous stub resolver that queries the name servers directly
+    (UDP, falling back to TCP for truncated responses) instead of calling
+    getaddrinfo() in a worker thread.
+
+    The configuration is read from /etc/resolv.conf and /etc/hosts
+    unless nameservers and hosts are given explicitly
+    """
+
+    def __init__(
+        self,
+        nameservers: Optional[Sequence[str]] = None,
+        port: int = DNS_PORT,
+        timeout: float = 2.0,
+        attempts: int = 2,
+        search: Optional[Sequence[str]] = None,
+        ndots: Optional[int] = None,
+        hosts: Optional[Dict[str, Sequence[str]]] = None,
+        resolv_conf: str = '/etc/resolv.conf',
+        hosts_file: str = '/etc/hosts',
+        ipv6: bool = True,
+    ):
+        conf = None
+        if nameservers is None or search is None or ndots is None:
+            conf = self._read_resolv_conf(resolv_conf)
+
+        self.nameservers = tuple(nameservers if nameservers is not None else conf.nameservers)
+        self.search = tuple(search if search is not None else conf.search)
+        self.ndots = ndots if ndots is not None else conf.ndots
+        self.port = port
+        self.timeout = timeout
+        self.attempts = attempts
+        self.ipv6 = ipv6
+
+        if hosts is None:
+            hosts = self._read_hosts(hosts_file)
+        self.hosts = {name.lower(): tuple(addresses) for name, addresses in hosts.items()}
+
+        if not self.nameservers:
+            self.nameservers = ('127.0.0.1',)
+
+    @staticmethod
+    def _read_resolv_conf(path: str) -> ResolvConf:
+        try:
+            with open(path) as f:
+                return parse_resolv_conf(f.read())
+        except OSError:
+            return ResolvConf(nameservers=())
+
+    @staticmethod
+    def _read_hosts(path: str) -> Dict[str, Tuple[str, ...]]:
+        try:
+            with open(path) as f:
+                return parse_hosts(f.read())
+        except OSError:
+            return {}
+
+    def candidates(self, host: str) -> List[str]:
+        """Fully qualified names to try, according to the search list and ndots"""
+        if host.endswith('.') or not self.search:
+            return [host.rstrip('.')]
+
+        searched = [f'{host}.{domain.strip(".")}' for domain in self.search]
+        if host.count('.') >= self.ndots:
+            return [host] + searched
+        return searched + [host]
+
+    async def resolve(self, host: str) -> ResolveResult:
+        addresses = self.hosts.get(host.lower().rstrip('.'))
+        if addresses:
+            return ResolveResult(addresses=addresses)
+
+        error = _gaierror('EAI_NONAME', host)
+        for name in self.candidates(host):
+            try:
+                return await self._resolve_name(name)
+            except socket.gaierror as e:
+                # a temporary failure is more informative than "not found"
+                if e.errno != socket.EAI_NONAME:
+                    error = e
+
+        raise error
+
+    async def _resolve_name(self, name: str) -> ResolveResult:
+        record_types = [RecordType.AAAA, RecordType.A] if self.ipv6 else [RecordType.A]
+        answers: Dict[RecordType, Answer] = {}
+        errors: List[socket.gaierror] = []
+
+        async def query(record_type: RecordType):
+            try:
+                answers[record_type] = await self.query(name, record_type)
+            except socket.gaierror as e:
+                errors.append(e)
+
+        async with anyio.create_task_group() as tg:
+            for record_type in record_types:
+                tg.start_soon(query, record_type)
+
+        addresses = []
+        ttls = []
+        for record_type in record_types:
+            answer = answers.get(record_type)
+            if answer is not None:
+                addresses.extend(answer.addresses)
+                if answer.ttl is not None:
+                    ttls.append(answer.ttl)
+
+        if addresses:
+            return ResolveResult(addresses=tuple(addresses), ttl=min(ttls))
+        if errors:
+            raise errors[0]
+
+        rcodes = {answer.rcode for answer in answers.values()}
+        if rcodes == {ResponseCode.NXDOMAIN}:
+            raise _gaierror('EAI_NONAME', name)
+        if rcodes <= {ResponseCode.NOERROR, ResponseCode.NXDOMAIN}:
+            raise _gaierror('EAI_NODATA', name)
+        raise _gaierror('EAI_AGAIN', name)
+
+    async def query(self, name: str, record_type: RecordType) -> Answer:
+        """Asks the name servers in turn, returns the first answer that is not a server failure"""
+        answer = None
+        for _ in range(self.attempts):
+            for nameserver in self.nameservers:
+                try:
+                    answer = await self._query_udp(nameserver, name, record_type)
+                    if answer.truncated:
+                        answer = await self._query_tcp(nameserver, name, record_type)
+                except (OSError, DNSError, TimeoutError, anyio.EndOfStream, anyio.IncompleteRead):
+                    continue
+
+                if answer.rcode in (ResponseCode.NOERROR, ResponseCode.NXDOMAIN):
+                    return answer
+
+        if answer is None:
+            raise _gaierror('EAI_AGAIN', name)
+        return answer
+
+    async def _query_udp(self, nameserver: str, name: str, record_type: RecordType) -> Answer:
+        query_id = secrets.randbits(16)
+        query = build_query(query_id, name, record_type)
+
+        # the socket is connected to the numeric address by hand, anyio would call
+        # getaddrinfo() in a worker thread even for that
+        version = ipaddress.ip_address(nameserver).version
+        family = socket.AF_INET6 if version == 6 else socket.AF_INET
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.connect((nameserver, self.port))
+            with anyio.fail_after(self.timeout):
+                sock.send(query)
+                while True:
+                    await wait_readable(sock)
+                    try:
+                        data = sock.recv(65535)
+                    except BlockingIOError:
+                        continue
+                    try:
+                        return parse_response(data, query_id, record_type)
+                    except DNSError:
+                        # spoofed or stale response, keep waiting
+                        continue
+
+    async def _query_tcp(self, nameserver: str, name: str, record_type: RecordType) -> Answer:
+        query_id = secrets.randbits(16)
+        query = build_query(query_id, name, record_type)
+
+        with anyio.fail_after(self.timeout):
+            stream = await anyio.connect_tcp(nameserver, self.port)
+            async with stream:
+                await stream.send(len(query).to_bytes(2, 'big') + query)
+                buffered = BufferedByteReceiveStream(stream)
+                size = int.from_bytes(await buffered.receive_exactly(2), 'big')
+                data = await buffered.receive_exactly(size)
+                return parse_response(data, query_id, record_type)
@@ -0,0 +1,14 @@
+import socket
+
+import anyio
+
+from .abc import AbstractResolver, ResolveResult
+
+
+class SystemResolver(AbstractResolver):
+    """Resolves names with getaddrinfo() in a worker thread"""
+
+    async def resolve(self, host: str) -> ResolveResult:
+        infos = await anyio.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        addresses = dict.fromkeys(str(sockaddr[0]) for *_, sockaddr in infos)
+        return ResolveResult(addresses=tuple(addresses))
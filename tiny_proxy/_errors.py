@@ -1,2 +1,49 @@
 class ProxyError(Exception):
-    pass
+    reason = 'error'
+
+
+class ConnectError(ProxyError):
+    """The requested destination couldn't be reached"""
+
+    reason = 'connect_failed'
+
+
+class DeadlineExceeded(ProxyError):
+    """A handshake, idle or lifetime timeout of a client connection expired"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class AdmissionRejected(ProxyError):
+    """The proxy is at one of its concurrency limits"""
+
+    reason = 'overloaded'
+
+
+class AccessDenied(ProxyError):
+    """The access list doesn't let the client reach the destination"""
+
+    reason = 'denied'
+
+
+class UpstreamUnavailable(ConnectionError):
+    """The first proxy of a chain couldn't be reached or failed its handshake"""
+
+
+class UpstreamRefused(UpstreamUnavailable, ConnectionRefusedError):
+    """The first proxy of a chain refused the connection, rather than the destination"""
+
+
+class UpstreamDenied(UpstreamUnavailable, PermissionError):
+    """The first proxy of a chain rejected the credentials or the client"""
+
+
+def failure_reason(error: BaseException) -> str:
+    """Short label describing why a client connection failed (e.g. for metrics)"""
+    if isinstance(error, ProxyError):
+        return error.reason
+    if isinstance(error, ConnectionResetError):
+        return 'client_disconnected'
+    return 'error'
@@ -0,0 +1,455 @@
+import hmac
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+
+from ._acl import AccessList
+from ._connector import Connector
+from ._errors import AccessDenied, ProxyError
+from ._parsers.base import HandshakeError, NEED_DATA
+from ._parsers.http import (
+    HEADERS_END,
+    HOP_BY_HOP_HEADERS,
+    HttpRequest,
+    HttpRequestParser,
+    HttpResponse,
+    build_response,
+    connection_options,
+    is_keep_alive,
+    parse_response,
+    parse_url,
+)
+from ._shaping import Throttle
+from ._stream import SocketStream, DEFAULT_RECEIVE_SIZE
+from ._traffic import TrafficCounter
+from ._tunnel import create_tunnel
+
+logger = logging.getLogger(__name__)
+
+MAX_RESPONSE_HEAD_SIZE = 65536
+MAX_CHUNK_LINE_SIZE = 4096
+
+# message body framing, otherwise it's the Content-Length
+CHUNKED = -1
+UNTIL_CLOSE = -2
+
+Origin = Tuple[str, int]
+# an origin (host, port, ...), HttpForwarder adds the user whose access list checked it
+PoolKey = Tuple[Any, ...]
+
+
+class KeepAlivePool:
+    """
+    Idle keep-alive connections to origin servers, shared by the forwarded
+    requests of all clients. Up to max_idle_per_origin connections per origin
+    and max_idle in total are kept for up to idle_timeout seconds,
+    the oldest ones are evicted first. The most recently used connection
+    of an origin is reused first
+    """
+
+    def __init__(
+        self,
+        max_idle: int = 100,
+        max_idle_per_origin: int = 8,
+        idle_timeout: float = 30.0,
+    ):
+        self.max_idle = max_idle
+        self.max_idle_per_origin = max_idle_per_origin
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[PoolKey, List[Tuple[float, SocketStream]]] = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    async def acquire(self, origin: PoolKey) -> Optional[SocketStream]:
+        await self._evict(anyio.current_time() - self.idle_timeout)
+        streams = self._idle.get(origin)
+        if not streams:
+            return None
+
+        _, stream = streams.pop()
+        self._count -= 1
+        if not streams:
+            del self._idle[origin]
+        return stream
+
+    async def release(self, origin: PoolKey, stream: SocketStream):
+        streams = self._idle.setdefault(origin, [])
+        if len(streams) >= self.max_idle_per_origin:
+            _, oldest = streams.pop(0)
+            self._count -= 1
+            await oldest.aclose()
+
+        streams.append((anyio.current_time(), stream))
+        self._count += 1
+
+        while self._count > self.max_idle:
+            await self._evict_oldest()
+
+    async def aclose(self):
+        idle, self._idle, self._count = self._idle, {}, 0
+        for streams in idle.values():
+            for _, stream in streams:
+                await stream.aclose()
+
+    async def _evict(self, before: float):
+        for origin in list(self._idle):
+            streams = self._idle[origin]
+            while streams and streams[0][0] < before:
+                _, stream = streams.pop(0)
+                self._count -= 1
+                await stream.aclose()
+            if not streams:
+                del self._idle[origin]
+
+    async def _evict_oldest(self):
+        origin = min(self._idle, key=lambda key: self._idle[key][0][0])
+        streams = self._idle[origin]
+        _, stream = streams.pop(0)
+        self._count -= 1
+        if not streams:
+            del self._idle[origin]
+        await stream.aclose()
+
+
+def build_forward_request(request: HttpRequest, authority: str, path: str) -> bytes:
+    """
+    Rewrites a request for the origin server: origin-form target,
+    Host header field from the URL, no hop-by-hop header fields
+    """
+    options = connection_options(request.headers)
+    upgrade = request.get_header('upgrade') if 'upgrade' in options else None
+
+    lines = [f'{request.method} {path} {request.version}', f'Host: {authority}']
+    for name, value in request.headers:
+        lowered = name.lower()
+        if lowered in HOP_BY_HOP_HEADERS or lowered in options or lowered == 'host':
+            continue
+        if lowered == 'expect' and value.lower() == '100-continue':
+            # answered by the proxy itself
+            continue
+        lines.append(f'{name}: {value}')
+
+    if upgrade:
+        lines += [f'Upgrade: {upgrade}', 'Connection: upgrade']
+    else:
+        lines.append('Connection: keep-alive')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin1')
+
+
+def build_forward_response(response: HttpResponse, keep_alive: bool) -> bytes:
+    options = connection_options(response.headers)
+
+    lines = [f'{response.version} {response.status} {response.reason}']
+    for name, value in response.headers:
+        lowered = name.lower()
+        if lowered in HOP_BY_HOP_HEADERS or lowered in options:
+            continue
+        lines.append(f'{name}: {value}')
+
+    lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin1')
+
+
+def request_framing(request: HttpRequest) -> int:
+    encoding = request.get_header('transfer-encoding')
+    if encoding is not None:
+        # chunked must be the final coding, the body's end isn't known otherwise
+        if encoding.lower().rsplit(',', 1)[-1].strip() != 'chunked':
+            raise ValueError(f'Invalid Transfer-Encoding: {encoding!r}')
+        # the origin could frame it by the other one, a classic request smuggling vector
+        if request.get_header('content-length') is not None:
+            raise ValueError('Both Transfer-Encoding and Content-Length in a request')
+        return CHUNKED
+    return _content_length(request.get_header('content-length', '0'))
+
+
+def response_framing(method: str, response: HttpResponse) -> int:
+    if method.upper() == 'HEAD' or response.status < 200 or response.status in (204, 304):
+        return 0
+    if 'chunked' in response.get_header('transfer-encoding', '').lower():
+        return CHUNKED
+    length = response.get_header('content-length')
+    if length is None:
+        return UNTIL_CLOSE
+    return _content_length(length)
+
+
+def _content_length(value: str) -> int:
+    if not value.isdigit():
+        raise ValueError(f'Invalid Content-Length: {value!r}')
+    return int(value)
+
+
+class HttpForwarder:
+    """
+    Forwards plain HTTP requests (absolute-form targets) of a client connection
+    to the origin servers and streams the responses back.
+
+    Request and response bodies are relayed as they are, their framing
+    (Content-Length, chunked or until close) is only tracked to find
+    where a message ends. The client connection is kept alive across requests
+    if both the client and the response allow it, and upstream connections
+    go back to the pool after a complete response. A request sent
+    over a pooled connection the server has closed in the meantime
+    is retried over a new one, unless its body was already sent
+    """
+
+    def __init__(
+        self,
+        client: SocketStream,
+        request: HttpRequest,
+        connector: Connector,
+        pool: Optional[KeepAlivePool] = None,
+        credentials: Optional[str] = None,
+        acl: Optional[AccessList] = None,
+        user: Optional[str] = None,
+    ):
+        self.client = client
+        self.request = request
+        self.connector = connector
+        self.pool = pool
+        # Proxy-Authorization of the authenticated first request, the others must repeat it
+        self.credentials = credentials
+        # every request on the connection may go to another origin
+        self.acl = acl
+        self.user = user
+        self.upstream: Optional[SocketStream] = None
+        self.reused = False
+        self._traffic: Optional[TrafficCounter] = None
+        self._throttle: Optional[Throttle] = None
+
+    async def connect(self, host: str, port: int) -> 'HttpForwarder':
+        """Opens (or takes from the pool) the connection for the first request"""
+        self.upstream, self.reused = await self._open((host, port))
+        return self
+
+    async def relay(
+        self,
+        client: SocketStream,
+        traffic: Optional[TrafficCounter] = None,
+        throttle: Optional[Throttle] = None,
+    ):
+        self._traffic, self._throttle = traffic, throttle
+
+        request: Optional[HttpRequest] = self.request
+        try:
+            while request is not None:
+                if not await self.forward(request):
+                    return
+                request = await self.receive_request()
+        except (
+            anyio.EndOfStream,
+            anyio.IncompleteRead,
+            anyio.ClosedResourceError,
+            anyio.BrokenResourceError,
+        ) as e:
+            logger.debug(f'Connection closed during a forwarded request: {e!r}')
+
+    async def aclose(self):
+        if self.upstream is not None:
+            await self.upstream.aclose()
+            self.upstream = None
+
+    async def receive_request(self) -> Optional[HttpRequest]:
+        """Returns the next request of the client, None if it has closed the connection"""
+        parser = HttpRequestParser()
+        while True:
+            try:
+                event = parser.next_event()
+            except HandshakeError:
+                await self.client.send(parser.data_to_send())
+                raise
+
+            if event is not NEED_DATA:
+                self.client.unreceive(parser.leftover)
+                return event
+
+            try:
+                data = await self.client.receive()
+            except (anyio.EndOfStream, anyio.BrokenResourceError):
+                return None
+            parser.feed(data)
+
+    async def forward(self, request: HttpRequest) -> bool:
+        """Forwards a request and its response, returns whether the client connection persists"""
+        try:
+            host, port, authority, path = parse_url(request.target)
+            body = request_framing(request)
+        except ValueError as e:
+            logger.debug(e)
+            await self._respond_error(400, 'Bad Request')
+            return False
+
+        if self.credentials is not None:
+            received = request.get_header('proxy-authorization', '').encode('latin1')
+            if not hmac.compare_digest(received, self.credentials.encode('latin1')):
+                await self._respond_error(401, 'Unauthorized')
+                return False
+
+        if self.acl is not None and not self.acl.allows(host, port, self.user):
+            await self._respond_error(403, 'Forbidden')
+            return False
+
+        origin = (host, port)
+        if request.get_header('expect', '').lower() == '100-continue':
+            await self._send(self.client, build_response(100, 'Continue'), False)
+
+        head = build_forward_request(request, authority, path)
+        data = await self._exchange(origin, head, body)
+        if data is None:
+            return False
+
+        upstream = self.upstream
+        try:
+            response = parse_response(data)
+            while 100 <= response.status < 200 and response.status != 101:
+                await self._send(self.client, data, False)
+                data = await upstream.receive_until(HEADERS_END, MAX_RESPONSE_HEAD_SIZE)
+                data += HEADERS_END
+                response = parse_response(data)
+            framing = response_framing(request.method, response)
+        except (ValueError, anyio.DelimiterNotFound) as e:
+            logger.debug(e)
+            await self._respond_error(502, 'Bad Gateway')
+            return False
+
+        if response.status == 101:
+            # the protocol is switched (e.g. WebSocket), it's a tunnel from now on
+            await self._send(self.client, data, False)
+            await create_tunnel(
+                self.client, upstream, traffic=self._traffic, throttle=self._throttle
+            )
+            return False
+
+        keep_alive = framing != UNTIL_CLOSE and is_keep_alive(request.version, request.headers)
+        await self._send(self.client, build_forward_response(response, keep_alive), False)
+        await self._relay_body(upstream, self.client, framing, False)
+
+        self.upstream = None
+        if self.pool is not None and framing != UNTIL_CLOSE and is_keep_alive(
+            response.version, response.headers
+        ):
+            await self.pool.release(self._pool_key(origin), upstream)
+        else:
+            await upstream.aclose()
+        return keep_alive
+
+    async def _exchange(self, origin: Origin, head: bytes, body: int) -> Optional[bytes]:
+        """Sends the request and returns the response head, None if the client got an error"""
+        while True:
+            if self.upstream is None:
+                try:
+                    self.upstream, self.reused = await self._open(origin)
+                except AccessDenied:
+                    await self._respond_error(403, 'Forbidden')
+                    return None
+                except OSError as e:
+                    logger.error(f"Couldn't connect to host {origin[0]}:{origin[1]}: {e}")
+                    if isinstance(e, TimeoutError):
+                        await self._respond_error(504, 'Gateway Timeout')
+                    else:
+                        await self._respond_error(502, 'Bad Gateway')
+                    return None
+
+            body_sent = False
+            try:
+                await self._send(self.upstream, head, True)
+                body_sent = body != 0
+                await self._relay_body(self.client, self.upstream, body, True)
+                data = await self.upstream.receive_until(HEADERS_END, MAX_RESPONSE_HEAD_SIZE)
+                return data + HEADERS_END
+            except (
+                anyio.EndOfStream,
+                anyio.IncompleteRead,
+                anyio.ClosedResourceError,
+                anyio.BrokenResourceError,
+                anyio.DelimiterNotFound,
+            ) as e:
+                reused = self.reused
+                await self.aclose()
+                if reused and not body_sent and not isinstance(e, anyio.DelimiterNotFound):
+                    # the server closed the idle connection, the request goes over a new one
+                    continue
+                logger.debug(f'Upstream {origin} failed: {e!r}')
+                await self._respond_error(502, 'Bad Gateway')
+                return None
+
+    async def _open(self, origin: Origin) -> Tuple[SocketStream, bool]:
+        if self.pool is not None:
+            stream = await self.pool.acquire(self._pool_key(origin))
+            if stream is not None:
+                return stream, True
+        address_filter = None
+        if self.acl is not None:
+            acl, (host, port), user = self.acl, origin, self.user
+            address_filter = lambda address: acl.allows(host, port, user, address)  # noqa: E731
+        return await self.connector.connect(*origin, address_filter), False
+
+    def _pool_key(self, origin: Origin) -> PoolKey:
+        # the addresses of a connection were checked against the rules of its user
+        return origin + (self.user if self.acl is not None else None,)
+
+    async def _respond_error(self, code: int, message: str):
+        headers = (('Content-Length', '0'), ('Connection', 'close'))
+        await self._send(self.client, build_response(code, message, headers), False)
+
+    async def _send(self, stream: SocketStream, data: bytes, upstream: bool):
+        if self._throttle is not None:
+            await self._throttle.consume(len(data))
+        await stream.send(data)
+        if self._traffic is not None:
+            self._traffic.add(upstream, len(data))
+
+    async def _relay_body(
+        self,
+        reader: SocketStream,
+        writer: SocketStream,
+        framing: int,
+        upstream: bool,
+    ):
+        if framing == CHUNKED:
+            await self._relay_chunked(reader, writer, upstream)
+        elif framing == UNTIL_CLOSE:
+            try:
+                while True:
+                    await self._send(writer, await reader.receive(), upstream)
+            except anyio.EndOfStream:
+                pass
+        else:
+            await self._relay_exactly(reader, writer, framing, upstream)
+
+    async def _relay_exactly(
+        self,
+        reader: SocketStream,
+        writer: SocketStream,
+        size: int,
+        upstream: bool,
+    ):
+        while size > 0:
+            data = await reader.receive(min(size, DEFAULT_RECEIVE_SIZE))
+            size -= len(data)
+            await self._send(writer, data, upstream)
+
+    async def _relay_chunked(self, reader: SocketStream, writer: SocketStream, upstream: bool):
+        while True:
+            line = await reader.receive_until(b'\r\n', MAX_CHUNK_LINE_SIZE)
+            try:
+                size = int(line.partition(b';')[0].strip(), 16)
+            except ValueError:
+                raise ProxyError(f'Invalid chunk size: {line[:32]!r}') from None
+
+            await self._send(writer, line + b'\r\n', upstream)
+            if size == 0:
+                break
+            # the chunk and its CRLF
+            await self._relay_exactly(reader, writer, size + 2, upstream)
+
+        # trailer fields up to the empty line
+        while True:
+            line = await reader.receive_until(b'\r\n', MAX_CHUNK_LINE_SIZE)
+            await self._send(writer, line + b'\r\n', upstream)
+            if not line:
+                return
@@ -0,0 +1,48 @@
+import logging
+from typing import Optional, Sequence
+
+from .base import BaseProxyHandler
+from .._auth.abc import AbstractAuthenticator
+from .._auth.static import StaticAuthenticator
+from .._proxy.abc import AbstractProxy
+from .._proxy.auto import PROTOCOLS, AutoProxy
+from .._stream import SocketStream
+
+
+class AutoProxyHandler(BaseProxyHandler):
+    """
+    Serves all the protocols on a single port (see AutoProxy).
+    SOCKS4 has no passwords, so if authentication is configured
+    it's only served when listed in protocols explicitly
+    """
+
+    protocol = 'auto'
+
+    def __init__(
+        self,
+        username: str = None,
+        password: str = None,
+        authenticator: Optional[AbstractAuthenticator] = None,
+        protocols: Optional[Sequence[str]] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.username = username
+        self.password = password
+        if authenticator is None and username and password:
+            authenticator = StaticAuthenticator(username, password)
+        self.authenticator = authenticator
+        if protocols is None:
+            protocols = PROTOCOLS if authenticator is None else ('socks5', 'http')
+        self.protocols = tuple(protocols)
+        self.logger = logging.getLogger(__name__)
+
+    def create_proxy(self, stream: SocketStream) -> AbstractProxy:
+        return AutoProxy(
+            stream=stream,
+            username=self.username,
+            password=self.password,
+            connector=self.connector,
+            authenticator=self.authenticator,
+            protocols=self.protocols,
+        )
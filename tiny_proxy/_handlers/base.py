@@ -1,43 +1,166 @@
 import logging
-from typing import Union
+from typing import Optional, Sequence, Tuple, Union
 
 import anyio
 import anyio.abc
 from anyio.streams.tls import TLSStream
 
+from .._acl import AccessList
+from .._admission import AdmissionController
+from .._buffers import BufferPool
+from .._connector import Connector
+from .._errors import DeadlineExceeded, failure_reason
+from .._metrics.proxy import ProxyMetrics
+from .._observers import Connection, ProxyObserver
+from .._shaping import Shaper, Throttle
 from .._stream import SocketStream
 from .._proxy.abc import AbstractProxy
+from .._timers import Deadlines, Timeouts, TimerWheel
+from .._traffic import TrafficCounter
+from .._forward import HttpForwarder
 from .._tunnel import create_tunnel
+from .._udp import UdpAssociation
 
 AnyioSocketStream = Union[anyio.abc.SocketStream, TLSStream]
+# UDP associations and forwarded HTTP requests are relayed by themselves
+Remote = Union[SocketStream, UdpAssociation, HttpForwarder]
 
 
 class BaseProxyHandler:
     logger: logging.Logger
+    protocol: str = ''
+
+    def __init__(
+        self,
+        splice: bool = False,
+        buffer_pool: Optional[BufferPool] = None,
+        asyncio_relay: bool = False,
+        connector: Optional[Connector] = None,
+        metrics: Optional[ProxyMetrics] = None,
+        observers: Sequence[ProxyObserver] = (),
+        timeouts: Optional[Timeouts] = None,
+        timer_wheel: Optional[TimerWheel] = None,
+        admission: Optional[AdmissionController] = None,
+        shaper: Optional[Shaper] = None,
+        acl: Optional[AccessList] = None,
+    ):
+        self.connector = connector or Connector()
+        self.splice = splice
+        self.buffer_pool = buffer_pool
+        self.asyncio_relay = asyncio_relay
+        self.metrics = metrics
+        self.observers: Tuple[ProxyObserver, ...] = tuple(observers)
+        if metrics is not None:
+            self.observers += (metrics,)
+
+        self.timeouts = timeouts if timeouts is not None and any(timeouts) else None
+        self.timer_wheel = None
+        if self.timeouts is not None:
+            self.timer_wheel = timer_wheel or TimerWheel()
+        self.admission = admission
+        self.shaper = shaper
+        self.acl = acl
 
     async def handle(self, stream: AnyioSocketStream):
+        if self.timeouts is None:
+            await self._handle(stream, None)
+            return
+
+        async with self.timer_wheel.driven():
+            deadlines = Deadlines(self.timer_wheel, self.timeouts)
+            try:
+                await self._handle(stream, deadlines)
+            finally:
+                deadlines.cancel()
+
+    async def _handle(self, stream: AnyioSocketStream, deadlines: Optional[Deadlines]):
         client = SocketStream(stream)
         proxy = self.create_proxy(client)
+        proxy.deadlines = deadlines
+        proxy.acl = self.acl
+        if self.admission is not None:
+            proxy.admission = self.admission.admission()
+
+        # no observers - no per-connection bookkeeping at all
+        connection = traffic = None
+        if self.observers:
+            connection = Connection(self.observers, self.protocol, client.getpeername())
+            traffic = connection.traffic
+            proxy.connection = connection
+            connection.accepted()
 
+        reason = None
         try:
-            remote = await proxy.connect_to_remote()
+            if deadlines is None:
+                remote = await self.connect(proxy)
+            else:
+                remote = await deadlines.run(self.connect, proxy)
         except anyio.get_cancelled_exc_class():  # noqa
             await client.aclose()
+            reason = 'cancelled'
         except Exception as e:
             await client.aclose()
             self.logger.error(e)
             self.logger.debug(e, exc_info=True)
+            reason = failure_reason(e)
         else:
+            throttle = None
+            if self.shaper is not None:
+                throttle = self.shaper.open(proxy.user)
             try:
-                await create_tunnel(client, remote)
+                if deadlines is None:
+                    await self.relay(client, remote, traffic, throttle)
+                else:
+                    if traffic is None:
+                        traffic = TrafficCounter()
+                    deadlines.watch_idle(traffic)
+                    await deadlines.run(self.relay, client, remote, traffic, throttle)
             except anyio.get_cancelled_exc_class():  # noqa  # pragma: nocover
                 pass
+            except DeadlineExceeded as e:
+                self.logger.info(e)
+                reason = e.reason
             except Exception as e:  # pragma: nocover
                 self.logger.error(e)
                 self.logger.debug(e, exc_info=True)
+                reason = failure_reason(e)
             finally:
+                if throttle is not None:
+                    throttle.close()
                 await remote.aclose()
                 await client.aclose()
+        finally:
+            if proxy.admission is not None:
+                proxy.admission.release()
+            if connection is not None:
+                connection.closed(reason)
+
+    async def connect(self, proxy: AbstractProxy) -> Remote:
+        if proxy.admission is not None:
+            # over the limit the connection is closed without a reply
+            await proxy.admission.start_handshake()
+        return await proxy.connect_to_remote()
+
+    async def relay(
+        self,
+        client: SocketStream,
+        remote: Remote,
+        traffic: Optional[TrafficCounter] = None,
+        throttle: Optional[Throttle] = None,
+    ):
+        if not isinstance(remote, SocketStream):
+            await remote.relay(client, traffic, throttle)
+            return
+
+        await create_tunnel(
+            client,
+            remote,
+            splice=self.splice,
+            buffer_pool=self.buffer_pool,
+            asyncio_relay=self.asyncio_relay,
+            traffic=traffic,
+            throttle=throttle,
+        )
 
     def create_proxy(self, stream: SocketStream) -> AbstractProxy:
         raise NotImplementedError()
@@ -1,19 +1,38 @@
 import logging
+from typing import Optional
 
 from .base import BaseProxyHandler
+from .._auth.abc import AbstractAuthenticator
+from .._auth.static import StaticAuthenticator
+from .._forward import KeepAlivePool
 from .._proxy.abc import AbstractProxy
 from .._proxy.http import HttpProxy
 from .._stream import SocketStream
 
 
 class HttpProxyHandler(BaseProxyHandler):
+    protocol = 'http'
+
     def __init__(
         self,
         username: str = None,
         password: str = None,
+        authenticator: Optional[AbstractAuthenticator] = None,
+        forward: bool = False,
+        keep_alive_pool: Optional[KeepAlivePool] = None,
+        **kwargs,
     ):
+        super().__init__(**kwargs)
         self.username = username
         self.password = password
+        if authenticator is None and username and password:
+            authenticator = StaticAuthenticator(username, password)
+        self.authenticator = authenticator
+        # plain HTTP requests share the idle upstream connections
+        self.forward = forward
+        if forward and keep_alive_pool is None:
+            keep_alive_pool = KeepAlivePool()
+        self.keep_alive_pool = keep_alive_pool
         self.logger = logging.getLogger(__name__)
 
     def create_proxy(self, stream: SocketStream) -> AbstractProxy:
@@ -21,4 +40,8 @@ class HttpProxyHandler(BaseProxyHandler):
             stream=stream,
             username=self.username,
             password=self.password,
+            connector=self.connector,
+            authenticator=self.authenticator,
+            forward=self.forward,
+            keep_alive_pool=self.keep_alive_pool,
         )
@@ -1,15 +1,31 @@
 import logging
+from typing import Optional
 
 from .base import BaseProxyHandler
+from .._bind import BindPool
 from .._proxy.abc import AbstractProxy
 from .._proxy.socks4 import Socks4Proxy
 from .._stream import SocketStream
 
 
 class Socks4ProxyHandler(BaseProxyHandler):
-    def __init__(self, username: str = None):
+    protocol = 'socks4'
+
+    def __init__(
+        self,
+        username: str = None,
+        bind_pool: Optional[BindPool] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
         self.username = username
+        self.bind_pool = bind_pool
         self.logger = logging.getLogger(__name__)
 
     def create_proxy(self, stream: SocketStream) -> AbstractProxy:
-        return Socks4Proxy(stream=stream, username=self.username)
+        return Socks4Proxy(
+            stream=stream,
+            username=self.username,
+            connector=self.connector,
+            bind_pool=self.bind_pool,
+        )
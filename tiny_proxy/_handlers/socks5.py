@@ -1,19 +1,35 @@
 import logging
+from typing import Optional
 
 from .base import BaseProxyHandler
+from .._auth.abc import AbstractAuthenticator
+from .._auth.static import StaticAuthenticator
+from .._bind import BindPool
 from .._proxy.abc import AbstractProxy
 from .._proxy.socks5 import Socks5Proxy
 from .._stream import SocketStream
 
 
 class Socks5ProxyHandler(BaseProxyHandler):
+    protocol = 'socks5'
+
     def __init__(
         self,
         username: str = None,
         password: str = None,
+        authenticator: Optional[AbstractAuthenticator] = None,
+        udp: bool = False,
+        bind_pool: Optional[BindPool] = None,
+        **kwargs,
     ):
+        super().__init__(**kwargs)
         self.username = username
         self.password = password
+        if authenticator is None and username and password:
+            authenticator = StaticAuthenticator(username, password)
+        self.authenticator = authenticator
+        self.udp = udp
+        self.bind_pool = bind_pool
         self.logger = logging.getLogger(__name__)
 
     def create_proxy(self, stream: SocketStream) -> AbstractProxy:
@@ -21,4 +37,8 @@ class Socks5ProxyHandler(BaseProxyHandler):
             stream=stream,
             username=self.username,
             password=self.password,
+            connector=self.connector,
+            authenticator=self.authenticator,
+            udp=self.udp,
+            bind_pool=self.bind_pool,
         )
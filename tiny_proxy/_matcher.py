@@ -0,0 +1,176 @@
+import ipaddress
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar, Union
+
+T = TypeVar('T')
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+PortRanges = Tuple[Tuple[int, int], ...]
+
+# (priority, value, ports) - the matching entry with the lowest priority wins
+Entry = Tuple[Tuple[int, int], T, Optional[PortRanges]]
+
+
+def parse_ports(ports: str) -> PortRanges:
+    """Parses '80,443,8000-8999'"""
+    ranges = []
+    for part in ports.split(','):
+        first, _, last = part.strip().partition('-')
+        low, high = int(first), int(last or first)
+        if not 0 <= low <= high <= 65535:
+            raise ValueError(f'Invalid port range: {part!r}')
+        ranges.append((low, high))
+    return tuple(ranges)
+
+
+def parse_rule(rule: str) -> Tuple[str, str, Optional[PortRanges]]:
+    """Parses '<action> <destination> [<ports>]'"""
+    parts = rule.split()
+    if len(parts) not in (2, 3):
+        raise ValueError(f'Invalid rule: {rule!r}')
+    ports = parse_ports(parts[2]) if len(parts) == 3 else None
+    return parts[0], parts[1], ports
+
+
+def _parse_network(destination: str) -> Optional[IPNetwork]:
+    # top-level domains aren't numeric, the costly parsing is skipped for most names
+    if not destination[-1].isdigit() and ':' not in destination:
+        return None
+    try:
+        return ipaddress.ip_network(destination, strict=False)
+    except ValueError:
+        return None
+
+
+class _DomainNode:
+    __slots__ = ('children', 'exact', 'subdomains')
+
+    def __init__(self):
+        self.children: Dict[str, _DomainNode] = {}
+        self.exact: List[Entry] = []
+        self.subdomains: List[Entry] = []
+
+
+def _first_match(entries: List[Entry], port: int, best: Optional[Entry]) -> Optional[Entry]:
+    # the entries of a list are in priority order
+    for entry in entries:
+        if best is not None and entry[0] > best[0]:
+            break
+        ports = entry[2]
+        if ports is None or any(low <= port <= high for low, high in ports):
+            return entry
+    return best
+
+
+class DestinationMatcher(Generic[T]):
+    """
+    Maps destinations to values. A destination is '*', an address or a network
+    (10.0.0.0/8, 2001:db8::/32), a domain name (example.com), its subdomains
+    (*.example.com) or both (.example.com), optionally limited to port ranges.
+
+    The first matching rule wins, or with longest the most specific one
+    (the longest prefix, the most labels, then the first one).
+
+    The rules are compiled for lookups that don't depend on their number:
+    networks go to per prefix length hash tables (at most 33 + 129 lookups
+    for an address), domain names to a trie of reversed labels
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[Tuple[str, Optional[PortRanges], T]],
+        longest: bool = False,
+    ):
+        self._any: List[Entry] = []
+        # ip version -> [(prefix length, {network >> host bits: entries})], longest first
+        self._networks: Dict[int, List[Tuple[int, Dict[int, List[Entry]]]]] = {4: [], 6: []}
+        self._domains = _DomainNode()
+        self._longest = longest
+
+        tables: Dict[Tuple[int, int], Dict[int, List[Entry]]] = {}
+        for index, (destination, ports, value) in enumerate(rules):
+            destination = destination.lower().rstrip('.')
+            if destination == '*':
+                self._any.append((self._priority(0, index), value, ports))
+                continue
+
+            network = _parse_network(destination)
+            if network is None:
+                self._add_domain(destination, index, value, ports)
+                continue
+
+            table = tables.get((network.version, network.prefixlen))
+            if table is None:
+                table = tables[network.version, network.prefixlen] = {}
+                self._networks[network.version].append((network.prefixlen, table))
+            key = int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+            entry = (self._priority(network.prefixlen + 1, index), value, ports)
+            table.setdefault(key, []).append(entry)
+
+        for networks in self._networks.values():
+            networks.sort(reverse=True, key=lambda item: item[0])
+
+    def match(self, host: str, port: int, address: Optional[str] = None) -> Optional[T]:
+        """
+        The value of the winning rule for host:port, None if none matches.
+        address is one the name host resolved to, the network rules match it as well
+        """
+        best = _first_match(self._any, port, None)
+
+        try:
+            ip = ipaddress.ip_address(host)
+        except ValueError:
+            best = self._match_domain(host, port, best)
+            if address is not None:
+                best = self._match_networks(ipaddress.ip_address(address), port, best)
+        else:
+            best = self._match_networks(ip, port, best)
+
+        return None if best is None else best[1]
+
+    def _match_networks(self, ip: IPAddress, port: int, best: Optional[Entry]) -> Optional[Entry]:
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        value, bits = int(ip), ip.max_prefixlen
+        for prefixlen, table in self._networks[ip.version]:
+            entries = table.get(value >> (bits - prefixlen))
+            if entries is not None:
+                best = _first_match(entries, port, best)
+        return best
+
+    def _priority(self, specificity: int, index: int) -> Tuple[int, int]:
+        return (-specificity if self._longest else 0, index)
+
+    def _add_domain(self, domain: str, index: int, value: T, ports: Optional[PortRanges]):
+        exact = subdomains = True
+        if domain.startswith('*.'):
+            domain, exact = domain[2:], False
+        elif domain.startswith('.'):
+            domain = domain[1:]
+        else:
+            subdomains = False
+
+        labels = domain.split('.')
+        if not all(labels) or '*' in domain or '/' in domain:
+            raise ValueError(f'Invalid destination: {domain!r}')
+
+        node = self._domains
+        for label in reversed(labels):
+            node = node.children.setdefault(label, _DomainNode())
+        # a name is more specific than its subdomains
+        if exact:
+            node.exact.append((self._priority(2 * len(labels) + 1, index), value, ports))
+        if subdomains:
+            node.subdomains.append((self._priority(2 * len(labels), index), value, ports))
+
+    def _match_domain(self, host: str, port: int, best: Optional[Entry]) -> Optional[Entry]:
+        labels = host.lower().rstrip('.').split('.')
+        node = self._domains
+        for remaining in range(len(labels) - 1, -1, -1):
+            node = node.children.get(labels[remaining])
+            if node is None:
+                break
+            entries = node.subdomains if remaining else node.exact
+            if entries:
+                best = _first_match(entries, port, best)
+        return best
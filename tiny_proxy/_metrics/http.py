@@ -0,0 +1,63 @@
+import logging
+
+import anyio
+import anyio.abc
+
+from .._parsers.base import HandshakeError, NEED_DATA
+from .._parsers.http import HttpRequestParser, build_response
+from .registry import MetricsRegistry
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsHandler:
+    """Serves the registry over HTTP for Prometheus, one request per connection"""
+
+    def __init__(self, registry: MetricsRegistry, path: str = '/metrics', timeout: float = 10):
+        self.registry = registry
+        self.path = path
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+    async def handle(self, stream: anyio.abc.ByteStream):
+        parser = HttpRequestParser()
+        try:
+            with anyio.fail_after(self.timeout):
+                while True:
+                    try:
+                        request = parser.next_event()
+                    except HandshakeError:
+                        await stream.send(parser.data_to_send())
+                        return
+                    if request is not NEED_DATA:
+                        break
+                    parser.feed(await stream.receive())
+
+                await stream.send(self.respond(request.method, request.target))
+        except (TimeoutError, anyio.EndOfStream, anyio.BrokenResourceError) as e:
+            self.logger.debug(e)
+        finally:
+            await stream.aclose()
+
+    def respond(self, method: str, target: str) -> bytes:
+        if target.split('?', 1)[0] != self.path:
+            return build_response(404, 'Not Found', [('Content-Length', '0')])
+
+        if method not in ('GET', 'HEAD'):
+            return build_response(405, 'Method Not Allowed', [('Content-Length', '0')])
+
+        body = self.registry.expose().encode('utf-8')
+        headers = [
+            ('Content-Type', CONTENT_TYPE),
+            ('Content-Length', str(len(body))),
+            ('Connection', 'close'),
+        ]
+        return build_response(200, 'OK', headers, body if method == 'GET' else b'')
+
+
+async def serve_metrics(registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9100):
+    """Runs the /metrics listener until cancelled"""
+    handler = MetricsHandler(registry)
+    listener = await anyio.create_tcp_listener(local_host=host, local_port=port)
+    async with listener:
+        await listener.serve(handler.handle)
@@ -0,0 +1,110 @@
+from typing import Dict, List, Optional, Tuple
+
+from .._observers import Connection, ProxyObserver
+from .._traffic import TrafficCounter
+from .registry import MetricsRegistry
+
+
+class ProxyMetrics(ProxyObserver):
+    """
+    Metrics of the proxy handlers: connections, handshake failures,
+    relayed bytes and durations of the connection phases, labelled by protocol.
+
+    It's an observer of the handlers (see ProxyObserver). Relayed bytes are
+    counted in batches by the relay loops (see TrafficCounter) and added
+    to the bytes counter when metrics are collected or when a tunnel is closed
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, prefix: str = 'tiny_proxy'):
+        self.registry = registry = registry or MetricsRegistry()
+
+        self.accepted = registry.counter(
+            f'{prefix}_connections_accepted_total',
+            'Accepted client connections',
+            ('protocol',),
+        )
+        self.active = registry.gauge(
+            f'{prefix}_connections_active',
+            'Client connections being handled',
+            ('protocol',),
+        )
+        self.handshake_failures = registry.counter(
+            f'{prefix}_handshake_failures_total',
+            'Client connections that failed before the tunnel was established',
+            ('protocol', 'reason'),
+        )
+        self.bytes = registry.counter(
+            f'{prefix}_bytes_total',
+            'Relayed bytes, "in" is received from clients, "out" is sent to clients',
+            ('protocol', 'direction'),
+        )
+        self.handshake_duration = registry.histogram(
+            f'{prefix}_handshake_duration_seconds',
+            'Time from accepting a connection to the parsed request',
+            ('protocol',),
+        )
+        self.connect_duration = registry.histogram(
+            f'{prefix}_connect_duration_seconds',
+            'Time it took to connect to the requested destination',
+            ('protocol',),
+        )
+        self.tunnel_duration = registry.histogram(
+            f'{prefix}_tunnel_duration_seconds',
+            'Lifetime of established tunnels',
+            ('protocol',),
+        )
+
+        # traffic of the open tunnels -> [protocol, reported upstream, reported downstream]
+        self._traffic: Dict[TrafficCounter, List] = {}
+        registry.add_collect_hook(self.flush_traffic)
+
+    def expose(self) -> str:
+        return self.registry.expose()
+
+    def on_accept(self, connection: Connection):
+        self.accepted.labels(connection.protocol).inc()
+        self.active.labels(connection.protocol).inc()
+
+    def on_negotiated(
+        self,
+        connection: Connection,
+        target: Tuple[str, int],
+        protocol: str,
+        user: Optional[str],
+    ):
+        duration = connection.negotiated_at - connection.accepted_at
+        self.handshake_duration.labels(protocol).observe(duration)
+
+    def on_upstream_connected(self, connection: Connection, latency: float):
+        self.connect_duration.labels(connection.protocol).observe(latency)
+        self._traffic[connection.traffic] = [connection.protocol, 0, 0]
+
+    def on_closed(
+        self,
+        connection: Connection,
+        traffic: TrafficCounter,
+        duration: float,
+        reason: Optional[str],
+    ):
+        protocol = connection.protocol
+        self.active.labels(protocol).dec()
+
+        state = self._traffic.pop(traffic, None)
+        if state is not None:
+            self._flush(traffic, state)
+            tunnel_duration = connection.accepted_at + duration - connection.connected_at
+            self.tunnel_duration.labels(protocol).observe(tunnel_duration)
+        elif reason is not None:
+            self.handshake_failures.labels(protocol, reason).inc()
+
+    def flush_traffic(self):
+        for traffic, state in self._traffic.items():
+            self._flush(traffic, state)
+
+    def _flush(self, traffic: TrafficCounter, state: List):
+        protocol, upstream, downstream = state
+        if traffic.upstream != upstream:
+            self.bytes.labels(protocol, 'in').inc(traffic.upstream - upstream)
+        if traffic.downstream != downstream:
+            self.bytes.labels(protocol, 'out').inc(traffic.downstream - downstream)
+        state[1:] = traffic.upstream, traffic.downstream
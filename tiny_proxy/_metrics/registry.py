@@ -0,0 +1,188 @@
+import bisect
+import math
+from typing import Callable, Dict, Generic, List, Sequence, Tuple, TypeVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 3600)
+
+T = TypeVar('T')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class HistogramValue:
+    __slots__ = ('upper_bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, upper_bounds: Sequence[float]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric(Generic[T]):
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], T] = {}
+
+    def labels(self, *values: str) -> T:
+        """Returns the value for the given label values, it's worth keeping it on hot paths"""
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            value = self._values[values] = self._new_value()
+        return value
+
+    def _new_value(self) -> T:
+        raise NotImplementedError()
+
+    def expose(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {_escape(self.documentation)}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        for labels, value in self._values.items():
+            lines.extend(self._samples(_format_labels(self.labelnames, labels), labels, value))
+        return lines
+
+    def _samples(self, labels: str, label_values: Tuple[str, ...], value: T) -> List[str]:
+        return [f'{self.name}{labels} {_format_value(value.value)}']
+
+
+class Counter(Metric[CounterValue]):
+    type = 'counter'
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+
+class Gauge(Metric[GaugeValue]):
+    type = 'gauge'
+
+    def _new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+
+class Histogram(Metric[HistogramValue]):
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def _samples(self, labels: str, label_values: Tuple[str, ...], value: HistogramValue):
+        names = self.labelnames + ('le',)
+        lines = []
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets + (math.inf,), value.counts):
+            cumulative += count
+            bucket_labels = _format_labels(names, label_values + (_format_value(upper_bound),))
+            lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+        lines.append(f'{self.name}_sum{labels} {_format_value(value.sum)}')
+        lines.append(f'{self.name}_count{labels} {value.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics exposed in the Prometheus text format.
+
+    Metric values are plain attributes updated in place (there's a single
+    event loop per process, so no locking). Collect hooks run before
+    every exposition, e.g. to flush values that are aggregated elsewhere
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collect_hooks: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def add_collect_hook(self, hook: Callable[[], None]):
+        self._collect_hooks.append(hook)
+
+    def expose(self) -> str:
+        for hook in self._collect_hooks:
+            hook()
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,149 @@
+import logging
+import time
+from typing import Optional, Sequence, Tuple
+
+from ._metrics.registry import DEFAULT_BUCKETS, HistogramValue
+from ._traffic import TrafficCounter
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyObserver:
+    """
+    Receives lifecycle events of the connections handled by a proxy handler.
+    All callbacks are no-ops by default, they must not block.
+
+    Relayed data is reported to on_chunk_relayed() in batches (see TrafficCounter),
+    every chunk_sample_rate-th batch of a tunnel; 0 disables the callback
+    """
+
+    chunk_sample_rate = 0
+
+    def on_accept(self, connection: 'Connection'):
+        pass
+
+    def on_negotiated(
+        self,
+        connection: 'Connection',
+        target: Tuple[str, int],
+        protocol: str,
+        user: Optional[str],
+    ):
+        pass
+
+    def on_upstream_connected(self, connection: 'Connection', latency: float):
+        pass
+
+    def on_chunk_relayed(self, connection: 'Connection', upstream: bool, size: int):
+        pass
+
+    def on_closed(
+        self,
+        connection: 'Connection',
+        traffic: TrafficCounter,
+        duration: float,
+        reason: Optional[str],
+    ):
+        """reason is None if the connection ended normally, otherwise see failure_reason()"""
+
+
+class _SampledTraffic(TrafficCounter):
+    __slots__ = ('connection', 'observers', 'batches')
+
+    def __init__(self, connection: 'Connection', observers: Sequence[ProxyObserver]):
+        super().__init__()
+        self.connection = connection
+        self.observers = observers
+        self.batches = 0
+
+    def add(self, upstream: bool, size: int):
+        if not size:
+            return
+
+        super().add(upstream, size)
+        self.batches += 1
+        for observer in self.observers:
+            if self.batches % observer.chunk_sample_rate == 0:
+                _notify(observer.on_chunk_relayed, self.connection, upstream, size)
+
+
+def _notify(callback, *args):
+    try:
+        callback(*args)
+    except Exception as e:  # pragma: no cover
+        # a faulty observer must not break the connection
+        logger.exception(e)
+
+
+class Connection:
+    """Client connection as seen by the observers, it's passed to every callback"""
+
+    def __init__(self, observers: Sequence[ProxyObserver], protocol: str, client_address):
+        self.observers = observers
+        self.protocol = protocol
+        self.client_address = client_address
+        self.target: Optional[Tuple[str, int]] = None
+        self.user: Optional[str] = None
+        self.accepted_at = time.monotonic()
+        self.negotiated_at: Optional[float] = None
+        self.connected_at: Optional[float] = None
+
+        sampling = [observer for observer in observers if observer.chunk_sample_rate > 0]
+        if sampling:
+            self.traffic = _SampledTraffic(self, sampling)
+        else:
+            self.traffic = TrafficCounter()
+
+    def accepted(self):
+        for observer in self.observers:
+            _notify(observer.on_accept, self)
+
+    def negotiated(self, host: str, port: int, user: Optional[str], protocol: str = ''):
+        """protocol is the negotiated one, it may be more specific than the handler's"""
+        self.negotiated_at = time.monotonic()
+        self.target = (host, port)
+        self.user = user
+        protocol = protocol or self.protocol
+        for observer in self.observers:
+            _notify(observer.on_negotiated, self, self.target, protocol, user)
+
+    def upstream_connected(self, latency: float):
+        self.connected_at = time.monotonic()
+        for observer in self.observers:
+            _notify(observer.on_upstream_connected, self, latency)
+
+    def closed(self, reason: Optional[str]):
+        duration = time.monotonic() - self.accepted_at
+        for observer in self.observers:
+            _notify(observer.on_closed, self, self.traffic, duration, reason)
+
+
+class TimingObserver(ProxyObserver):
+    """
+    Records the duration of the connection phases into fixed-bucket histograms:
+    handshake (accept to parsed request), connect (to the destination),
+    tunnel (relaying) and total
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        buckets = tuple(sorted(buckets))
+        self.handshake = HistogramValue(buckets)
+        self.connect = HistogramValue(buckets)
+        self.tunnel = HistogramValue(buckets)
+        self.total = HistogramValue(buckets)
+
+    def on_upstream_connected(self, connection: Connection, latency: float):
+        self.connect.observe(latency)
+
+    def on_closed(
+        self,
+        connection: Connection,
+        traffic: TrafficCounter,
+        duration: float,
+        reason: Optional[str],
+    ):
+        if connection.negotiated_at is not None:
+            self.handshake.observe(connection.negotiated_at - connection.accepted_at)
+        if connection.connected_at is not None:
+            self.tunnel.observe(connection.accepted_at + duration - connection.connected_at)
+        self.total.observe(duration)
@@ -0,0 +1,54 @@
+from .._errors import ProxyError
+
+NEED_DATA = None
+
+
+class HandshakeError(ProxyError):
+    reason = 'protocol_error'
+
+
+class AuthenticationError(HandshakeError):
+    reason = 'auth_failed'
+
+
+class HandshakeParser:
+    """
+    Base class for sans-IO handshake parsers.
+
+    Received bytes are passed to feed(), next_event() returns parsed messages
+    (or NEED_DATA if the buffer doesn't contain a complete message yet),
+    and the bytes to be sent to the client are collected by data_to_send().
+    On protocol errors HandshakeError is raised, the failure reply (if any)
+    is still available from data_to_send().
+    """
+
+    max_buffer_size = 4096
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._output = bytearray()
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+
+    def data_to_send(self) -> bytes:
+        data = bytes(self._output)
+        self._output.clear()
+        return data
+
+    @property
+    def leftover(self) -> bytes:
+        """Bytes received after the handshake (e.g. pipelined application data)"""
+        return bytes(self._buffer)
+
+    def next_event(self):
+        raise NotImplementedError()
+
+    def _consume(self, size: int) -> bytes:
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _fail(self, message: str, reply: bytes = b'', error=HandshakeError):
+        self._output += reply
+        raise error(message)
@@ -0,0 +1,240 @@
+import ipaddress
+from typing import FrozenSet, NamedTuple, Optional, Sequence, Tuple
+
+from .base import HandshakeParser, NEED_DATA
+
+HEADERS_END = b'\r\n\r\n'
+MAX_HEADERS = 100
+
+Headers = Tuple[Tuple[str, str], ...]
+
+# not forwarded by proxies (RFC 9110, section 7.6.1), Transfer-Encoding is kept
+# because message bodies are relayed as they are
+HOP_BY_HOP_HEADERS = frozenset(
+    (
+        'connection',
+        'keep-alive',
+        'proxy-connection',
+        'proxy-authenticate',
+        'proxy-authorization',
+        'te',
+        'upgrade',
+    )
+)
+
+
+def get_header(headers: Headers, name: str, default: Optional[str] = None) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return default
+
+
+def connection_options(headers: Headers) -> FrozenSet[str]:
+    """Lowercased tokens of the Connection (and the legacy Proxy-Connection) header fields"""
+    return frozenset(
+        token.strip().lower()
+        for name, value in headers
+        if name.lower() in ('connection', 'proxy-connection')
+        for token in value.split(',')
+        if token.strip()
+    )
+
+
+def is_keep_alive(version: str, headers: Headers) -> bool:
+    """Whether the sender of a message wants the connection to persist"""
+    options = connection_options(headers)
+    if 'close' in options:
+        return False
+    if version == 'HTTP/1.0':
+        return 'keep-alive' in options
+    return True
+
+
+class HttpRequest(NamedTuple):
+    method: str
+    target: str
+    version: str
+    headers: Headers
+
+    def get_header(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return get_header(self.headers, name, default)
+
+    def get_authority(self, default_port: Optional[int] = None) -> Tuple[str, int]:
+        """Destination of the request: the CONNECT target or the Host header field"""
+        if self.method.upper() == 'CONNECT':
+            return parse_authority(self.target)
+
+        host = self.get_header('host')
+        if not host:
+            raise ValueError('Host header field is missing')
+
+        return parse_authority(host, default_port)
+
+
+class HttpResponse(NamedTuple):
+    version: str
+    status: int
+    reason: str
+    headers: Headers
+
+    def get_header(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return get_header(self.headers, name, default)
+
+
+def parse_request(data: bytes) -> HttpRequest:
+    """
+    Parses the request line and header fields (terminated by an empty line).
+    Raises ValueError if the request is malformed
+    """
+    lines = data.decode('latin1').split('\r\n')
+
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise ValueError(f'Invalid request line: {lines[0]!r}') from None
+
+    if not method.isalpha() or not target or not version.startswith('HTTP/1.'):
+        raise ValueError(f'Invalid request line: {lines[0]!r}')
+
+    return HttpRequest(method, target, version, _parse_headers(lines[1:]))
+
+
+def parse_response(data: bytes) -> HttpResponse:
+    """
+    Parses the status line and header fields (terminated by an empty line).
+    Raises ValueError if the response is malformed
+    """
+    lines = data.decode('latin1').split('\r\n')
+
+    version, _, rest = lines[0].partition(' ')
+    status, _, reason = rest.partition(' ')
+    if not version.startswith('HTTP/1.') or len(status) != 3 or not status.isdigit():
+        raise ValueError(f'Invalid status line: {lines[0]!r}')
+
+    return HttpResponse(version, int(status), reason, _parse_headers(lines[1:]))
+
+
+def _parse_headers(lines: Sequence[str]) -> Headers:
+    headers = []
+    for line in lines:
+        if not line:
+            break
+
+        name, sep, value = line.partition(':')
+        if not sep or not name or name != name.strip():
+            raise ValueError(f'Invalid header field: {line!r}')
+
+        headers.append((name, value.strip(' \t')))
+
+    if len(headers) > MAX_HEADERS:
+        raise ValueError('Too many header fields')
+
+    return tuple(headers)
+
+
+def parse_authority(authority: str, default_port: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Splits host[:port] (IPv6 addresses are enclosed in brackets, e.g. [::1]:443).
+    Raises ValueError if the port is missing and there's no default one
+    """
+    if authority.startswith('['):
+        end = authority.find(']')
+        if end < 0:
+            raise ValueError(f'Invalid authority: {authority!r}')
+        host, rest = authority[1:end], authority[end + 1 :]
+        if rest and not rest.startswith(':'):
+            raise ValueError(f'Invalid authority: {authority!r}')
+        port = rest[1:]
+    else:
+        host, _, port = authority.rpartition(':')
+        if not host:
+            host, port = port, ''
+        if ':' in host:
+            # some clients don't enclose IPv6 addresses in brackets
+            try:
+                ipaddress.IPv6Address(host)
+            except ValueError:
+                raise ValueError(f'Invalid authority: {authority!r}') from None
+
+    if not host:
+        raise ValueError(f'Invalid authority: {authority!r}')
+
+    if not port:
+        if default_port is None:
+            raise ValueError(f'Port is missing: {authority!r}')
+        return host, default_port
+
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f'Invalid port: {authority!r}')
+
+    return host, int(port)
+
+
+def parse_url(url: str) -> Tuple[str, int, str, str]:
+    """
+    Splits an absolute-form request target (http://host[:port]/path?query) into
+    the host, port, authority (for the Host header field) and the origin-form target.
+    Raises ValueError if it isn't an http URL
+    """
+    scheme, sep, rest = url.partition('://')
+    if not sep or scheme.lower() != 'http':
+        raise ValueError(f'Unsupported URL: {url!r}')
+
+    end = len(rest)
+    for delimiter in '/?#':
+        position = rest.find(delimiter)
+        if 0 <= position < end:
+            end = position
+
+    authority = rest[:end].rpartition('@')[2]
+    path = rest[end:].partition('#')[0]
+    if not path.startswith('/'):
+        path = '/' + path
+
+    host, port = parse_authority(authority, 80)
+    return host, port, authority, path
+
+
+def build_response(
+    code: int,
+    message: str,
+    headers: Sequence[Tuple[str, str]] = (),
+    body: bytes = b'',
+) -> bytes:
+    head = f'HTTP/1.1 {code} {message}\r\n'
+    head += ''.join(f'{name}: {value}\r\n' for name, value in headers)
+    return (head + '\r\n').encode('ascii') + body
+
+
+class HttpRequestParser(HandshakeParser):
+    def __init__(self):
+        super().__init__()
+        self.done = False
+        self._scanned = 0
+
+    def next_event(self):
+        if self.done:
+            return NEED_DATA
+
+        end = self._buffer.find(HEADERS_END, self._scanned)
+        # a whole oversized head may come in a single chunk
+        size = len(self._buffer) if end < 0 else end + len(HEADERS_END)
+        if size > self.max_buffer_size:
+            self._fail(
+                'Request header fields too large',
+                build_response(431, 'Request Header Fields Too Large'),
+            )
+        if end < 0:
+            # the delimiter may be split between two chunks
+            self._scanned = max(len(self._buffer) - len(HEADERS_END) + 1, 0)
+            return NEED_DATA
+
+        data = self._consume(end + len(HEADERS_END))
+        self.done = True
+
+        try:
+            return parse_request(data)
+        except ValueError as e:
+            self._fail(str(e), build_response(400, 'Bad Request'))
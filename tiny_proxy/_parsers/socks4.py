@@ -0,0 +1,107 @@
+import enum
+import ipaddress
+from typing import NamedTuple, Iterable
+
+from .base import HandshakeParser, NEED_DATA
+
+RSV = NULL = 0x00
+SOCKS_VER4 = 0x04
+
+
+class Command(enum.IntEnum):
+    CONNECT = 0x01
+    BIND = 0x02
+
+
+class ReplyCode(enum.IntEnum):
+    REQUEST_GRANTED = 0x5A
+    REQUEST_REJECTED_OR_FAILED = 0x5B
+    CONNECTION_FAILED = 0x5C
+    AUTHENTICATION_FAILED = 0x5D
+
+
+ReplyMessages = {
+    ReplyCode.REQUEST_GRANTED: "Request granted",
+    ReplyCode.REQUEST_REJECTED_OR_FAILED: "Request rejected or failed",
+    ReplyCode.CONNECTION_FAILED: (
+        "Request rejected because SOCKS server cannot connect to identd on the client"
+    ),
+    ReplyCode.AUTHENTICATION_FAILED: (
+        "Request rejected because the client program and identd report different user-ids"
+    ),
+}
+
+
+class Request(NamedTuple):
+    command: Command
+    host: str
+    port: int
+    user_id: str
+
+
+def build_reply(code: ReplyCode, host: str = '0.0.0.0', port: int = 0) -> bytes:
+    return bytes([RSV, code]) + port.to_bytes(2, 'big') + ipaddress.IPv4Address(host).packed
+
+
+class Socks4Parser(HandshakeParser):
+    max_buffer_size = 1024
+
+    def __init__(self, commands: Iterable[Command] = (Command.CONNECT,)):
+        super().__init__()
+        self.commands = frozenset(commands)
+        self.done = False
+
+    def next_event(self):
+        if self.done:
+            return NEED_DATA
+
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return NEED_DATA
+
+        version, command = buffer[0], buffer[1]
+
+        if version != SOCKS_VER4:
+            self._fail('Invalid socks version', build_reply(ReplyCode.REQUEST_REJECTED_OR_FAILED))
+
+        if command not in self.commands:
+            self._fail('Unsupported command', build_reply(ReplyCode.REQUEST_REJECTED_OR_FAILED))
+
+        if len(buffer) < 8:
+            return NEED_DATA
+
+        # VER CMD DSTPORT(2) DSTIP(4) USERID NULL [HOSTNAME NULL]
+        user_end = buffer.find(NULL, 8)
+        if user_end < 0:
+            return self._need_more()
+
+        # SOCKS4a: DSTIP is 0.0.0.x (x != 0), the hostname follows the user id
+        include_hostname = buffer[4:7] == bytes([NULL, NULL, NULL])
+
+        if include_hostname:
+            host_end = buffer.find(NULL, user_end + 1)
+            if host_end < 0:
+                return self._need_more()
+            end = host_end
+        else:
+            end = user_end
+
+        data = self._consume(end + 1)
+
+        if include_hostname:
+            host = data[user_end + 1 : host_end].decode('ascii')
+        else:
+            host = str(ipaddress.IPv4Address(data[4:8]))
+
+        self.done = True
+        return Request(
+            command=Command(command),
+            host=host,
+            port=int.from_bytes(data[2:4], 'big'),
+            user_id=data[8:user_end].decode('ascii'),
+        )
+
+    def _need_more(self):
+        if len(self._buffer) > self.max_buffer_size:
+            self._fail('Request is too long', build_reply(ReplyCode.REQUEST_REJECTED_OR_FAILED))
+        return NEED_DATA
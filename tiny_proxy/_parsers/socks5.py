@@ -0,0 +1,288 @@
+import enum
+import ipaddress
+import socket
+from typing import NamedTuple, Iterable, Optional, Tuple
+
+from .base import AuthenticationError, HandshakeParser, NEED_DATA
+
+RSV = NULL = 0x00
+SOCKS_VER5 = 0x05
+
+SOCKS5_GRANTED = 0x00
+AUTH_VER = 0x01
+AUTH_FAILED = 0xFF
+
+
+class AuthMethod(enum.IntEnum):
+    ANONYMOUS = 0x00
+    GSSAPI = 0x01
+    USERNAME_PASSWORD = 0x02
+    NO_ACCEPTABLE = 0xFF
+
+
+class AddressType(enum.IntEnum):
+    IPV4 = 0x01
+    DOMAIN = 0x03
+    IPV6 = 0x04
+
+    @classmethod
+    def from_ip_ver(cls, ver: int):
+        if ver == 4:
+            return cls.IPV4
+        if ver == 6:
+            return cls.IPV6
+
+        raise ValueError('Invalid IP version')
+
+
+class Command(enum.IntEnum):
+    CONNECT = 0x01
+    BIND = 0x02
+    UDP_ASSOCIATE = 0x03
+
+
+class ReplyCode(enum.IntEnum):
+    SUCCEEDED = 0x00
+    GENERAL_FAILURE = 0x01
+    CONNECTION_NOT_ALLOWED = 0x02
+    NETWORK_UNREACHABLE = 0x03
+    HOST_UNREACHABLE = 0x04
+    CONNECTION_REFUSED = 0x05
+    TTL_EXPIRED = 0x06
+    COMMAND_NOT_SUPPORTED = 0x07
+    ADDRESS_TYPE_NOT_SUPPORTED = 0x08
+
+
+ReplyMessages = {
+    ReplyCode.SUCCEEDED: 'Request granted',
+    ReplyCode.GENERAL_FAILURE: 'General SOCKS server failure',
+    ReplyCode.CONNECTION_NOT_ALLOWED: 'Connection not allowed by ruleset',
+    ReplyCode.NETWORK_UNREACHABLE: 'Network unreachable',
+    ReplyCode.HOST_UNREACHABLE: 'Host unreachable',
+    ReplyCode.CONNECTION_REFUSED: 'Connection refused by destination host',
+    ReplyCode.TTL_EXPIRED: 'TTL expired',
+    ReplyCode.COMMAND_NOT_SUPPORTED: 'Command not supported or protocol error',
+    ReplyCode.ADDRESS_TYPE_NOT_SUPPORTED: 'Address type not supported',
+}
+
+
+class AuthRequest(NamedTuple):
+    username: str
+    password: str
+
+
+class Request(NamedTuple):
+    command: Command
+    host: str
+    port: int
+
+
+class State(enum.Enum):
+    GREETING = enum.auto()
+    AUTH = enum.auto()
+    AUTH_RESULT = enum.auto()
+    AUTH_FAILED = enum.auto()
+    REQUEST = enum.auto()
+    DONE = enum.auto()
+
+
+def build_reply(code: ReplyCode, host: Optional[str] = None, port: int = 0) -> bytes:
+    if host is None:
+        ip = ipaddress.IPv4Address(0)
+    else:
+        ip = ipaddress.ip_address(host)
+
+    reply = bytearray([SOCKS_VER5, code, RSV, AddressType.from_ip_ver(ip.version)])
+    reply += ip.packed
+    reply += port.to_bytes(2, 'big')
+    return bytes(reply)
+
+
+def build_udp_header(host: str, port: int) -> bytes:
+    """UDP request header (RFC 1928, section 7) of a datagram from host:port"""
+    ip = ipaddress.ip_address(host)
+    header = bytearray([RSV, RSV, NULL, AddressType.from_ip_ver(ip.version)])
+    header += ip.packed
+    header += port.to_bytes(2, 'big')
+    return bytes(header)
+
+
+def parse_udp_header(data: memoryview) -> Tuple[str, int, int]:
+    """
+    Parses the UDP request header of a client datagram, returns the destination
+    host, port and the offset of the payload. Raises ValueError if the datagram
+    is malformed or fragmented (fragmentation is not supported)
+    """
+    if len(data) < 4:
+        raise ValueError('Truncated UDP header')
+    if data[2] != NULL:
+        raise ValueError('Fragmented datagrams are not supported')
+
+    address_type = data[3]
+    if address_type == AddressType.IPV4:
+        offset = 4 + 4 + 2
+        if len(data) < offset:
+            raise ValueError('Truncated UDP header')
+        host = socket.inet_ntop(socket.AF_INET, data[4:8])
+    elif address_type == AddressType.IPV6:
+        offset = 4 + 16 + 2
+        if len(data) < offset:
+            raise ValueError('Truncated UDP header')
+        host = socket.inet_ntop(socket.AF_INET6, data[4:20])
+    elif address_type == AddressType.DOMAIN:
+        offset = 5 + (data[4] if len(data) > 4 else 0) + 2
+        if len(data) < offset:
+            raise ValueError('Truncated UDP header')
+        host = bytes(data[5 : offset - 2]).decode('ascii')
+    else:
+        raise ValueError('Unsupported address type')
+
+    return host, int.from_bytes(data[offset - 2 : offset], 'big'), offset
+
+
+class Socks5Parser(HandshakeParser):
+    def __init__(
+        self,
+        auth_required: bool = False,
+        commands: Iterable[Command] = (Command.CONNECT,),
+    ):
+        super().__init__()
+        self.auth_required = auth_required
+        self.commands = frozenset(commands)
+        self.state = State.GREETING
+
+    def next_event(self):
+        if self.state == State.GREETING:
+            if not self._parse_greeting():
+                return NEED_DATA
+
+        if self.state == State.AUTH:
+            return self._parse_auth()
+
+        if self.state == State.AUTH_FAILED:
+            self._fail('Authentication failed', error=AuthenticationError)
+
+        if self.state == State.REQUEST:
+            return self._parse_request()
+
+        return NEED_DATA
+
+    def auth_result(self, success: bool) -> None:
+        """Has to be called after AuthRequest, a failure is reported by the next next_event()"""
+        assert self.state == State.AUTH_RESULT
+
+        if success:
+            self._output += bytes([AUTH_VER, SOCKS5_GRANTED])
+            self.state = State.REQUEST
+        else:
+            self._output += bytes([AUTH_VER, AUTH_FAILED])
+            self.state = State.AUTH_FAILED
+
+    def _parse_greeting(self) -> bool:
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return False
+
+        version, num_methods = buffer[0], buffer[1]
+        if version != SOCKS_VER5:
+            self._fail('Unsupported socks version', bytes([NULL, NULL]))
+
+        if len(buffer) < 2 + num_methods:
+            return False
+
+        methods = self._consume(2 + num_methods)[2:]
+
+        if self.auth_required:
+            auth_method = AuthMethod.USERNAME_PASSWORD
+        else:
+            auth_method = AuthMethod.ANONYMOUS
+
+        if auth_method not in methods:
+            self._fail(
+                'Not acceptable auth method',
+                bytes([SOCKS_VER5, AuthMethod.NO_ACCEPTABLE]),
+            )
+
+        self._output += bytes([SOCKS_VER5, auth_method])
+
+        if auth_method == AuthMethod.USERNAME_PASSWORD:
+            self.state = State.AUTH
+        else:
+            self.state = State.REQUEST
+
+        return True
+
+    def _parse_auth(self):
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return NEED_DATA
+
+        version, username_len = buffer[0], buffer[1]
+        if version != AUTH_VER:
+            self._fail('Invalid auth request', bytes([version, AUTH_FAILED]))
+
+        if len(buffer) < 3 + username_len:
+            return NEED_DATA
+
+        password_len = buffer[2 + username_len]
+        if len(buffer) < 3 + username_len + password_len:
+            return NEED_DATA
+
+        data = self._consume(3 + username_len + password_len)
+        self.state = State.AUTH_RESULT
+        return AuthRequest(
+            username=data[2 : 2 + username_len].decode('utf-8'),
+            password=data[3 + username_len :].decode('utf-8'),
+        )
+
+    def _parse_request(self):
+        buffer = self._buffer
+        if len(buffer) < 4:
+            return NEED_DATA
+
+        version, command, _, address_type = buffer[:4]
+
+        if version != SOCKS_VER5:
+            self._fail(
+                ReplyMessages[ReplyCode.GENERAL_FAILURE],
+                build_reply(ReplyCode.GENERAL_FAILURE),
+            )
+
+        if command not in self.commands:
+            self._fail(
+                ReplyMessages[ReplyCode.COMMAND_NOT_SUPPORTED],
+                build_reply(ReplyCode.COMMAND_NOT_SUPPORTED),
+            )
+
+        if address_type == AddressType.IPV4:
+            size = 4 + 4 + 2
+        elif address_type == AddressType.IPV6:
+            size = 4 + 16 + 2
+        elif address_type == AddressType.DOMAIN:
+            if len(buffer) < 5:
+                return NEED_DATA
+            size = 5 + buffer[4] + 2
+        else:
+            self._fail(
+                ReplyMessages[ReplyCode.ADDRESS_TYPE_NOT_SUPPORTED],
+                build_reply(ReplyCode.ADDRESS_TYPE_NOT_SUPPORTED),
+            )
+
+        if len(buffer) < size:
+            return NEED_DATA
+
+        data = self._consume(size)
+
+        if address_type == AddressType.IPV4:
+            host = str(ipaddress.IPv4Address(data[4:8]))
+        elif address_type == AddressType.IPV6:
+            host = str(ipaddress.IPv6Address(data[4:20]))
+        else:
+            host = data[5:-2].decode('ascii')
+
+        self.state = State.DONE
+        return Request(
+            command=Command(command),
+            host=host,
+            port=int.from_bytes(data[-2:], 'big'),
+        )
@@ -1,6 +1,102 @@
+import time
+from typing import Optional, Tuple
+
+from .._acl import AccessList
+from .._admission import Admission
+from .._connector import AddressFilter, Connector
+from .._errors import AccessDenied
+from .._observers import Connection
+from .._parsers.base import HandshakeParser, HandshakeError, NEED_DATA
 from .._stream import SocketStream
+from .._timers import Deadlines
 
 
 class AbstractProxy:
+    stream: SocketStream
+    parser: HandshakeParser
+    connector: Connector
+    protocol: str = ''
+
+    # destination and authenticated user, known once the request is negotiated
+    target: Optional[Tuple[str, int]] = None
+    user: Optional[str] = None
+
+    # seconds it took to connect to the destination
+    connect_duration: Optional[float] = None
+
+    # set by the handler if there are observers / timeouts / admission limits / an access list
+    connection: Optional[Connection] = None
+    deadlines: Optional[Deadlines] = None
+    admission: Optional[Admission] = None
+    acl: Optional[AccessList] = None
+
     async def connect_to_remote(self) -> SocketStream:
         raise NotImplementedError()
+
+    async def receive_event(self):
+        """Feeds the handshake parser with received data until it returns the next message"""
+        while True:
+            try:
+                event = self.parser.next_event()
+            except HandshakeError:
+                await self.flush()
+                raise
+
+            if event is not NEED_DATA:
+                return event
+
+            await self.flush()
+            self.parser.feed(await self.stream.receive())
+
+    async def flush(self, data: bytes = b''):
+        """Sends the pending handshake replies followed by data"""
+        data = self.parser.data_to_send() + data
+        if data:
+            await self.stream.send(data)
+
+    async def open_connection(self, host: str, port: int) -> SocketStream:
+        self.check_access(host, port)
+        await self.start_tunnel(host, port)
+        address_filter = self.address_filter(host, port)
+        return await self.timed_connect(self.connector.connect, host, port, address_filter)
+
+    def check_access(self, host: str, port: int):
+        """Raises AccessDenied if the user isn't allowed to reach host:port"""
+        if self.acl is not None and not self.acl.allows(host, port, self.user):
+            raise AccessDenied(f'Access to {host}:{port} denied')
+
+    def address_filter(self, host: str, port: int) -> Optional[AddressFilter]:
+        """Checks the addresses the destination name resolves to against the access list"""
+        acl, user = self.acl, self.user
+        if acl is None:
+            return None
+        return lambda address: acl.allows(host, port, user, address)
+
+    async def start_tunnel(self, host: str, port: int):
+        """Accounts for the negotiated request before its destination is contacted"""
+        self.target = (host, port)
+        if self.deadlines is not None:
+            self.deadlines.negotiated()
+        if self.admission is not None:
+            self.admission.end_handshake()
+            await self.admission.open_tunnel(host)
+
+        connection = self.connection
+        if connection is not None:
+            connection.negotiated(host, port, self.user, self.protocol)
+
+    async def timed_connect(self, connect, *args):
+        """Awaits connect(*args) and reports how long it took"""
+        started = time.monotonic()
+        try:
+            remote = await connect(*args)
+        finally:
+            self.connect_duration = time.monotonic() - started
+
+        if self.connection is not None:
+            self.connection.upstream_connected(self.connect_duration)
+        return remote
+
+    def finish_handshake(self):
+        """Returns the data pipelined behind the handshake to the stream"""
+        self.stream.unreceive(self.parser.leftover)
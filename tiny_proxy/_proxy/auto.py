@@ -0,0 +1,104 @@
+import logging
+from typing import Optional, Sequence
+
+import anyio
+import anyio.abc
+
+from .abc import AbstractProxy
+from .http import HttpProxy
+from .socks4 import Socks4Proxy
+from .socks5 import Socks5Proxy
+from .._auth.abc import AbstractAuthenticator
+from .._connector import Connector
+from .._parsers.base import HandshakeError
+from .._stream import SocketStream
+
+PROTOCOLS = ('socks5', 'socks4', 'http')
+
+
+def detect_protocol(data: bytes) -> str:
+    """Tells the protocol by the first byte a client sends: the SOCKS version or an HTTP method"""
+    if data[0] == 5:
+        return 'socks5'
+    if data[0] == 4:
+        return 'socks4'
+    return 'http'
+
+
+class AutoProxy(AbstractProxy):
+    """
+    Serves SOCKS5, SOCKS4 and HTTP CONNECT on the same port. The first received
+    chunk stays in the stream buffer, so the selected protocol's parser
+    gets it without another read
+    """
+
+    protocol = 'auto'
+
+    def __init__(
+        self,
+        stream: SocketStream,
+        username: str = None,
+        password: str = None,
+        connector: Connector = None,
+        authenticator: Optional[AbstractAuthenticator] = None,
+        protocols: Sequence[str] = PROTOCOLS,
+    ):
+        self.stream = stream
+        self.username = username
+        self.password = password
+        self.connector = connector or Connector()
+        self.authenticator = authenticator
+        self.protocols = protocols
+        self.proxy: Optional[AbstractProxy] = None
+        self.logger = logging.getLogger(__name__)
+
+    async def connect_to_remote(self) -> SocketStream:
+        try:
+            data = await self.stream.peek()
+        except (
+            anyio.EndOfStream,
+            anyio.ClosedResourceError,
+            anyio.BrokenResourceError,
+        ) as e:
+            raise ConnectionResetError(
+                f'Connection reset by peer {self.stream.getpeername()}'
+            ) from e
+
+        protocol = detect_protocol(data)
+        if protocol not in self.protocols:
+            raise HandshakeError(f'Protocol {protocol} is not allowed')
+
+        self.proxy = proxy = self.create_proxy(protocol)
+        proxy.connection = self.connection
+        proxy.deadlines = self.deadlines
+        proxy.admission = self.admission
+        proxy.acl = self.acl
+        try:
+            return await proxy.connect_to_remote()
+        finally:
+            self.target = proxy.target
+            self.user = proxy.user
+            self.connect_duration = proxy.connect_duration
+
+    def create_proxy(self, protocol: str) -> AbstractProxy:
+        if protocol == 'socks5':
+            return Socks5Proxy(
+                stream=self.stream,
+                username=self.username,
+                password=self.password,
+                connector=self.connector,
+                authenticator=self.authenticator,
+            )
+        if protocol == 'socks4':
+            return Socks4Proxy(
+                stream=self.stream,
+                username=self.username,
+                connector=self.connector,
+            )
+        return HttpProxy(
+            stream=self.stream,
+            username=self.username,
+            password=self.password,
+            connector=self.connector,
+            authenticator=self.authenticator,
+        )
@@ -2,34 +2,22 @@ import base64
 import binascii
 import logging
 from collections import namedtuple
-from http.server import BaseHTTPRequestHandler
-from io import BytesIO
-from typing import Tuple
+from typing import Optional, Tuple, Union
 
 import anyio
 import anyio.abc
 
 from .abc import AbstractProxy
-from .._errors import ProxyError
+from .._auth.abc import AbstractAuthenticator
+from .._auth.static import StaticAuthenticator
+from .._errors import AccessDenied, AdmissionRejected, ConnectError
+from .._parsers.base import AuthenticationError, HandshakeError
+from .._forward import HttpForwarder, KeepAlivePool
+from .._parsers.http import HttpRequest, HttpRequestParser, build_response, parse_url
+from .._connector import Connector
 from .._stream import SocketStream
 
 
-class HTTPRequest(BaseHTTPRequestHandler):
-    """
-    https://stackoverflow.com/questions/4685217/parse-raw-http-headers
-    """
-
-    # noinspection PyMissingConstructor
-    def __init__(self, data: bytes):
-        self.rfile = BytesIO(data)
-        self.raw_requestline = self.rfile.readline()
-        self.error_code = self.error_message = None
-        self.parse_request()
-
-    def send_error(self, code, message=None, explain=None):
-        self.error_code = code
-
-
 class BasicAuth(namedtuple('BasicAuth', ['login', 'password', 'encoding'])):
     """Http basic authentication helper."""
 
@@ -83,18 +71,32 @@ class BasicAuth(namedtuple('BasicAuth', ['login', 'password', 'encoding'])):
 
 
 class HttpProxy(AbstractProxy):
+    protocol = 'http'
+
     def __init__(
         self,
         stream: SocketStream,
         username: str = None,
         password: str = None,
+        connector: Connector = None,
+        authenticator: Optional[AbstractAuthenticator] = None,
+        forward: bool = False,
+        keep_alive_pool: Optional[KeepAlivePool] = None,
     ):
         self.stream = stream
         self.username = username
         self.password = password
+        self.connector = connector or Connector()
+        if authenticator is None and username and password:
+            authenticator = StaticAuthenticator(username, password)
+        self.authenticator = authenticator
+        self.forward = forward
+        self.keep_alive_pool = keep_alive_pool
+        self.parser = HttpRequestParser()
+        self.request: Optional[HttpRequest] = None
         self.logger = logging.getLogger(__name__)
 
-    async def connect_to_remote(self) -> SocketStream:
+    async def connect_to_remote(self) -> Union[SocketStream, HttpForwarder]:
         try:
             remote_host, remote_port = await self.negotiate()
         except (
@@ -109,32 +111,62 @@ class HttpProxy(AbstractProxy):
 
         local_addr = self.stream.getsockname()
         remote_addr = (remote_host, remote_port)
-        self.logger.info('CONNECT {} -> {}'.format(local_addr, remote_addr))
+        method = self.request.method.upper()
+        self.logger.info('{} {} -> {}'.format(method, local_addr, remote_addr))
 
         try:
-            stream = await anyio.connect_tcp(remote_host=remote_host, remote_port=remote_port)
-            remote = SocketStream(stream)
+            if method == 'CONNECT':
+                remote = await self.open_connection(remote_host, remote_port)
+            else:
+                remote = await self.open_forwarder(remote_host, remote_port)
+        except AccessDenied:
+            await self.respond(403, 'Forbidden', raise_exc=False)
+            raise
+        except AdmissionRejected:
+            await self.respond(503, 'Service Unavailable', raise_exc=False)
+            raise
         except OSError as e:
             self.logger.error(e)
-            await self.respond(502, 'Bad Gateway', raise_exc=False)
-            raise ProxyError(f"Couldn't connect to host {remote_host}:{remote_port}") from e
+            if isinstance(e, TimeoutError):
+                await self.respond(504, 'Gateway Timeout', raise_exc=False)
+            else:
+                await self.respond(502, 'Bad Gateway', raise_exc=False)
+            raise ConnectError(f"Couldn't connect to host {remote_host}:{remote_port}") from e
         else:
-            await self.respond(200, 'Connection established')
+            if method == 'CONNECT':
+                await self.respond(200, 'Connection established')
             return remote
 
-    async def negotiate(self) -> Tuple[str, int]:
-        data = await self.stream.receive_until(b'\r\n\r\n', 4096)
-        req = HTTPRequest(data)
+    async def open_forwarder(self, host: str, port: int) -> HttpForwarder:
+        """Plain HTTP request: the forwarder relays it (and the next ones) by itself"""
+        credentials = None
+        if self.authenticator is not None:
+            credentials = self.request.get_header('proxy-authorization')
+
+        forwarder = HttpForwarder(
+            client=self.stream,
+            request=self.request,
+            connector=self.connector,
+            pool=self.keep_alive_pool,
+            credentials=credentials,
+            acl=self.acl,
+            user=self.user,
+        )
+        self.check_access(host, port)
+        await self.start_tunnel(host, port)
+        return await self.timed_connect(forwarder.connect, host, port)
 
-        if req.error_code:
-            await self.respond(int(req.error_code), req.error_message)
+    async def negotiate(self) -> Tuple[str, int]:
+        req = await self.receive_event()
+        self.request = req
 
-        if req.command is None or req.command.lower() != 'connect':
-            self.logger.debug(repr(data))
+        connect = req.method.upper() == 'CONNECT'
+        if not connect and not (self.forward and req.target.lower().startswith('http://')):
+            self.logger.debug(repr(req))
             await self.respond(400, 'Bad Request')
 
-        if self.username and self.password:
-            auth_header = req.headers['proxy-authorization']
+        if self.authenticator is not None:
+            auth_header = req.get_header('proxy-authorization')
 
             if not auth_header:
                 await self.respond(401, 'Unauthorized')
@@ -144,20 +176,24 @@ class HttpProxy(AbstractProxy):
             except ValueError:
                 await self.respond(401, 'Unauthorized')
             else:
-                if auth.login != self.username or auth.password != self.password:
+                if not await self.authenticator.authenticate(auth.login, auth.password):
                     await self.respond(401, 'Unauthorized')
+                self.user = auth.login
 
         try:
-            host, port = req.path.split(":")
-            port = int(port)
+            if connect:
+                host, port = req.get_authority()
+            else:
+                host, port, _, _ = parse_url(req.target)
         except ValueError:
             await self.respond(400, 'Bad Request')
             raise
 
+        self.finish_handshake()
         return host, port
 
     async def respond(self, code: int, message: str, raise_exc=True):
-        res = f'HTTP/1.1 {code} {message}\r\n\r\n'
-        await self.stream.send(res.encode('ascii'))
+        await self.flush(build_response(code, message))
         if code != 200 and raise_exc:
-            raise ProxyError(f'{code} {message}')
+            error = AuthenticationError if code == 401 else HandshakeError
+            raise error(f'{code} {message}')
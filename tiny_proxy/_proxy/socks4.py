@@ -1,47 +1,45 @@
-import enum
-import logging
 import ipaddress
-from typing import Tuple
+import logging
+from typing import Optional, Tuple
 
 import anyio
 import anyio.abc
 
+from .._bind import BindPool
+from .._connector import Connector, is_ip_address
+from .._parsers.base import AuthenticationError
 from .._stream import SocketStream
-from .._errors import ProxyError
+from .._errors import AccessDenied, AdmissionRejected, ConnectError
+from .._parsers.socks4 import (  # noqa: F401
+    RSV,
+    NULL,
+    SOCKS_VER4,
+    Command,
+    ReplyCode,
+    ReplyMessages,
+    Socks4Parser,
+    build_reply,
+)
 from .abc import AbstractProxy
 
-RSV = NULL = 0x00
-SOCKS_VER4 = 0x04
-
-
-class Command(enum.IntEnum):
-    CONNECT = 0x01
-    BIND = 0x02
-
-
-class ReplyCode(enum.IntEnum):
-    REQUEST_GRANTED = 0x5A
-    REQUEST_REJECTED_OR_FAILED = 0x5B
-    CONNECTION_FAILED = 0x5C
-    AUTHENTICATION_FAILED = 0x5D
-
-
-ReplyMessages = {
-    ReplyCode.REQUEST_GRANTED: "Request granted",
-    ReplyCode.REQUEST_REJECTED_OR_FAILED: "Request rejected or failed",
-    ReplyCode.CONNECTION_FAILED: (
-        "Request rejected because SOCKS server cannot connect to identd on the client"
-    ),
-    ReplyCode.AUTHENTICATION_FAILED: (
-        "Request rejected because the client program and identd report different user-ids"
-    ),
-}
-
 
 class Socks4Proxy(AbstractProxy):
-    def __init__(self, stream: SocketStream, username: str = None):
+    protocol = 'socks4'
+
+    def __init__(
+        self,
+        stream: SocketStream,
+        username: str = None,
+        connector: Connector = None,
+        bind_pool: Optional[BindPool] = None,
+    ):
         self.stream = stream
         self.username = username
+        self.connector = connector or Connector()
+        self.bind_pool = bind_pool
+        commands = (Command.CONNECT,) if bind_pool is None else (Command.CONNECT, Command.BIND)
+        self.parser = Socks4Parser(commands=commands)
+        self.command = Command.CONNECT
         self.logger = logging.getLogger(__name__)
 
     async def connect_to_remote(self) -> SocketStream:
@@ -57,69 +55,76 @@ class Socks4Proxy(AbstractProxy):
                 f'Connection reset by peer {self.stream.getpeername()}'
             ) from e
 
+        if self.command == Command.BIND:
+            return await self.bind(remote_host, remote_port)
+
         local_addr = self.stream.getsockname()
         remote_addr = (remote_host, remote_port)
         self.logger.info('CONNECT {} -> {}'.format(local_addr, remote_addr))
 
         try:
-            stream = await anyio.connect_tcp(remote_host=remote_host, remote_port=remote_port)
-            remote = SocketStream(stream)
+            remote = await self.open_connection(remote_host, remote_port)
+        except (AccessDenied, AdmissionRejected):
+            await self.respond(ReplyCode.REQUEST_REJECTED_OR_FAILED)
+            raise
         except OSError as e:
             await self.respond(ReplyCode.CONNECTION_FAILED)
-            raise ProxyError(f"Couldn't connect to host {remote_host}:{remote_port}") from e
+            raise ConnectError(f"Couldn't connect to host {remote_host}:{remote_port}") from e
         else:
             await self.respond(ReplyCode.REQUEST_GRANTED)
             return remote
 
     async def negotiate(self) -> Tuple[str, int]:
-        version, command = await self.stream.receive_exactly(2)
+        request = await self.receive_event()
 
-        if version != SOCKS_VER4:
-            await self.respond(ReplyCode.REQUEST_REJECTED_OR_FAILED)
-            raise ProxyError("Invalid socks version")
-
-        if command != Command.CONNECT:
-            await self.respond(ReplyCode.REQUEST_REJECTED_OR_FAILED)
-            raise ProxyError("Unsupported command")
+        if self.username and self.username != request.user_id:
+            await self.respond(ReplyCode.AUTHENTICATION_FAILED)
+            raise AuthenticationError('Authentication failed')
 
-        port = int.from_bytes(await self.stream.receive_exactly(2), "big")
-        host_bytes = await self.stream.receive_exactly(4)
+        # an unverified user id must not pick another user's rules or bandwidth
+        self.user = self.username or None
+        self.finish_handshake()
+        self.command = request.command
+        return request.host, request.port
 
-        include_hostname = host_bytes[:3] == bytes([NULL, NULL, NULL])
+    async def bind(self, peer_host: str, peer_port: int) -> SocketStream:
+        """
+        Replies with the address of a listener, then with the address of
+        the inbound connection, which is expected from peer_host
+        """
+        self.logger.info('BIND {} <- {}'.format(self.stream.getpeername(), (peer_host, peer_port)))
 
-        user = (await self.read_until_null()).decode("ascii")
-        if self.username and self.username != user:
-            await self.respond(ReplyCode.AUTHENTICATION_FAILED)
-            raise ProxyError("Authentication failed")
+        try:
+            self.check_access(peer_host, peer_port)
+            await self.start_tunnel(peer_host, peer_port)
+            listener = await self.bind_pool.acquire()
+        except (AccessDenied, AdmissionRejected):
+            await self.respond(ReplyCode.REQUEST_REJECTED_OR_FAILED)
+            raise
+        except OSError as e:
+            await self.respond(ReplyCode.REQUEST_REJECTED_OR_FAILED)
+            raise ConnectError("Couldn't listen for BIND") from e
 
-        if include_hostname:
-            host = (await self.read_until_null()).decode("ascii")
-        else:
-            host = str(ipaddress.IPv4Address(host_bytes))
-
-        return host, port
-
-    async def read_until_null(self) -> bytes:
-        data = bytearray()
-        while True:
-            byte = ord(await self.stream.receive_exactly(1))
-            if byte == NULL:
-                break
-            data.append(byte)
-        return data
-
-    async def respond(self, code: ReplyCode):
-        await self.stream.send(
-            bytes(
-                [
-                    RSV,
-                    code,
-                    NULL,
-                    NULL,
-                    NULL,
-                    NULL,
-                    NULL,
-                    NULL,
-                ]
-            )
-        )
+        try:
+            bind_host, bind_port = self.bind_pool.address(listener, self.stream.getsockname()[0])
+            await self.respond(ReplyCode.REQUEST_GRANTED, bind_host, bind_port)
+            try:
+                remote = await self.timed_connect(
+                    self.bind_pool.accept, listener, peer_host, self.connector.resolver
+                )
+            except OSError as e:
+                await self.respond(ReplyCode.REQUEST_REJECTED_OR_FAILED)
+                raise ConnectError(f'No inbound connection from {peer_host}') from e
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.bind_pool.release(listener)
+
+        remote_host, remote_port = remote.extra(anyio.abc.SocketAttribute.remote_address)[:2]
+        await self.respond(ReplyCode.REQUEST_GRANTED, remote_host, remote_port)
+        return SocketStream(remote)
+
+    async def respond(self, code: ReplyCode, host: str = '0.0.0.0', port: int = 0):
+        # SOCKS4 replies carry IPv4 addresses only
+        if not is_ip_address(host) or ipaddress.ip_address(host).version != 4:
+            host = '0.0.0.0'
+        await self.flush(build_reply(code, host, port))
@@ -1,81 +1,85 @@
-import enum
-import ipaddress
+import errno
 import logging
+import socket
+from typing import Optional, Union
 
 import anyio
 import anyio.abc
 
+from .._auth.abc import AbstractAuthenticator
+from .._auth.static import StaticAuthenticator
+from .._bind import BindPool
+from .._connector import Connector
+from .._parsers.base import AuthenticationError
 from .._stream import SocketStream
-from .._errors import ProxyError
+from .._errors import AccessDenied, AdmissionRejected, ConnectError
+from .._udp import UdpAssociation
+from .._parsers.socks5 import (  # noqa: F401
+    RSV,
+    NULL,
+    SOCKS_VER5,
+    SOCKS5_GRANTED,
+    AuthMethod,
+    AddressType,
+    Command,
+    ReplyCode,
+    ReplyMessages,
+    AuthRequest,
+    Socks5Parser,
+    build_reply,
+)
 from .abc import AbstractProxy
 
-RSV = NULL = 0x00
-SOCKS_VER5 = 0x05
-
-SOCKS5_GRANTED = 0x00
-
-
-class AuthMethod(enum.IntEnum):
-    ANONYMOUS = 0x00
-    GSSAPI = 0x01
-    USERNAME_PASSWORD = 0x02
-    NO_ACCEPTABLE = 0xFF
-
-
-class AddressType(enum.IntEnum):
-    IPV4 = 0x01
-    DOMAIN = 0x03
-    IPV6 = 0x04
-
-    @classmethod
-    def from_ip_ver(cls, ver: int):
-        if ver == 4:
-            return cls.IPV4
-        if ver == 6:
-            return cls.IPV6
-
-        raise ValueError('Invalid IP version')
-
-
-class Command(enum.IntEnum):
-    CONNECT = 0x01
-    BIND = 0x02
-    UDP_ASSOCIATE = 0x03
-
-
-class ReplyCode(enum.IntEnum):
-    SUCCEEDED = 0x00
-    GENERAL_FAILURE = 0x01
-    CONNECTION_NOT_ALLOWED = 0x02
-    NETWORK_UNREACHABLE = 0x03
-    HOST_UNREACHABLE = 0x04
-    CONNECTION_REFUSED = 0x05
-    TTL_EXPIRED = 0x06
-    COMMAND_NOT_SUPPORTED = 0x07
-    ADDRESS_TYPE_NOT_SUPPORTED = 0x08
+ERRNO_REPLY_CODES = {
+    errno.ECONNREFUSED: ReplyCode.CONNECTION_REFUSED,
+    errno.ETIMEDOUT: ReplyCode.TTL_EXPIRED,
+    errno.ENETUNREACH: ReplyCode.NETWORK_UNREACHABLE,
+    errno.ENETDOWN: ReplyCode.NETWORK_UNREACHABLE,
+    errno.EHOSTUNREACH: ReplyCode.HOST_UNREACHABLE,
+    errno.EHOSTDOWN: ReplyCode.HOST_UNREACHABLE,
+}
 
 
-ReplyMessages = {
-    ReplyCode.SUCCEEDED: 'Request granted',
-    ReplyCode.GENERAL_FAILURE: 'General SOCKS server failure',
-    ReplyCode.CONNECTION_NOT_ALLOWED: 'Connection not allowed by ruleset',
-    ReplyCode.NETWORK_UNREACHABLE: 'Network unreachable',
-    ReplyCode.HOST_UNREACHABLE: 'Host unreachable',
-    ReplyCode.CONNECTION_REFUSED: 'Connection refused by destination host',
-    ReplyCode.TTL_EXPIRED: 'TTL expired',
-    ReplyCode.COMMAND_NOT_SUPPORTED: 'Command not supported or protocol error',
-    ReplyCode.ADDRESS_TYPE_NOT_SUPPORTED: 'Address type not supported',
-}
+def reply_code_for_error(error: OSError) -> ReplyCode:
+    """Maps a failed outbound connection to the closest SOCKS5 reply code"""
+    if isinstance(error, socket.gaierror):
+        return ReplyCode.HOST_UNREACHABLE
+    if isinstance(error, TimeoutError):
+        return ReplyCode.TTL_EXPIRED
+    return ERRNO_REPLY_CODES.get(error.errno, ReplyCode.GENERAL_FAILURE)
 
 
 class Socks5Proxy(AbstractProxy):
-    def __init__(self, stream: SocketStream, username=None, password=None):
+    protocol = 'socks5'
+
+    def __init__(
+        self,
+        stream: SocketStream,
+        username=None,
+        password=None,
+        connector: Connector = None,
+        authenticator: Optional[AbstractAuthenticator] = None,
+        udp: bool = False,
+        bind_pool: Optional[BindPool] = None,
+    ):
         self.stream = stream
         self.username = username
         self.password = password
+        self.connector = connector or Connector()
+        if authenticator is None and username and password:
+            authenticator = StaticAuthenticator(username, password)
+        self.authenticator = authenticator
+        self.bind_pool = bind_pool
+        commands = [Command.CONNECT]
+        if udp:
+            commands.append(Command.UDP_ASSOCIATE)
+        if bind_pool is not None:
+            commands.append(Command.BIND)
+        self.parser = Socks5Parser(auth_required=authenticator is not None, commands=commands)
+        self.command = Command.CONNECT
         self.logger = logging.getLogger(__name__)
 
-    async def connect_to_remote(self) -> SocketStream:
+    async def connect_to_remote(self) -> Union[SocketStream, UdpAssociation]:
         try:
             remote_host, remote_port = await self.negotiate()
         except (
@@ -88,112 +92,111 @@ class Socks5Proxy(AbstractProxy):
                 f'Connection reset by peer {self.stream.getpeername()}'
             ) from e
 
+        if self.command == Command.UDP_ASSOCIATE:
+            return await self.associate_udp(remote_host, remote_port)
+        if self.command == Command.BIND:
+            return await self.bind(remote_host, remote_port)
+
         local_addr = self.stream.getsockname()
         remote_addr = (remote_host, remote_port)
         self.logger.info('CONNECT {} -> {}'.format(local_addr, remote_addr))
 
         try:
-            # todo: add timeout?
-            stream = await anyio.connect_tcp(remote_host=remote_host, remote_port=remote_port)
-            remote = SocketStream(stream)
+            remote = await self.open_connection(remote_host, remote_port)
+        except AccessDenied:
+            await self.flush(build_reply(ReplyCode.CONNECTION_NOT_ALLOWED))
+            raise
+        except AdmissionRejected:
+            await self.flush(build_reply(ReplyCode.GENERAL_FAILURE))
+            raise
         except OSError as e:
-            reply = bytes([SOCKS_VER5, ReplyCode.CONNECTION_REFUSED, NULL, NULL, NULL, NULL])
-            await self.stream.send(reply)
-            raise ProxyError(f"Couldn't connect to host {remote_host}:{remote_port}") from e
+            await self.flush(build_reply(reply_code_for_error(e)))
+            raise ConnectError(f"Couldn't connect to host {remote_host}:{remote_port}") from e
         else:
-            bind_address = remote.getsockname()
-            bind_ip = ipaddress.ip_address(bind_address[0])
-            bind_port = bind_address[1]
-
-            reply = bytearray(
-                [
-                    SOCKS_VER5,
-                    ReplyCode.SUCCEEDED,
-                    RSV,
-                    AddressType.from_ip_ver(bind_ip.version),
-                ]
-            )
-            reply += bind_ip.packed
-            reply += bind_port.to_bytes(2, 'big')
-
-            await self.stream.send(reply)
-
+            bind_host, bind_port = remote.getsockname()[:2]
+            await self.flush(build_reply(ReplyCode.SUCCEEDED, bind_host, bind_port))
             return remote
 
-    async def negotiate(self):
-        auth_required = self.username and self.password
-
-        # ------------------------AUTH METHODS---------------------
-        version, num_methods = await self.stream.receive_exactly(2)
+    async def bind(self, peer_host: str, peer_port: int) -> SocketStream:
+        """
+        Replies with the address of a listener, then with the address of
+        the inbound connection, which is expected from peer_host
+        """
+        self.logger.info('BIND {} <- {}'.format(self.stream.getpeername(), (peer_host, peer_port)))
 
-        if version != SOCKS_VER5:
-            await self.stream.send(bytes([NULL, NULL]))
-            raise ProxyError('Unsupported socks version')
-
-        methods = []
-        for i in range(num_methods):
-            methods.append(ord(await self.stream.receive_exactly(1)))
+        try:
+            self.check_access(peer_host, peer_port)
+            await self.start_tunnel(peer_host, peer_port)
+            listener = await self.bind_pool.acquire()
+        except AccessDenied:
+            await self.flush(build_reply(ReplyCode.CONNECTION_NOT_ALLOWED))
+            raise
+        except AdmissionRejected:
+            await self.flush(build_reply(ReplyCode.GENERAL_FAILURE))
+            raise
+        except OSError as e:
+            await self.flush(build_reply(ReplyCode.GENERAL_FAILURE))
+            raise ConnectError("Couldn't listen for BIND") from e
 
-        if auth_required:
-            auth_method = (
-                AuthMethod.USERNAME_PASSWORD
-                if AuthMethod.USERNAME_PASSWORD in methods
-                else AuthMethod.NO_ACCEPTABLE
-            )
-        else:
-            auth_method = (
-                AuthMethod.ANONYMOUS
-                if AuthMethod.ANONYMOUS in methods
-                else AuthMethod.NO_ACCEPTABLE
-            )
-
-        await self.stream.send(bytes([SOCKS_VER5, auth_method]))
-        if auth_method == AuthMethod.NO_ACCEPTABLE:
-            raise ProxyError('Not acceptable auth method')
-
-        # -----------------------AUTH REQUEST-----------------------
-        if auth_method == AuthMethod.USERNAME_PASSWORD:
-            version = ord(await self.stream.receive_exactly(1))
-            if version != 1:
-                await self.stream.send(bytes([version, 0xFF]))
-                raise ProxyError('Invalid auth request')
-
-            username_len = ord(await self.stream.receive_exactly(1))
-            username = (await self.stream.receive_exactly(username_len)).decode('utf-8')
-
-            password_len = ord(await self.stream.receive_exactly(1))
-            password = (await self.stream.receive_exactly(password_len)).decode('utf-8')
-
-            if username == self.username and password == self.password:
-                await self.stream.send(bytes([version, SOCKS5_GRANTED]))
-            else:
-                await self.stream.send(bytes([version, 0xFF]))
-                raise ProxyError('Authentication failed')
-
-        # --------------------------CONNECT-----------------------------
-        version, cmd, _, address_type = await self.stream.receive_exactly(4)
-
-        if version != SOCKS_VER5:
-            await self.stream.send(bytes([SOCKS_VER5, ReplyCode.GENERAL_FAILURE, RSV]))
-            raise ProxyError(ReplyMessages[ReplyCode.GENERAL_FAILURE])
-
-        if cmd != Command.CONNECT:
-            await self.stream.send(bytes([SOCKS_VER5, ReplyCode.COMMAND_NOT_SUPPORTED, RSV]))
-            raise ProxyError(ReplyMessages[ReplyCode.COMMAND_NOT_SUPPORTED])
-
-        if address_type == AddressType.IPV4:
-            remote_host = str(ipaddress.IPv4Address(await self.stream.receive_exactly(4)))
-        elif address_type == AddressType.IPV6:
-            remote_host = str(ipaddress.IPv6Address(await self.stream.receive_exactly(16)))
-        elif address_type == AddressType.DOMAIN:
-            domain_length = ord(await self.stream.receive_exactly(1))
-            remote_host = (await self.stream.receive_exactly(domain_length)).decode('ascii')
-        else:
-            await self.stream.send(
-                bytes([SOCKS_VER5, ReplyCode.ADDRESS_TYPE_NOT_SUPPORTED, NULL, NULL, NULL, NULL])
-            )
-            raise ProxyError(ReplyMessages[ReplyCode.ADDRESS_TYPE_NOT_SUPPORTED])
+        try:
+            bind_host, bind_port = self.bind_pool.address(listener, self.stream.getsockname()[0])
+            await self.flush(build_reply(ReplyCode.SUCCEEDED, bind_host, bind_port))
+            try:
+                remote = await self.timed_connect(
+                    self.bind_pool.accept, listener, peer_host, self.connector.resolver
+                )
+            except OSError as e:
+                await self.flush(build_reply(reply_code_for_error(e)))
+                raise ConnectError(f'No inbound connection from {peer_host}') from e
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.bind_pool.release(listener)
+
+        remote_host, remote_port = remote.extra(anyio.abc.SocketAttribute.remote_address)[:2]
+        await self.flush(build_reply(ReplyCode.SUCCEEDED, remote_host, remote_port))
+        return SocketStream(remote)
+
+    async def associate_udp(self, client_host: str, client_port: int) -> UdpAssociation:
+        """client_host:client_port is where the client is going to send datagrams from"""
+        self.logger.info('UDP ASSOCIATE {}'.format(self.stream.getpeername()))
 
-        remote_port = int.from_bytes(await self.stream.receive_exactly(2), 'big')
+        try:
+            await self.start_tunnel(client_host, client_port)
+            association = await self.timed_connect(self.create_udp_association, client_port)
+        except AdmissionRejected:
+            await self.flush(build_reply(ReplyCode.GENERAL_FAILURE))
+            raise
+        except OSError as e:
+            await self.flush(build_reply(ReplyCode.GENERAL_FAILURE))
+            raise ConnectError("Couldn't create UDP association") from e
+
+        bind_host, bind_port = association.getsockname()
+        await self.flush(build_reply(ReplyCode.SUCCEEDED, bind_host, bind_port))
+        return association
+
+    async def create_udp_association(self, client_port: int) -> UdpAssociation:
+        # datagrams are accepted from the client's host only, on the address it connected to
+        return UdpAssociation(
+            client_host=self.stream.getpeername()[0],
+            client_port=client_port,
+            bind_host=self.stream.getsockname()[0],
+            resolver=self.connector.resolver,
+            acl=self.acl,
+            user=self.user,
+        )
 
-        return remote_host, remote_port
+    async def negotiate(self):
+        event = await self.receive_event()
+
+        if isinstance(event, AuthRequest):
+            authenticated = await self.authenticator.authenticate(event.username, event.password)
+            self.parser.auth_result(authenticated)
+            if not authenticated:
+                await self.flush()
+                raise AuthenticationError('Authentication failed')
+            self.user = event.username
+            event = await self.receive_event()
+
+        self.finish_handshake()
+        self.command = event.command
+        return event.host, event.port
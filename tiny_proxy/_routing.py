@@ -0,0 +1,154 @@
+import collections
+import errno
+import logging
+from typing import Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from ._breaker import CircuitBreaker
+from ._connector import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_HAPPY_EYEBALLS_DELAY,
+    AddressFilter,
+    Connector,
+)
+from ._dns.abc import AbstractResolver
+from ._matcher import DestinationMatcher, PortRanges, parse_rule
+from ._stream import SocketStream
+
+logger = logging.getLogger(__name__)
+
+DIRECT = 'direct'
+BLACKHOLE = 'blackhole'
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+class RouteRule(NamedTuple):
+    """Sends the connections to destination (see AccessRule) and ports over route"""
+
+    route: str
+    destination: str = '*'
+    ports: Optional[PortRanges] = None
+
+    @classmethod
+    def parse(cls, rule: str) -> 'RouteRule':
+        """Parses '<route> <destination> [<ports>]', e.g. 'office *.corp.example.com 443'"""
+        return cls(*parse_rule(rule))
+
+
+class RoutingTable:
+    """Compiled rules and the routes they refer to, never changed once built"""
+
+    def __init__(
+        self,
+        rules: Sequence[Union[RouteRule, str]],
+        routes: Mapping[str, Connector],
+        default: str = DIRECT,
+        longest: bool = False,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.routes = dict(routes)
+        for name in (DIRECT, BLACKHOLE):
+            if name in self.routes:
+                raise ValueError(f'Route name {name!r} is reserved')
+
+        compiled = []
+        for rule in rules:
+            if isinstance(rule, str):
+                rule = RouteRule.parse(rule)
+            self._check_route(rule.route)
+            compiled.append((rule.destination, rule.ports, rule.route))
+        self._check_route(default)
+
+        self.default = default
+        self.longest = longest
+        self.cache_size = cache_size
+        self._matcher: DestinationMatcher[str] = DestinationMatcher(compiled, longest)
+        # recent decisions, the least recently used one is dropped first
+        self._cache: 'collections.OrderedDict[Tuple[str, int], str]' = collections.OrderedDict()
+
+    def lookup(self, host: str, port: int) -> str:
+        destination = (host, port)
+        route = self._cache.get(destination)
+        if route is not None:
+            self._cache.move_to_end(destination)
+            return route
+
+        route = self._matcher.match(host, port) or self.default
+        if len(self._cache) >= self.cache_size:
+            self._cache.popitem(last=False)
+        self._cache[destination] = route
+        return route
+
+    def _check_route(self, route: str):
+        if route not in self.routes and route not in (DIRECT, BLACKHOLE):
+            raise ValueError(f'Unknown route: {route!r}')
+
+
+class Router(Connector):
+    """
+    Chooses the egress route of every outbound connection by its destination
+    (see RouteRule), the first matching rule applies, or with longest
+    the most specific one, default if none matches. A route is:
+
+    direct - connected to by the router itself, as a Connector;
+    blackhole - refused with "network unreachable";
+    a name from routes - its connector, e.g. a ChainConnector for an upstream
+    proxy or a Connector with local_host for a source address.
+
+    reload() builds a new table while the current one keeps serving,
+    then swaps it in with a single assignment: a lookup sees either
+    the old rules or the new ones, never a mix
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[Union[RouteRule, str]] = (),
+        routes: Optional[Mapping[str, Connector]] = None,
+        default: str = DIRECT,
+        longest: bool = False,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        resolver: Optional[AbstractResolver] = None,
+        connect_timeout: Optional[float] = DEFAULT_CONNECT_TIMEOUT,
+        happy_eyeballs_delay: float = DEFAULT_HAPPY_EYEBALLS_DELAY,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__(resolver, connect_timeout, happy_eyeballs_delay, circuit_breaker)
+        self.table = RoutingTable(rules, routes or {}, default, longest, cache_size)
+
+    def reload(
+        self,
+        rules: Sequence[Union[RouteRule, str]],
+        routes: Optional[Mapping[str, Connector]] = None,
+        default: Optional[str] = None,
+        longest: Optional[bool] = None,
+    ):
+        """
+        Replaces the rules (and the routes, the default route, the matching mode,
+        if given), raises ValueError on invalid ones
+        """
+        table = self.table
+        if routes is None:
+            routes = table.routes
+        if default is None:
+            default = table.default
+        if longest is None:
+            longest = table.longest
+        self.table = RoutingTable(rules, routes, default, longest, table.cache_size)
+        logger.info(f'Routing table reloaded: {len(rules)} rules')
+
+    def route(self, host: str, port: int) -> str:
+        return self.table.lookup(host, port)
+
+    async def connect(
+        self,
+        host: str,
+        port: int,
+        address_filter: Optional[AddressFilter] = None,
+    ) -> SocketStream:
+        table = self.table
+        route = table.lookup(host, port)
+        if route == DIRECT:
+            return await super().connect(host, port, address_filter)
+        if route == BLACKHOLE:
+            raise OSError(errno.ENETUNREACH, f'Route to {host}:{port} is blackholed')
+        return await table.routes[route].connect(host, port, address_filter)
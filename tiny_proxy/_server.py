@@ -0,0 +1,298 @@
+import functools
+import logging
+import os
+import select
+import signal
+import socket
+import ssl
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import anyio
+import anyio.abc
+from anyio.streams.tls import TLSListener
+
+from ._compat import listener_from_socket
+from ._errors import ProxyError
+from ._handlers.base import BaseProxyHandler
+
+logger = logging.getLogger(__name__)
+
+REUSE_PORT_AVAILABLE = hasattr(socket, 'SO_REUSEPORT') and sys.platform.startswith('linux')
+
+WORKER_STARTUP_FAILED = 3
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class StartupError(ProxyError):
+    """The listening sockets couldn't be opened"""
+
+
+class Endpoint(NamedTuple):
+    handler: BaseProxyHandler
+    host: str
+    port: int
+    ssl_context: Optional[ssl.SSLContext] = None
+
+
+def _bind_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        sock.listen(socket.SOMAXCONN)
+        sock.setblocking(False)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+async def serve_endpoints(
+    endpoints: Sequence[Endpoint],
+    sockets: Optional[Sequence[socket.socket]] = None,
+    reuse_port: bool = False,
+    shutdown_timeout: float = 10.0,
+    parent_pid: Optional[int] = None,
+):
+    """
+    Serves the endpoints until SIGTERM/SIGINT is received
+    (or, if parent_pid is given, until that process goes away).
+
+    On shutdown the listeners are closed first, then active connections
+    get up to shutdown_timeout seconds to finish before they are cancelled
+    """
+    try:
+        if sockets is None:
+            listeners = [
+                await anyio.create_tcp_listener(
+                    local_host=endpoint.host, local_port=endpoint.port, reuse_port=reuse_port
+                )
+                for endpoint in endpoints
+            ]
+        else:
+            listeners = [await listener_from_socket(sock) for sock in sockets]
+    except Exception as e:
+        raise StartupError(f"Couldn't listen: {e}") from e
+
+    async def wait_shutdown(scope: anyio.CancelScope):
+        with anyio.open_signal_receiver(*SHUTDOWN_SIGNALS) as signals:
+            async for signum in signals:
+                logger.info(f'Received {signal.Signals(signum).name}, shutting down...')
+                break
+        scope.cancel()
+
+    async def watch_parent(scope: anyio.CancelScope):
+        while os.getppid() == parent_pid:
+            await anyio.sleep(1)
+        logger.warning('Parent process has exited, shutting down...')
+        scope.cancel()
+
+    async with anyio.create_task_group() as connections_tg:
+        async with anyio.create_task_group() as accept_tg:
+            for endpoint, listener in zip(endpoints, listeners):
+                if endpoint.ssl_context is not None:
+                    listener = TLSListener(listener=listener, ssl_context=endpoint.ssl_context)
+                accept_tg.start_soon(listener.serve, endpoint.handler.handle, connections_tg)
+            accept_tg.start_soon(wait_shutdown, accept_tg.cancel_scope)
+            if parent_pid is not None:
+                accept_tg.start_soon(watch_parent, accept_tg.cancel_scope)
+
+        for listener in listeners:
+            await listener.aclose()
+
+        # let the active tunnels drain
+        connections_tg.cancel_scope.deadline = anyio.current_time() + shutdown_timeout
+
+
+class MultiProcessServer:
+    """
+    Runs the endpoints in several forked worker processes, so a single proxy
+    can use all the cores of a host.
+
+    Every worker binds its own listening sockets with SO_REUSEPORT (Linux),
+    so the kernel balances incoming connections between them.
+    Otherwise the listening sockets are created once and inherited by the workers.
+
+    Crashed workers are restarted (at most once per restart_delay seconds),
+    SIGTERM/SIGINT stops all of them: the workers stop accepting
+    and wait up to shutdown_timeout seconds for active connections
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[Endpoint],
+        workers: Optional[int] = None,
+        reuse_port: Optional[bool] = None,
+        backend: str = 'asyncio',
+        shutdown_timeout: float = 10.0,
+        restart_delay: float = 1.0,
+    ):
+        if os.name != 'posix':  # pragma: no cover
+            raise RuntimeError('Multi-process mode requires a POSIX system')
+
+        self.endpoints = list(endpoints)
+        self.workers = workers or os.cpu_count() or 1
+        self.reuse_port = REUSE_PORT_AVAILABLE if reuse_port is None else reuse_port
+        self.backend = backend
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_delay = restart_delay
+
+        self._sockets: Optional[List[socket.socket]] = None
+        self._pids: Dict[int, int] = {}  # pid -> worker slot
+        self._restarts: Dict[int, float] = {}  # worker slot -> time to restart at
+        self._started: Dict[int, float] = {}  # worker slot -> time of the last start
+        self._stopping = False
+
+    @property
+    def worker_pids(self) -> List[int]:
+        return list(self._pids)
+
+    def run(self):
+        """
+        Starts the workers and supervises them until SIGTERM/SIGINT.
+        Blocks, must not be called from a running event loop
+        """
+        if not self.reuse_port:
+            self._sockets = [
+                _bind_socket(endpoint.host, endpoint.port) for endpoint in self.endpoints
+            ]
+
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_r.setblocking(False)
+        wakeup_w.setblocking(False)
+        old_wakeup_fd = signal.set_wakeup_fd(wakeup_w.fileno())
+        old_handlers = {
+            signum: signal.signal(signum, self._handle_signal)
+            for signum in SHUTDOWN_SIGNALS + (signal.SIGCHLD,)
+        }
+
+        try:
+            for slot in range(self.workers):
+                self._spawn(slot)
+            self._supervise(wakeup_r)
+        finally:
+            self._shutdown()
+            signal.set_wakeup_fd(old_wakeup_fd)
+            for signum, handler in old_handlers.items():
+                signal.signal(signum, handler)
+            wakeup_r.close()
+            wakeup_w.close()
+            for sock in self._sockets or ():
+                sock.close()
+
+    def _handle_signal(self, signum, frame):
+        if signum in SHUTDOWN_SIGNALS:
+            self._stopping = True
+
+    def _supervise(self, wakeup: socket.socket):
+        while not self._stopping:
+            self._reap()
+
+            now = time.monotonic()
+            for slot, restart_at in list(self._restarts.items()):
+                if restart_at <= now:
+                    del self._restarts[slot]
+                    self._spawn(slot)
+
+            timeout = min(self._restarts.values(), default=now + 1.0) - now
+            select.select([wakeup], [], [], max(timeout, 0))
+            try:
+                while wakeup.recv(4096):
+                    pass
+            except OSError:
+                pass
+
+    def _reap(self):
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            slot = self._pids.pop(pid, None)
+            if slot is None or self._stopping:
+                continue
+
+            code = _exit_code(status)
+            if code == WORKER_STARTUP_FAILED:
+                raise ProxyError(f"Worker {pid} couldn't start serving")
+
+            logger.warning(f'Worker {pid} exited unexpectedly ({code}), restarting...')
+            self._restarts[slot] = self._started[slot] + self.restart_delay
+
+    def _spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            os._exit(self._run_worker())
+
+        logger.info(f'Started worker {pid}')
+        self._pids[pid] = slot
+        self._started[slot] = time.monotonic()
+
+    def _run_worker(self) -> int:  # pragma: no cover
+        parent_pid = os.getppid()
+        signal.set_wakeup_fd(-1)
+        for signum in SHUTDOWN_SIGNALS + (signal.SIGCHLD,):
+            signal.signal(signum, signal.SIG_DFL)
+
+        try:
+            anyio.run(
+                functools.partial(
+                    serve_endpoints,
+                    self.endpoints,
+                    sockets=self._sockets,
+                    reuse_port=self.reuse_port,
+                    shutdown_timeout=self.shutdown_timeout,
+                    parent_pid=parent_pid,
+                ),
+                backend=self.backend,
+            )
+        except StartupError as e:
+            # restarting wouldn't help
+            logger.error(f'Worker {os.getpid()} failed to start: {e}')
+            return WORKER_STARTUP_FAILED
+        except BaseException as e:
+            logger.exception(e)
+            return 1
+        return 0
+
+    def _shutdown(self):
+        self._stopping = True
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.shutdown_timeout + 1.0
+        while self._pids and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.05)
+            else:
+                self._pids.pop(pid, None)
+
+        for pid in self._pids:
+            logger.warning(f'Worker {pid} did not stop in time, killing it')
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self._pids.clear()
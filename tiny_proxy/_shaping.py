@@ -0,0 +1,170 @@
+from typing import Dict, List, Optional, Set
+
+import anyio
+
+# throttles that relayed data within this many seconds share the bandwidth,
+# the shares are recomputed once per this period
+ACTIVE_WINDOW = 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket in bytes. reserve() takes the tokens for a whole chunk at once
+    and may go into debt, the caller sleeps until the debt is paid off
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float = 0.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, size: int, now: float) -> float:
+        """Takes size tokens and returns how long to wait before sending"""
+        self.refill(now)
+        self.tokens -= size
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def set_rate(self, rate: float, burst: float, now: float):
+        self.refill(now)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = min(self.tokens, burst)
+
+
+class _Group:
+    """Throttles of one user"""
+
+    __slots__ = ('bucket', 'throttles')
+
+    def __init__(self):
+        self.bucket: Optional[TokenBucket] = None
+        self.throttles: Set['Throttle'] = set()
+
+
+class Shaper:
+    """
+    Hierarchical token bucket bandwidth shaping: global -> per user -> per connection.
+    Rates are in bytes per second (both directions of a tunnel together),
+    None disables a level. Buckets hold up to burst seconds worth of tokens.
+
+    A level's rate is shared equally between its active children (see ACTIVE_WINDOW):
+    the global rate between users, a user's rate between the user's connections,
+    so a bulk transfer can't starve the others. Connections without a user
+    share a single anonymous group
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        user_rate: Optional[float] = None,
+        connection_rate: Optional[float] = None,
+        burst: float = 0.25,
+    ):
+        self.rate = rate
+        self.user_rate = user_rate
+        self.connection_rate = connection_rate
+        self.burst = burst
+        self.bucket = None if rate is None else TokenBucket(rate, rate * burst)
+        self._groups: Dict[Optional[str], _Group] = {}
+        self._rebalanced = -ACTIVE_WINDOW
+
+    def open(self, user: Optional[str] = None) -> 'Throttle':
+        group = self._groups.get(user)
+        if group is None:
+            group = self._groups[user] = _Group()
+        throttle = Throttle(self, user, group)
+        group.throttles.add(throttle)
+
+        # full rates until the next rebalance assigns the fair shares
+        now = anyio.current_time()
+        user_rate = _min_rate(self.user_rate, self.rate)
+        if user_rate is not None and group.bucket is None:
+            group.bucket = TokenBucket(user_rate, user_rate * self.burst, now)
+        connection_rate = _min_rate(self.connection_rate, user_rate)
+        if connection_rate is not None:
+            throttle.bucket = TokenBucket(connection_rate, connection_rate * self.burst, now)
+        return throttle
+
+    def close(self, throttle: 'Throttle'):
+        group = self._groups.get(throttle.user)
+        if group is not None:
+            group.throttles.discard(throttle)
+            if not group.throttles:
+                del self._groups[throttle.user]
+
+    def reserve(self, throttle: 'Throttle', size: int, now: float) -> float:
+        if now - self._rebalanced >= ACTIVE_WINDOW:
+            self.rebalance(now)
+        throttle.active_at = now
+
+        delay = 0.0
+        for bucket in (self.bucket, throttle.group.bucket, throttle.bucket):
+            if bucket is not None:
+                delay = max(delay, bucket.reserve(size, now))
+        return delay
+
+    def rebalance(self, now: float):
+        self._rebalanced = now
+        since = now - ACTIVE_WINDOW
+
+        active: Dict[_Group, List[Throttle]] = {}
+        for group in self._groups.values():
+            active[group] = [t for t in group.throttles if t.active_at >= since]
+        users = sum(1 for throttles in active.values() if throttles) or 1
+
+        for group, throttles in active.items():
+            user_rate = _min_rate(self.user_rate, self.rate and self.rate / users)
+            if user_rate is None:
+                group.bucket = None
+            else:
+                group.bucket = self._update(group.bucket, user_rate, now)
+
+            connection_rate = _min_rate(
+                self.connection_rate, user_rate and user_rate / (len(throttles) or 1)
+            )
+            for throttle in group.throttles:
+                if connection_rate is None:
+                    throttle.bucket = None
+                else:
+                    throttle.bucket = self._update(throttle.bucket, connection_rate, now)
+
+    def _update(self, bucket: Optional[TokenBucket], rate: float, now: float) -> TokenBucket:
+        if bucket is None:
+            return TokenBucket(rate, rate * self.burst, now)
+        bucket.set_rate(rate, rate * self.burst, now)
+        return bucket
+
+
+def _min_rate(*rates: Optional[float]) -> Optional[float]:
+    rates = [rate for rate in rates if rate]
+    return min(rates) if rates else None
+
+
+class Throttle:
+    """Bandwidth limit of a single tunnel, the relay loops call consume() per chunk"""
+
+    __slots__ = ('shaper', 'user', 'group', 'bucket', 'active_at')
+
+    def __init__(self, shaper: Shaper, user: Optional[str], group: _Group):
+        self.shaper = shaper
+        self.user = user
+        self.group = group
+        self.bucket: Optional[TokenBucket] = None
+        self.active_at = -ACTIVE_WINDOW
+
+    async def consume(self, size: int):
+        delay = self.shaper.reserve(self, size, anyio.current_time())
+        if delay > 0:
+            await anyio.sleep(delay)
+
+    def close(self):
+        self.shaper.close(self)
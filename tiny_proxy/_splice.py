@@ -0,0 +1,119 @@
+import os
+import socket
+import sys
+from typing import Optional
+
+import anyio
+
+from ._compat import wait_readable, wait_writable
+from ._stream import SocketStream, DEFAULT_RECEIVE_SIZE
+from ._traffic import FLUSH_CHUNKS, TrafficCounter
+
+SPLICE_AVAILABLE = sys.platform.startswith('linux') and hasattr(os, 'splice')
+
+if SPLICE_AVAILABLE:
+    SPLICE_FLAGS = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+else:  # pragma: no cover
+    SPLICE_FLAGS = 0
+
+
+def can_splice(*endpoints: SocketStream) -> bool:
+    return SPLICE_AVAILABLE and all(endpoint.supports_raw_io for endpoint in endpoints)
+
+
+async def _sendall(sock: socket.socket, data: bytes):
+    view = memoryview(data)
+    while view:
+        try:
+            sent = sock.send(view)
+        except BlockingIOError:
+            await wait_writable(sock)
+        else:
+            view = view[sent:]
+
+
+async def _splice_pipe(
+    src: socket.socket,
+    dst: socket.socket,
+    pending: bytes,
+    traffic: Optional[TrafficCounter] = None,
+    upstream: bool = True,
+):
+    """
+    Moves data from src to dst through a kernel pipe,
+    so the payload never gets copied into user space
+    """
+    if pending:
+        await _sendall(dst, pending)
+
+    relayed = len(pending)
+    chunks = 0
+    flush_chunks = FLUSH_CHUNKS if traffic is None else traffic.flush_chunks
+    pipe_r, pipe_w = os.pipe()
+    try:
+        os.set_blocking(pipe_r, False)
+        os.set_blocking(pipe_w, False)
+
+        while True:
+            await wait_readable(src)
+            try:
+                size = os.splice(src.fileno(), pipe_w, DEFAULT_RECEIVE_SIZE, flags=SPLICE_FLAGS)
+            except BlockingIOError:
+                continue
+
+            if size == 0:  # EOF
+                break
+
+            relayed += size
+            chunks += 1
+            if chunks == flush_chunks:
+                if traffic is not None:
+                    traffic.add(upstream, relayed)
+                relayed = chunks = 0
+
+            while size:
+                try:
+                    size -= os.splice(pipe_r, dst.fileno(), size, flags=SPLICE_FLAGS)
+                except BlockingIOError:
+                    await wait_writable(dst)
+    finally:
+        if traffic is not None:
+            traffic.add(upstream, relayed)
+        os.close(pipe_r)
+        os.close(pipe_w)
+
+
+async def splice_tunnel(
+    endpoint1: SocketStream,
+    endpoint2: SocketStream,
+    traffic: Optional[TrafficCounter] = None,
+):
+    sock1 = endpoint1.dup_socket()
+    sock2 = endpoint2.dup_socket()
+
+    async def pipe(src, dst, pending: bytes):
+        try:
+            await _splice_pipe(src, dst, pending, traffic, upstream=src is sock1)
+        except (
+            OSError,
+            anyio.ClosedResourceError,
+            anyio.BrokenResourceError,
+        ):
+            pass
+        finally:
+            # like the regular relay, the tunnel ends when either side is done
+            tg.cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(pipe, sock1, sock2, endpoint1.take_buffered())
+            tg.start_soon(pipe, sock2, sock1, endpoint2.take_buffered())
+    finally:
+        for sock in (sock1, sock2):
+            try:
+                sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            sock.close()
+        await endpoint1.aclose()
+        await endpoint2.aclose()
@@ -1,6 +1,12 @@
+import os
+import socket
+
 import anyio
 import anyio.abc
 from anyio.streams.buffered import BufferedByteReceiveStream
+from anyio.streams.tls import TLSStream
+
+from ._compat import wait_readable, wait_writable
 
 DEFAULT_RECEIVE_SIZE = 65536
 
@@ -9,7 +15,11 @@ class SocketStream:
     def __init__(self, stream: anyio.abc.SocketStream):
         self._stream = stream
         self._buffered = BufferedByteReceiveStream(stream)
+        self._receive_stream = self._buffered
         self._closing = False
+        self._raw = None
+        self._pending = b''
+        self._close_callbacks = []
 
     async def send(self, data: bytes) -> None:
         await self._stream.send(data)
@@ -18,7 +28,7 @@ class SocketStream:
         await self._stream.send_eof()
 
     async def receive(self, max_bytes=DEFAULT_RECEIVE_SIZE) -> bytes:
-        return await self._buffered.receive(max_bytes)
+        return await self._receive_stream.receive(max_bytes)
 
     async def receive_exactly(self, n) -> bytes:
         return await self._buffered.receive_exactly(n)
@@ -26,14 +36,178 @@ class SocketStream:
     async def receive_until(self, delimiter: bytes, max_bytes: int) -> bytes:
         return await self._buffered.receive_until(delimiter, max_bytes)
 
+    async def peek(self, max_bytes=DEFAULT_RECEIVE_SIZE) -> bytes:
+        """Receives data and leaves it in the buffer, so the next receive() returns it again"""
+        data = await self.receive(max_bytes)
+        self.unreceive(data)
+        return data
+
+    def unreceive(self, data: bytes) -> None:
+        """Puts data back in front of the receive buffer"""
+        if data:
+            self._buffered._buffer[:0] = data
+
+    async def receive_into(self, buffer: memoryview) -> int:
+        """
+        Receives data directly into the given buffer and returns the number of bytes read.
+        Without raw socket I/O (see supports_raw_io) the data is received and copied
+        """
+        if not self.supports_raw_io:
+            data = await self.receive(len(buffer))
+            buffer[: len(data)] = data
+            return len(data)
+
+        sock = self._raw_socket()
+
+        if self._pending:
+            size = min(len(buffer), len(self._pending))
+            buffer[:size] = self._pending[:size]
+            self._pending = self._pending[size:]
+            return size
+
+        while True:
+            if self._closing:
+                raise anyio.ClosedResourceError
+
+            await wait_readable(sock)
+            try:
+                size = sock.recv_into(buffer)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                raise anyio.BrokenResourceError from e
+
+            if size == 0:
+                raise anyio.EndOfStream
+
+            return size
+
+    async def send_from(self, data: memoryview) -> None:
+        """
+        Sends the contents of a buffer that will be reused by the caller
+        as soon as this method returns
+        """
+        if not self.supports_raw_io:
+            # SSLObject.write() copies the data, anything else has to get its own copy
+            await self._stream.send(data if self.is_tls else bytes(data))
+            return
+
+        # asyncio transports may keep a reference to the data they couldn't send at once,
+        # so reusable buffers are written to the socket directly
+        sock = self._raw_socket()
+        while data:
+            if self._closing:
+                raise anyio.ClosedResourceError
+
+            try:
+                sent = sock.send(data)
+            except BlockingIOError:
+                await wait_writable(sock)
+                continue
+            except OSError as e:
+                raise anyio.BrokenResourceError from e
+
+            data = data[sent:]
+
+    def _raw_socket(self) -> socket.socket:
+        if self._raw is None:
+            self._pending = self.take_buffered()
+            self._raw = self.dup_socket()
+        return self._raw
+
+    def on_close(self, callback) -> None:
+        """Registers a function to be called (without arguments) once the stream is closed"""
+        self._close_callbacks.append(callback)
+
     async def aclose(self):
         if not self._closing:
             self._closing = True
+            for callback in self._close_callbacks:
+                callback()
             try:
                 # underlying TLSStream.aclose() -> TLSStream.unwrap()
                 await self._buffered.aclose()
             except (anyio.BrokenResourceError, anyio.BusyResourceError):
                 pass
+            finally:
+                if self._raw is not None:
+                    self._raw.close()
+
+    def detach(self) -> bytes:
+        """
+        Switches receive() to the underlying stream once the handshake is done
+        and returns the bytes that are left in the buffer
+        """
+        data = bytes(self._buffered._buffer)
+        self._buffered._buffer.clear()
+        self._receive_stream = self._stream
+        return data
+
+    @property
+    def is_tls(self) -> bool:
+        return isinstance(self._stream, TLSStream)
+
+    @property
+    def supports_raw_io(self) -> bool:
+        """
+        Whether the socket can be read and written directly. Taking over
+        the data anyio has already read relies on its private state,
+        so streams of a backend that doesn't have it are left to receive()
+        """
+        if self._raw is not None:
+            return True
+        if os.name != 'posix' or self.is_tls:
+            return False
+        if not isinstance(getattr(self._buffered, '_buffer', None), bytearray):
+            return False
+
+        backend = type(self._stream).__module__
+        if backend == 'anyio._backends._trio':
+            # nothing is read ahead of receive()
+            return True
+        if backend == 'anyio._backends._asyncio':
+            transport = getattr(self._stream, '_transport', None)
+            protocol = getattr(self._stream, '_protocol', None)
+            return (
+                hasattr(transport, 'pause_reading')
+                and hasattr(protocol, 'read_queue')
+                and hasattr(protocol, 'read_event')
+            )
+        return False
+
+    def take_buffered(self) -> bytes:
+        """
+        Returns and forgets the bytes that were already read from the socket
+        but not consumed yet (e.g. data pipelined behind the handshake)
+        """
+        data = self.detach()
+
+        # asyncio backend: accepted sockets are read by the transport until
+        # the first receive() that has to wait, stop it from competing for the data
+        # and take the chunks the protocol has already queued
+        transport = getattr(self._stream, '_transport', None)
+        if transport is not None:
+            transport.pause_reading()
+
+        protocol = getattr(self._stream, '_protocol', None)
+        read_queue = getattr(protocol, 'read_queue', None)
+        if read_queue:
+            data += b''.join(read_queue)
+            read_queue.clear()
+            protocol.read_event.clear()
+
+        return data
+
+    def dup_socket(self) -> socket.socket:
+        """
+        Returns a non-blocking duplicate of the underlying socket.
+        asyncio refuses to watch a file descriptor owned by a transport,
+        so raw socket I/O has to go through a duplicated descriptor
+        """
+        raw_socket = self._stream.extra(anyio.abc.SocketAttribute.raw_socket)
+        sock = socket.socket(fileno=os.dup(raw_socket.fileno()))
+        sock.setblocking(False)
+        return sock
 
     def getpeername(self):
         return self._stream.extra(anyio.abc.SocketAttribute.remote_address, '')
@@ -0,0 +1,189 @@
+import math
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, TypeVar
+
+import anyio
+import anyio.abc
+
+from ._errors import DeadlineExceeded
+from ._traffic import TrafficCounter
+
+T = TypeVar('T')
+
+# an idle tunnel is checked this many times per idle timeout
+IDLE_CHECKS = 4
+
+
+class Timeouts(NamedTuple):
+    """
+    Per-connection limits in seconds, None disables a limit.
+    handshake: until the request is negotiated (connecting to the destination
+    is bounded by the connector), idle: with no data relayed in either direction,
+    lifetime: of the whole connection
+    """
+
+    handshake: Optional[float] = None
+    idle: Optional[float] = None
+    lifetime: Optional[float] = None
+
+
+class Timer:
+    __slots__ = ('callback', 'rounds', '_bucket')
+
+    def __init__(self, callback: Callable[[], None], rounds: int, bucket: Set['Timer']):
+        self.callback = callback
+        self.rounds = rounds
+        self._bucket = bucket
+
+    def cancel(self):
+        self._bucket.discard(self)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: timers are put into one of the slots by their expiration
+    tick, a tick only looks at a single slot. Scheduling and cancelling are O(1)
+    and there's a single sleeping task no matter how many timers there are.
+
+    Timers fire with the precision of resolution seconds, which is fine
+    for connection timeouts. The wheel is driven by the connections that use it
+    (see driven()), so it needs no task of its own and sleeps when it's unused.
+    A wheel must only be used from one event loop
+    """
+
+    def __init__(self, resolution: float = 1.0, slots: int = 512):
+        if resolution <= 0 or slots < 1:
+            raise ValueError('resolution and slots must be positive')
+
+        self.resolution = resolution
+        self._slots: List[Set[Timer]] = [set() for _ in range(slots)]
+        self._position = 0
+        # task groups of the users, in the order they came (a dict as an ordered set)
+        self._groups: Dict[anyio.abc.TaskGroup, None] = {}
+        self._driver: Optional[anyio.abc.TaskGroup] = None
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> Timer:
+        ticks = max(1, math.ceil(delay / self.resolution))
+        slots = len(self._slots)
+        bucket = self._slots[(self._position + ticks) % slots]
+        timer = Timer(callback, (ticks - 1) // slots, bucket)
+        bucket.add(timer)
+        return timer
+
+    def tick(self):
+        self._position = (self._position + 1) % len(self._slots)
+        bucket = self._slots[self._position]
+        expired = []
+        for timer in bucket:
+            if timer.rounds:
+                timer.rounds -= 1
+            else:
+                expired.append(timer)
+
+        for timer in expired:
+            bucket.discard(timer)
+            timer.callback()
+
+    @asynccontextmanager
+    async def driven(self):
+        """
+        Keeps the wheel ticking while the block runs. The ticker runs in the task
+        group of one of the users, when that user is done (or cancelled)
+        it's restarted in the task group of the longest remaining one
+        """
+        async with anyio.create_task_group() as tg:
+            self._groups[tg] = None
+            if self._driver is None:
+                self._driver = tg
+                tg.start_soon(self._drive)
+            try:
+                yield
+            finally:
+                del self._groups[tg]
+                tg.cancel_scope.cancel()
+                if self._driver is tg:
+                    self._driver = next(iter(self._groups), None)
+                    if self._driver is not None:
+                        self._driver.start_soon(self._drive)
+
+    async def _drive(self):
+        while True:
+            await anyio.sleep(self.resolution)
+            self.tick()
+
+
+class Deadlines:
+    """Enforces Timeouts of a single connection, run() executes the connection phases"""
+
+    def __init__(self, wheel: TimerWheel, timeouts: Timeouts):
+        self.wheel = wheel
+        self.timeouts = timeouts
+        self.expired: Optional[DeadlineExceeded] = None
+        self._scope: Optional[anyio.CancelScope] = None
+        self._traffic: Optional[TrafficCounter] = None
+        self._relayed = 0
+        self._idle_checks = 0
+        self._handshake_timer = self._idle_timer = self._lifetime_timer = None
+
+        if timeouts.handshake is not None:
+            self._handshake_timer = wheel.call_later(
+                timeouts.handshake,
+                lambda: self._expire('Handshake timed out', 'handshake_timeout'),
+            )
+        if timeouts.lifetime is not None:
+            self._lifetime_timer = wheel.call_later(
+                timeouts.lifetime,
+                lambda: self._expire('Connection lifetime exceeded', 'lifetime_exceeded'),
+            )
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Runs func until it returns or any of the deadlines expires"""
+        if self.expired is None:
+            try:
+                with anyio.CancelScope() as self._scope:
+                    return await func(*args)
+            finally:
+                self._scope = None
+        raise self.expired
+
+    def negotiated(self):
+        if self._handshake_timer is not None:
+            self._handshake_timer.cancel()
+            self._handshake_timer = None
+
+    def watch_idle(self, traffic: TrafficCounter):
+        """Starts the idle timeout, the relay loops must report every chunk to traffic"""
+        if self.timeouts.idle is None:
+            return
+        traffic.flush_chunks = 1
+        self._traffic = traffic
+        self._idle_timer = self.wheel.call_later(
+            self.timeouts.idle / IDLE_CHECKS, self._check_idle
+        )
+
+    def cancel(self):
+        for timer in (self._handshake_timer, self._idle_timer, self._lifetime_timer):
+            if timer is not None:
+                timer.cancel()
+
+    def _check_idle(self):
+        relayed = self._traffic.upstream + self._traffic.downstream
+        if relayed != self._relayed:
+            self._relayed = relayed
+            self._idle_checks = 0
+        else:
+            self._idle_checks += 1
+
+        if self._idle_checks >= IDLE_CHECKS:
+            self._expire('Connection idle timeout', 'idle_timeout')
+        else:
+            self._idle_timer = self.wheel.call_later(
+                self.timeouts.idle / IDLE_CHECKS, self._check_idle
+            )
+
+    def _expire(self, message: str, reason: str):
+        if self.expired is None:
+            self.expired = DeadlineExceeded(message, reason)
+            self.cancel()
+            if self._scope is not None:
+                self._scope.cancel()
@@ -0,0 +1,23 @@
+# relay loops report the relayed bytes once per this many chunks (and when they finish)
+FLUSH_CHUNKS = 16
+
+
+class TrafficCounter:
+    """
+    Bytes relayed by a tunnel: upstream is from the first endpoint (the client)
+    to the second one, downstream is the opposite direction.
+    Relay loops report to it once per flush_chunks chunks
+    """
+
+    __slots__ = ('upstream', 'downstream', 'flush_chunks')
+
+    def __init__(self, flush_chunks: int = FLUSH_CHUNKS):
+        self.upstream = 0
+        self.downstream = 0
+        self.flush_chunks = flush_chunks
+
+    def add(self, upstream: bool, size: int):
+        if upstream:
+            self.upstream += size
+        else:
+            self.downstream += size
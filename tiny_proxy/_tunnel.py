@@ -1,10 +1,58 @@
+from typing import Optional
+
 import anyio
 
+from ._asyncio_relay import can_relay_with_protocols, relay_with_protocols
+from ._buffers import BufferPool
+from ._shaping import Throttle
+from ._splice import can_splice, splice_tunnel
 from ._stream import SocketStream, DEFAULT_RECEIVE_SIZE
+from ._traffic import FLUSH_CHUNKS, TrafficCounter
+
+
+async def create_tunnel(
+    endpoint1: SocketStream,
+    endpoint2: SocketStream,
+    splice: bool = False,
+    buffer_pool: Optional[BufferPool] = None,
+    asyncio_relay: bool = False,
+    traffic: Optional[TrafficCounter] = None,
+    throttle: Optional[Throttle] = None,
+):
+    # data pipelined behind the handshake (e.g. TLS ClientHello) goes first,
+    # after that the buffering layer is bypassed
+    for reader, writer in ((endpoint1, endpoint2), (endpoint2, endpoint1)):
+        pending = reader.detach()
+        if pending:
+            if throttle is not None:
+                await throttle.consume(len(pending))
+            await writer.send(pending)
+            if traffic is not None:
+                traffic.add(reader is endpoint1, len(pending))
+
+    # only the relay loops below can be throttled
+    if throttle is not None:
+        splice = asyncio_relay = False
+
+    if splice and can_splice(endpoint1, endpoint2):
+        await splice_tunnel(endpoint1, endpoint2, traffic)
+        return
 
+    if asyncio_relay and can_relay_with_protocols(endpoint1, endpoint2):
+        await relay_with_protocols(endpoint1, endpoint2, traffic)
+        return
+
+    # TLS and streams whose buffered data can't be taken over are relayed with receive(),
+    # copying into a pooled buffer would only add to the bytes it allocates
+    if buffer_pool is not None and endpoint1.supports_raw_io and endpoint2.supports_raw_io:
+        await _create_pooled_tunnel(endpoint1, endpoint2, buffer_pool, traffic, throttle)
+        return
+
+    flush_chunks = FLUSH_CHUNKS if traffic is None else traffic.flush_chunks
 
-async def create_tunnel(endpoint1: SocketStream, endpoint2: SocketStream):
     async def pipe(reader: SocketStream, writer: SocketStream):
+        # relayed bytes are summed up locally and reported in batches
+        relayed = chunks = 0
         try:
             while True:
                 try:
@@ -16,6 +64,9 @@ async def create_tunnel(endpoint1: SocketStream, endpoint2: SocketStream):
                 ):
                     break
 
+                if throttle is not None:
+                    await throttle.consume(len(data))
+
                 try:
                     await writer.send(data)
                 except (
@@ -23,9 +74,65 @@ async def create_tunnel(endpoint1: SocketStream, endpoint2: SocketStream):
                     anyio.BrokenResourceError,
                 ):
                     break
+
+                relayed += len(data)
+                chunks += 1
+                if chunks == flush_chunks:
+                    if traffic is not None:
+                        traffic.add(reader is endpoint1, relayed)
+                    relayed = chunks = 0
         finally:
+            if traffic is not None:
+                traffic.add(reader is endpoint1, relayed)
             await writer.aclose()
 
     async with anyio.create_task_group() as tg:
         tg.start_soon(pipe, endpoint1, endpoint2)
         tg.start_soon(pipe, endpoint2, endpoint1)
+
+
+async def _create_pooled_tunnel(
+    endpoint1: SocketStream,
+    endpoint2: SocketStream,
+    buffer_pool: BufferPool,
+    traffic: Optional[TrafficCounter] = None,
+    throttle: Optional[Throttle] = None,
+):
+    flush_chunks = FLUSH_CHUNKS if traffic is None else traffic.flush_chunks
+
+    async def pipe(reader: SocketStream, writer: SocketStream):
+        buffer = buffer_pool.checkout()
+        relayed = chunks = 0
+        try:
+            while True:
+                size = await reader.receive_into(buffer)
+                if throttle is not None:
+                    await throttle.consume(size)
+                await writer.send_from(buffer[:size])
+
+                relayed += size
+                chunks += 1
+                if chunks == flush_chunks:
+                    if traffic is not None:
+                        traffic.add(reader is endpoint1, relayed)
+                    relayed = chunks = 0
+        except (
+            anyio.EndOfStream,
+            anyio.ClosedResourceError,
+            anyio.BrokenResourceError,
+        ):
+            pass
+        finally:
+            if traffic is not None:
+                traffic.add(reader is endpoint1, relayed)
+            buffer_pool.checkin(buffer)
+            # the other direction may be waiting on a socket we are about to close
+            tg.cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(pipe, endpoint1, endpoint2)
+            tg.start_soon(pipe, endpoint2, endpoint1)
+    finally:
+        await endpoint1.aclose()
+        await endpoint2.aclose()
@@ -0,0 +1,273 @@
+import logging
+import socket
+from typing import Dict, Optional, Set, Tuple
+
+import anyio
+import anyio.abc
+
+from ._acl import AccessList
+from ._compat import wait_readable, wait_writable
+from ._connector import is_ip_address
+from ._dns.abc import AbstractResolver
+from ._dns.cache import CachingResolver
+from ._parsers.socks5 import build_udp_header, parse_udp_header
+from ._shaping import Throttle
+from ._stream import SocketStream
+from ._traffic import TrafficCounter
+
+logger = logging.getLogger(__name__)
+
+# datagrams read from a socket per readiness notification
+BATCH_SIZE = 64
+MAX_DATAGRAM_SIZE = 65535
+# room for the longest reply header (IPv6) in front of a received payload
+HEADER_ROOM = 4 + 16 + 2
+# destinations remembered (and names being resolved) per association
+MAX_PEERS = 1024
+
+Address = Tuple[str, int]
+
+
+def _family(host: str) -> socket.AddressFamily:
+    return socket.AF_INET6 if ':' in host else socket.AF_INET
+
+
+def _create_socket(family: socket.AddressFamily, host: str) -> socket.socket:
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(False)
+        sock.bind((host, 0))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+class UdpAssociation:
+    """
+    Relays the datagrams of a SOCKS5 UDP ASSOCIATE request (RFC 1928, section 7).
+
+    The client sends datagrams with a request header to the association socket,
+    they are forwarded to the destinations without the header. Datagrams from
+    the destinations the client has sent to are relayed back with a header
+    written in front of the payload, in the same buffer, so neither direction
+    copies the payload. Every readiness notification drains up to BATCH_SIZE
+    datagrams from the socket.
+
+    Datagrams from other addresses, fragmented or malformed ones and those
+    to destinations the access list denies are dropped. Destination names
+    are resolved in the background with a CachingResolver (resolver itself
+    if it's one), datagrams to a name are dropped until its address is known.
+    The association lives as long as the controlling TCP connection
+    """
+
+    def __init__(
+        self,
+        client_host: str,
+        client_port: int,
+        bind_host: str,
+        resolver: AbstractResolver,
+        acl: Optional[AccessList] = None,
+        user: Optional[str] = None,
+    ):
+        self.client_host = client_host
+        # the client may not know its port yet, then its first datagram tells it
+        self.client_address: Optional[Address] = None
+        if client_port:
+            self.client_address = (client_host, client_port)
+        if not isinstance(resolver, CachingResolver):
+            resolver = CachingResolver(resolver, max_size=MAX_PEERS)
+        self.resolver = resolver
+        self.acl = acl
+        self.user = user
+
+        self._socket = _create_socket(_family(bind_host), bind_host)
+        self._sockets = {self._socket.family: self._socket}
+        self._peers: Dict[Address, bytes] = {}
+        self._resolving: Set[str] = set()
+        self._task_group: Optional[anyio.abc.TaskGroup] = None
+
+    def getsockname(self) -> Address:
+        return self._socket.getsockname()[:2]
+
+    async def relay(
+        self,
+        client: SocketStream,
+        traffic: Optional[TrafficCounter] = None,
+        throttle: Optional[Throttle] = None,
+    ):
+        async with anyio.create_task_group() as tg:
+            self._task_group = tg
+            tg.start_soon(self._receive, self._socket, traffic, throttle)
+
+            # nothing but EOF is expected on the controlling connection
+            try:
+                while True:
+                    await client.receive()
+            except (anyio.EndOfStream, anyio.BrokenResourceError, anyio.ClosedResourceError):
+                pass
+            tg.cancel_scope.cancel()
+
+    async def aclose(self):
+        for sock in self._sockets.values():
+            sock.close()
+
+    async def _receive(
+        self,
+        sock: socket.socket,
+        traffic: Optional[TrafficCounter],
+        throttle: Optional[Throttle],
+    ):
+        buffer = memoryview(bytearray(HEADER_ROOM + MAX_DATAGRAM_SIZE))
+        payload = buffer[HEADER_ROOM:]
+
+        while True:
+            await wait_readable(sock)
+            upstream = downstream = 0
+            for _ in range(BATCH_SIZE):
+                try:
+                    size, address = sock.recvfrom_into(payload)
+                except BlockingIOError:
+                    break
+                except OSError as e:
+                    # e.g. ICMP errors of earlier datagrams on some platforms
+                    logger.debug(e)
+                    continue
+
+                address = address[:2]
+                if sock is self._socket and self._is_client(address):
+                    upstream += await self._forward(payload[:size], traffic, throttle)
+                else:
+                    downstream += await self._reply(buffer, size, address, throttle)
+
+            if traffic is not None:
+                if upstream:
+                    traffic.add(True, upstream)
+                if downstream:
+                    traffic.add(False, downstream)
+
+    def _is_client(self, address: Address) -> bool:
+        if self.client_address is None:
+            if address[0] != self.client_host:
+                return False
+            self.client_address = address
+        return address == self.client_address
+
+    async def _forward(
+        self,
+        data: memoryview,
+        traffic: Optional[TrafficCounter],
+        throttle: Optional[Throttle],
+    ) -> int:
+        """Sends a client datagram to its destination, returns the payload size"""
+        try:
+            host, port, offset = parse_udp_header(data)
+        except ValueError as e:
+            logger.debug(f'Dropped datagram from {self.client_address}: {e}')
+            return 0
+
+        if self.acl is not None and not self.acl.allows(host, port, self.user):
+            logger.debug(f'Dropped datagram to {host}:{port}: access denied')
+            return 0
+
+        resolved = self._lookup(host)
+        if resolved is None:
+            logger.debug(f'Dropped datagram to {host}:{port}: the name is being resolved')
+            return 0
+
+        address = (resolved, port)
+        if self.acl is not None and not self.acl.allows(host, port, self.user, address[0]):
+            logger.debug(f'Dropped datagram to {host}:{port} ({address[0]}): access denied')
+            return 0
+
+        try:
+            sock = self._socket_for(_family(address[0]), traffic, throttle)
+        except OSError as e:
+            logger.debug(f"Couldn't send datagram to {host}:{port}: {e}")
+            return 0
+
+        payload = data[offset:]
+        if throttle is not None:
+            await throttle.consume(len(payload))
+        self._remember(address)
+        await _send_to(sock, payload, address)
+        return len(payload)
+
+    async def _reply(
+        self,
+        buffer: memoryview,
+        size: int,
+        address: Address,
+        throttle: Optional[Throttle],
+    ) -> int:
+        """Sends a destination's datagram (at HEADER_ROOM in buffer) to the client"""
+        header = self._peers.get(address)
+        if header is None or self.client_address is None:
+            return 0
+
+        start = HEADER_ROOM - len(header)
+        buffer[start:HEADER_ROOM] = header
+        if throttle is not None:
+            await throttle.consume(size)
+        await _send_to(self._socket, buffer[start : HEADER_ROOM + size], self.client_address)
+        return size
+
+    def _lookup(self, host: str) -> Optional[str]:
+        """The address of host if it's known, otherwise starts resolving it"""
+        if is_ip_address(host):
+            return host
+
+        result = self.resolver.cached(host)
+        if result is not None and result.addresses:
+            return result.addresses[0]
+
+        # a slow name mustn't hold up the datagrams to the others
+        if host not in self._resolving and len(self._resolving) < MAX_PEERS:
+            self._resolving.add(host)
+            self._task_group.start_soon(self._resolve, host)
+        return None
+
+    async def _resolve(self, host: str):
+        try:
+            await self.resolver.resolve(host)
+        except OSError as e:
+            logger.debug(f"Couldn't resolve {host}: {e}")
+        finally:
+            self._resolving.discard(host)
+
+    def _remember(self, address: Address):
+        if address not in self._peers:
+            _bounded_set(self._peers, address, build_udp_header(*address))
+
+    def _socket_for(
+        self,
+        family: socket.AddressFamily,
+        traffic: Optional[TrafficCounter],
+        throttle: Optional[Throttle],
+    ) -> socket.socket:
+        """Destinations of the other address family are served by a socket of their own"""
+        sock = self._sockets.get(family)
+        if sock is None:
+            host = '::' if family == socket.AF_INET6 else '0.0.0.0'
+            sock = self._sockets[family] = _create_socket(family, host)
+            self._task_group.start_soon(self._receive, sock, traffic, throttle)
+        return sock
+
+
+def _bounded_set(mapping: dict, key, value):
+    if len(mapping) >= MAX_PEERS:
+        # the oldest entry goes first
+        del mapping[next(iter(mapping))]
+    mapping[key] = value
+
+
+async def _send_to(sock: socket.socket, data: memoryview, address: Address):
+    while True:
+        try:
+            sock.sendto(data, address)
+            return
+        except BlockingIOError:
+            await wait_writable(sock)
+        except OSError as e:
+            logger.debug(f"Couldn't send datagram to {address}: {e}")
+            return